@@ -6,17 +6,42 @@ import textwrap
 import re
 from datetime import datetime
 
+from action.histogram import LatencyHistogram
+from mcp_servers import tracing
+
 # Tool performance logging
 tool_stats = {}
+LATENCY_STAGES = ("latency", "queue_wait", "server", "parse")  # total call time and its breakdown
 
-def log_tool_call(tool_name, success):
+def log_tool_call(tool_name, success, duration=None, timings=None):
     if tool_name not in tool_stats:
-        tool_stats[tool_name] = {"calls": 0, "success": 0, "fail": 0}
-    tool_stats[tool_name]["calls"] += 1
+        tool_stats[tool_name] = {"calls": 0, "success": 0, "fail": 0, "bytes": 0,
+                                 **{stage: LatencyHistogram() for stage in LATENCY_STAGES}}
+    stats = tool_stats[tool_name]
+    stats["calls"] += 1
     if success:
-        tool_stats[tool_name]["success"] += 1
+        stats["success"] += 1
     else:
-        tool_stats[tool_name]["fail"] += 1
+        stats["fail"] += 1
+
+    if duration is not None:
+        stats["latency"].record(duration)
+    for stage in LATENCY_STAGES[1:]:
+        if timings and stage in timings:
+            stats[stage].record(timings[stage])
+    if timings:
+        stats["bytes"] += timings.get("bytes", 0)
+
+def log_fused_call(tool_names, success, duration=None, timings=None):
+    """
+    Attribute one fused math call (see MathCallFuser) to the tools the plan wrote.
+    Each tool is counted as a call and gets an equal share of the latency, so
+    per-tool totals still add up to the time actually spent.
+    """
+    share = 1 / len(tool_names)
+    scaled = {key: value * share for key, value in timings.items()} if timings else timings
+    for tool_name in tool_names:
+        log_tool_call(tool_name, success, duration * share if duration is not None else None, scaled)
 
 # Utility function for extracting data from document chunks
 def extract_data_from_chunk(text, data_type="price"):
@@ -101,6 +126,151 @@ class AwaitTransformer(ast.NodeTransformer):
             return ast.Await(value=node)
         return node
 
+# ───────────────────────────────────────────────────────────────
+# AST TRANSFORMER: fuse math tool calls into one batched MCP call
+# ───────────────────────────────────────────────────────────────
+FUSABLE_MATH_TOOLS = {
+    "add", "subtract", "multiply", "divide", "power", "remainder", "mine",
+    "factorial", "cbrt", "sin", "cos", "tan",
+}
+BATCH_MATH_TOOLS = ("evaluate_batch", "eval_expression_dag")
+
+
+def fusable_tools(multi_mcp) -> set:
+    """
+    Tool names MathCallFuser may use: the batch tools, plus math tools only where
+    the batch tools' server is the one that serves them. A name routed to another
+    server (e.g. `add` on the mixed server) keeps that server's semantics.
+    """
+    servers = {name: entry["config"].get("id") for name, entry in multi_mcp.tool_map.items()}
+    batch_servers = {servers[name] for name in BATCH_MATH_TOOLS if name in servers}
+    return {name for name, server in servers.items() if server in batch_servers}
+
+class MathCallFuser(ast.NodeTransformer):
+    """
+    Rewrite math tool chains so they cost one round trip instead of one per operation:
+      add(multiply(2, 3), x)            → eval_expression_dag({"op": "add", "args": [{"op": "multiply", ...}, x]})
+      a = multiply(2, 3); b = add(a, 4) → a, b = evaluate_batch([{...}, {"op": "add", "args": ["$0", 4]}])
+    Only applied when the math server exposes the batch tools, and only to the
+    math tools it serves (see `fusable_tools`). Fused calls carry
+    `fused_from=(...)`, the tools they replace, so stats and traces name those.
+    """
+    def __init__(self, available_tools):
+        self.math_tools = FUSABLE_MATH_TOOLS & set(available_tools)
+        self.has_dag = "eval_expression_dag" in available_tools
+        self.has_batch = "evaluate_batch" in available_tools
+
+    def _is_math_call(self, node):
+        return (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in self.math_tools
+            and not node.keywords
+            and not any(isinstance(arg, ast.Starred) for arg in node.args)
+        )
+
+    @staticmethod
+    def _fused_call(tool_name, arg, tool_names):
+        return ast.Call(
+            func=ast.Name(id=tool_name, ctx=ast.Load()),
+            args=[arg],
+            keywords=[ast.keyword(arg="fused_from", value=ast.Tuple(
+                elts=[ast.Constant(name) for name in tool_names], ctx=ast.Load()
+            ))],
+        )
+
+    def _math_tools_in(self, node):
+        """Math tool names in `node`, innermost first (the order they are evaluated)."""
+        names = []
+        if self._is_math_call(node):
+            for arg in node.args:
+                names.extend(self._math_tools_in(arg))
+            names.append(node.func.id)
+        return names
+
+    @staticmethod
+    def _op_node(name, args):
+        return ast.Dict(
+            keys=[ast.Constant("op"), ast.Constant("args")],
+            values=[ast.Constant(name), ast.List(elts=args, ctx=ast.Load())],
+        )
+
+    def _to_expression(self, node):
+        if self._is_math_call(node):
+            return self._op_node(node.func.id, [self._to_expression(arg) for arg in node.args])
+        return self.visit(node)
+
+    def visit_Call(self, node):
+        if self.has_dag and self._is_math_call(node) and any(self._is_math_call(arg) for arg in node.args):
+            fused = self._fused_call("eval_expression_dag", self._to_expression(node), self._math_tools_in(node))
+            return ast.copy_location(fused, node)
+        self.generic_visit(node)
+        return node
+
+    def generic_visit(self, node):
+        node = super().generic_visit(node)
+        if self.has_batch:
+            for field in ("body", "orelse", "finalbody"):
+                stmts = getattr(node, field, None)
+                if isinstance(stmts, list) and stmts and isinstance(stmts[0], ast.stmt):
+                    setattr(node, field, self._fuse_assignments(stmts))
+        return node
+
+    def _fuse_assignments(self, stmts):
+        """Collapse runs of consecutive `name = math_tool(...)` statements into one evaluate_batch call."""
+        fused, run, run_stmts, slots = [], [], [], {}
+
+        def flush():
+            if len(run) > 1:
+                targets = [ast.Name(id=name, ctx=ast.Store()) for name, _ in run]
+                call = self._fused_call(
+                    "evaluate_batch",
+                    ast.List(elts=[op for _, op in run], ctx=ast.Load()),
+                    [stmt.value.func.id for stmt in run_stmts],
+                )
+                fused.append(ast.copy_location(
+                    ast.Assign(targets=[ast.Tuple(elts=targets, ctx=ast.Store())], value=call), run[0][1]
+                ))
+            elif run:
+                fused.append(run_stmts[0])
+            run.clear()
+            run_stmts.clear()
+            slots.clear()
+
+        for stmt in stmts:
+            op = self._batch_op(stmt, slots)
+            if op is None:
+                flush()
+                op = self._batch_op(stmt, slots)
+            if op is None:
+                fused.append(stmt)
+                continue
+            name = stmt.targets[0].id
+            slots[name] = len(run)
+            run.append((name, ast.copy_location(op, stmt)))
+            run_stmts.append(stmt)
+        flush()
+        return fused
+
+    def _batch_op(self, stmt, slots):
+        """The evaluate_batch op for `stmt`, or None if it cannot join the current run."""
+        if not (
+            isinstance(stmt, ast.Assign)
+            and len(stmt.targets) == 1
+            and isinstance(stmt.targets[0], ast.Name)
+            and self._is_math_call(stmt.value)
+        ):
+            return None
+        args = []
+        for arg in stmt.value.args:
+            if isinstance(arg, ast.Name) and arg.id in slots:
+                args.append(ast.Constant(f"${slots[arg.id]}"))
+            elif any(isinstance(n, ast.Name) and n.id in slots for n in ast.walk(arg)):
+                return None  # depends on a run result inside a larger expression
+            else:
+                args.append(arg)
+        return self._op_node(stmt.value.func.id, args)
+
 # ───────────────────────────────────────────────────────────────
 # UTILITY FUNCTIONS
 # ───────────────────────────────────────────────────────────────
@@ -108,6 +278,16 @@ def count_function_calls(code: str) -> int:
     tree = ast.parse(code)
     return sum(isinstance(node, ast.Call) for node in ast.walk(tree))
 
+def planned_servers(tree: ast.AST, multi_mcp) -> list:
+    """Server ids of the tools a plan calls, directly or by name (`parallel(("add", 1, 2))`)."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            names.add(node.func.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            names.add(node.value)
+    return sorted({multi_mcp.tool_map[name]["config"].get("id") for name in names & set(multi_mcp.tool_map)})
+
 def build_safe_globals(mcp_funcs: dict, multi_mcp=None) -> dict:
     safe_globals = {
         "__builtins__": {
@@ -124,6 +304,8 @@ def build_safe_globals(mcp_funcs: dict, multi_mcp=None) -> dict:
     safe_globals["final_answer"] = lambda x: safe_globals.setdefault("result_holder", x)
 
     # Optional: add parallel execution
+    # Calls are multiplexed as concurrent requests over each server's shared session;
+    # the per-server concurrency limit in MultiMCP provides backpressure.
     if multi_mcp:
         async def parallel(*tool_calls):
             coros = [
@@ -140,6 +322,7 @@ def build_safe_globals(mcp_funcs: dict, multi_mcp=None) -> dict:
 # ───────────────────────────────────────────────────────────────
 # MAIN EXECUTOR
 # ───────────────────────────────────────────────────────────────
+@tracing.traced("run_user_code")
 async def run_user_code(code: str, multi_mcp) -> dict:
     start_time = time.perf_counter()
     start_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -162,38 +345,42 @@ async def run_user_code(code: str, multi_mcp) -> dict:
         sandbox = build_safe_globals(tool_funcs, multi_mcp)
         local_vars = {}
 
-        cleaned_code = textwrap.dedent(code.strip())
-        tree = ast.parse(cleaned_code)
+        with tracing.span("sandbox.compile"):
+            cleaned_code = textwrap.dedent(code.strip())
+            tree = ast.parse(cleaned_code)
 
-        has_return = any(isinstance(node, ast.Return) for node in tree.body)
-        has_result = any(
-            isinstance(node, ast.Assign) and any(
-                isinstance(t, ast.Name) and t.id == "result" for t in node.targets
+            has_return = any(isinstance(node, ast.Return) for node in tree.body)
+            has_result = any(
+                isinstance(node, ast.Assign) and any(
+                    isinstance(t, ast.Name) and t.id == "result" for t in node.targets
+                )
+                for node in tree.body
             )
-            for node in tree.body
-        )
-        if not has_return and has_result:
-            tree.body.append(ast.Return(value=ast.Name(id="result", ctx=ast.Load())))
-
-        tree = KeywordStripper().visit(tree) # strip "key" = "value" cases to only "value"
-        tree = AwaitTransformer(set(tool_funcs)).visit(tree)
-        ast.fix_missing_locations(tree)
-
-        func_def = ast.AsyncFunctionDef(
-            name="__main",
-            args=ast.arguments(posonlyargs=[], args=[], kwonlyargs=[], kw_defaults=[], defaults=[]),
-            body=tree.body,
-            decorator_list=[]
-        )
-        wrapper = ast.Module(body=[func_def], type_ignores=[])
-        ast.fix_missing_locations(wrapper)
+            if not has_return and has_result:
+                tree.body.append(ast.Return(value=ast.Name(id="result", ctx=ast.Load())))
+
+            tree = KeywordStripper().visit(tree) # strip "key" = "value" cases to only "value"
+            tree = MathCallFuser(fusable_tools(multi_mcp)).visit(tree)  # batch math chains into one MCP call
+            multi_mcp.warm_up(planned_servers(tree, multi_mcp))  # lazy servers start together, not one per first call
+            tree = AwaitTransformer(set(tool_funcs)).visit(tree)
+            ast.fix_missing_locations(tree)
+
+            func_def = ast.AsyncFunctionDef(
+                name="__main",
+                args=ast.arguments(posonlyargs=[], args=[], kwonlyargs=[], kw_defaults=[], defaults=[]),
+                body=tree.body,
+                decorator_list=[]
+            )
+            wrapper = ast.Module(body=[func_def], type_ignores=[])
+            ast.fix_missing_locations(wrapper)
 
-        compiled = compile(wrapper, filename="<user_code>", mode="exec")
-        exec(compiled, sandbox, local_vars)
+            compiled = compile(wrapper, filename="<user_code>", mode="exec")
+            exec(compiled, sandbox, local_vars)
 
         try:
             timeout = max(3, func_count * TIMEOUT_PER_FUNCTION)  # minimum 3s even for plain returns
-            returned = await asyncio.wait_for(local_vars["__main"](), timeout=timeout)
+            with tracing.span("sandbox.execute", functions=func_count):
+                returned = await asyncio.wait_for(local_vars["__main"](), timeout=timeout)
 
             result_value = returned if returned is not None else sandbox.get("result_holder", "None")
 
@@ -251,13 +438,27 @@ async def run_user_code(code: str, multi_mcp) -> dict:
 # TOOL WRAPPER
 # ───────────────────────────────────────────────────────────────
 def make_tool_proxy(tool_name: str, mcp):
-    async def _tool_fn(*args):
+    async def _tool_fn(*args, fused_from=()):
+        timings = {}  # filled by function_wrapper: queue_wait / server / parse seconds, bytes
+        start = time.perf_counter()
+
+        def log(success):
+            duration = time.perf_counter() - start
+            if fused_from:
+                log_fused_call(fused_from, success, duration, timings)
+            else:
+                log_tool_call(tool_name, success=success, duration=duration, timings=timings)
+
         try:
-            result = await mcp.function_wrapper(tool_name, *args)
-            log_tool_call(tool_name, success=True)
+            if fused_from:
+                with tracing.span("tool.fused", tool=tool_name, fused_from=list(fused_from)):
+                    result = await mcp.function_wrapper(tool_name, *args, timings=timings)
+            else:
+                result = await mcp.function_wrapper(tool_name, *args, timings=timings)
+            log(True)
             return result
         except Exception as e:
-            log_tool_call(tool_name, success=False)
+            log(False)
             raise  # re-raise so the rest of your error handling works as before
     return _tool_fn
 
@@ -0,0 +1,130 @@
+import ast
+import asyncio
+import math
+import sys
+from pathlib import Path
+
+import pytest
+
+from action.executor import MathCallFuser, fusable_tools, run_user_code, tool_stats
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "mcp_servers"))  # servers import their siblings directly
+import mcp_server_1  # noqa: E402
+from models import EvaluateBatchInput, ExpressionDagInput  # noqa: E402
+
+MATH = ["add", "subtract", "multiply", "power", "factorial", "divide", "cbrt"]
+BATCH_TOOLS = ("evaluate_batch", "eval_expression_dag")
+
+
+class FakeMCP:
+    """The slice of MultiMCP that run_user_code uses; tools run on the real math server functions."""
+
+    def __init__(self, tools, servers=None):
+        servers = servers or {}
+        self.tool_map = {name: {"config": {"id": servers.get(name, "math")}} for name in tools}
+        self.calls = []
+        self.warmed = []
+
+    def warm_up(self, server_ids):
+        self.warmed.append(server_ids)
+
+    def get_all_tools(self):
+        return [type("Tool", (), {"name": name}) for name in self.tool_map]
+
+    async def function_wrapper(self, tool_name, *args, timings=None):
+        self.calls.append(tool_name)
+        if tool_name == "eval_expression_dag":
+            return mcp_server_1.eval_expression_dag(ExpressionDagInput(expression=args[0])).result
+        if tool_name == "evaluate_batch":
+            return mcp_server_1.evaluate_batch(EvaluateBatchInput(operations=args[0])).results
+        tool = getattr(mcp_server_1, tool_name)
+        model = tool.__annotations__["input"]
+        return tool(model(**dict(zip(model.model_fields, args)))).result
+
+
+def run(code, tools, servers=None, mcp=None):
+    tool_stats.clear()
+    mcp = mcp or FakeMCP(tools, servers)
+    return asyncio.run(run_user_code(code, mcp)), mcp.calls
+
+
+def fuse(code, tools):
+    return ast.unparse(MathCallFuser(tools).visit(ast.parse(code)))
+
+
+def test_nested_chain_becomes_one_dag_call():
+    code = "result = add(multiply(2, 3), power(2, 4))"
+    assert "eval_expression_dag" in fuse(code, set(MATH) | set(BATCH_TOOLS))
+
+    fused, calls = run(code, [*MATH, *BATCH_TOOLS])
+    plain, plain_calls = run(code, list(MATH))
+    assert fused["result"] == plain["result"] == "22"
+    assert calls == ["eval_expression_dag"]
+    assert plain_calls == ["multiply", "power", "add"]
+
+
+def test_assignment_run_becomes_one_batch_call():
+    code = "a = multiply(2, 3)\nb = add(a, 4)\nc = subtract(b, a)\nresult = factorial(c)"
+    fused, calls = run(code, [*MATH, *BATCH_TOOLS])
+    plain, _ = run(code, list(MATH))
+    assert fused["result"] == plain["result"] == str(math.factorial(4))
+    assert calls == ["evaluate_batch"]
+
+
+def test_no_fusion_without_batch_tools():
+    code = "a = multiply(2, 3)\nresult = add(multiply(a, 2), 1)"
+    assert fuse(code, set(MATH)) == code
+    # Only the DAG tool: nested calls fuse, the assignment run does not
+    dag_only = fuse(code, set(MATH) | {"eval_expression_dag"})
+    assert "evaluate_batch" not in dag_only and "eval_expression_dag" in dag_only
+
+
+def test_dependency_inside_larger_expression_ends_the_batch():
+    code = "a = multiply(2, 3)\nb = add(a + 1, 4)"
+    fused = fuse(code, set(MATH) | set(BATCH_TOOLS))
+    assert "evaluate_batch" not in fused
+    result, _ = run(code + "\nresult = b", [*MATH, *BATCH_TOOLS])
+    assert result["result"] == "11"
+
+
+def test_fused_calls_are_counted_under_the_written_tools():
+    result, calls = run("result = add(multiply(2, 3), multiply(4, 5))", [*MATH, *BATCH_TOOLS])
+    assert result["status"] == "success" and calls == ["eval_expression_dag"]
+    assert set(tool_stats) == {"add", "multiply"}
+    assert tool_stats["multiply"]["calls"] == 2 and tool_stats["add"]["calls"] == 1
+    # The one round trip is split between the three operations, not counted three times
+    share = tool_stats["add"]["latency"].total
+    assert tool_stats["multiply"]["latency"].total == pytest.approx(2 * share)
+
+
+@pytest.mark.parametrize("code", [
+    "a = cbrt(27)\nb = divide(7, 2)\nc = factorial(5)\nresult = (a, b, c)",
+    "result = add(divide(6, 3), 1)",        # 2.0 is accepted where an int is expected, as by add itself
+    "result = add(divide(1, 0), 1)",        # division by zero is an error, not inf
+    "result = add(multiply(2.5, 2), 1)",    # floats are rejected by the int-only tools
+    "result = power(2, subtract(1, 3))",    # 0.25 is not a valid power result
+])
+def test_fused_calls_behave_like_the_tools_they_replace(code):
+    fused, calls = run(code, [*MATH, *BATCH_TOOLS])
+    plain, plain_calls = run(code, list(MATH))
+    assert calls[0] in BATCH_TOOLS and set(plain_calls) <= set(MATH)
+    assert fused["status"] == plain["status"]
+    if plain["status"] == "success":
+        assert fused["result"] == plain["result"]
+
+
+def test_only_tools_served_by_the_math_server_are_fused():
+    servers = {"add": "mixed", "multiply": "mixed"}  # later servers win duplicate names in MultiMCP.tool_map
+    assert fusable_tools(FakeMCP([*MATH, *BATCH_TOOLS], servers)) == {"subtract", "power", "factorial", "divide",
+                                                                     "cbrt", *BATCH_TOOLS}
+    _, calls = run("result = add(multiply(2, 3), power(2, 4))", [*MATH, *BATCH_TOOLS], servers)
+    assert calls == ["multiply", "power", "add"]
+    _, calls = run("result = subtract(power(2, 3), factorial(3))", [*MATH, *BATCH_TOOLS], servers)
+    assert calls == ["eval_expression_dag"]
+
+
+def test_servers_a_plan_calls_are_warmed_up_before_it_runs():
+    servers = {"add": "mixed", "search": "websearch", "fetch": "documents"}
+    mcp = FakeMCP([*MATH, *BATCH_TOOLS, "search", "fetch"], servers)
+    run("a = add(1, 2)\nresult = parallel((\"search\", \"x\"))", None, mcp=mcp)
+    assert mcp.warmed == [["mixed", "websearch"]]  # not documents: the plan never calls fetch
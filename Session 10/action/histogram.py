@@ -0,0 +1,82 @@
+import math
+from typing import Dict, Iterable, Optional
+
+# Relative width of a bucket: values within ~1% of each other share a bucket
+BUCKET_GROWTH = 1.01
+MIN_TRACKABLE = 1e-6  # seconds; anything faster lands in the first bucket
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations in seconds.
+
+    Buckets grow logarithmically, so every recorded value is kept to ~1% relative
+    precision from microseconds to minutes in a few hundred sparse buckets, and
+    percentiles cost one pass over the occupied buckets. Count, sum, min and max
+    are tracked exactly.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    @staticmethod
+    def _bucket(value: float) -> int:
+        return int(math.log(max(value, MIN_TRACKABLE) / MIN_TRACKABLE, BUCKET_GROWTH))
+
+    @staticmethod
+    def _bucket_value(index: int) -> float:
+        # Upper edge of the bucket, so reported percentiles never understate latency
+        return MIN_TRACKABLE * BUCKET_GROWTH ** (index + 1)
+
+    def record(self, value: float) -> None:
+        index = self._bucket(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, histograms: Iterable["LatencyHistogram"]) -> "LatencyHistogram":
+        result = cls()
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(self._bucket_value(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary_ms(self) -> Dict[str, float]:
+        return {
+            "p50": 1000 * self.percentile(50),
+            "p95": 1000 * self.percentile(95),
+            "p99": 1000 * self.percentile(99),
+            "mean": 1000 * self.mean,
+            "max": 1000 * (self.max or 0.0),
+        }
@@ -0,0 +1,86 @@
+import math
+import random
+
+import pytest
+
+from action.histogram import BUCKET_GROWTH, MIN_TRACKABLE, LatencyHistogram
+
+
+def exact_percentile(values, p):
+    """Nearest-rank percentile, the definition LatencyHistogram approximates."""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(len(ordered) * p / 100)) - 1]
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+    assert histogram.mean == 0.0
+    assert histogram.summary_ms() == {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+
+
+@pytest.mark.parametrize("p", [1, 50, 90, 95, 99, 99.9, 100])
+def test_percentiles_within_one_bucket_of_exact(p):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(-4, 1.5) for _ in range(5000)]  # ~1ms to seconds, long tail
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    exact = exact_percentile(values, p)
+    estimate = histogram.percentile(p)
+    # Reported as the bucket's upper edge (capped at max): never below the exact value, at most ~1% above
+    assert exact <= estimate <= exact * BUCKET_GROWTH ** 2
+
+
+def test_count_sum_min_max_are_exact():
+    histogram = LatencyHistogram()
+    for value in (0.25, 0.001, 3.0, 0.5):
+        histogram.record(value)
+    assert histogram.count == 4
+    assert histogram.total == pytest.approx(3.751)
+    assert histogram.mean == pytest.approx(3.751 / 4)
+    assert (histogram.min, histogram.max) == (0.001, 3.0)
+    assert histogram.percentile(100) == 3.0
+    assert histogram.summary_ms()["max"] == pytest.approx(3000)
+
+
+def test_single_value_reports_itself():
+    histogram = LatencyHistogram()
+    histogram.record(0.123)
+    for p in (0, 50, 99):
+        assert histogram.percentile(p) == 0.123  # capped at max, not the bucket edge
+
+
+def test_values_below_the_trackable_floor():
+    histogram = LatencyHistogram()
+    histogram.record(0.0)
+    histogram.record(MIN_TRACKABLE / 10)
+    assert histogram.percentile(50) <= MIN_TRACKABLE * BUCKET_GROWTH
+
+
+def test_merge_matches_recording_everything_in_one():
+    rng = random.Random(3)
+    parts = [[rng.uniform(0.001, 0.5) for _ in range(300)] for _ in range(3)]
+    combined = LatencyHistogram()
+    histograms = []
+    for part in parts:
+        histogram = LatencyHistogram()
+        for value in part:
+            histogram.record(value)
+            combined.record(value)
+        histograms.append(histogram)
+
+    merged = LatencyHistogram.merged(histograms)
+    assert merged.buckets == combined.buckets
+    assert (merged.count, merged.min, merged.max) == (combined.count, combined.min, combined.max)
+    assert merged.total == pytest.approx(combined.total)
+    for p in (50, 95, 99):
+        assert merged.percentile(p) == combined.percentile(p)
+
+
+def test_merging_an_empty_histogram_changes_nothing():
+    histogram = LatencyHistogram()
+    histogram.record(0.2)
+    histogram.merge(LatencyHistogram())
+    assert (histogram.count, histogram.min, histogram.max) == (1, 0.2, 0.2)
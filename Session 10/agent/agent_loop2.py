@@ -1,5 +1,6 @@
 import uuid
 import json
+import asyncio
 import datetime
 from typing import Optional, Union, Literal
 
@@ -11,21 +12,25 @@ from agent.hitl_request import HITLRequest
 from memory.session_log import live_update_session
 from memory.memory_search import MemorySearch
 from mcp_servers.multiMCP import MultiMCP
+from mcp_servers import tracing
 
 
 GLOBAL_PREVIOUS_FAILURE_STEPS = 3
 MAX_REPLAN_ATTEMPTS = 2
 
 class AgentLoop:
-    def __init__(self, perception_prompt_path: str, decision_prompt_path: str, multi_mcp: MultiMCP, strategy: str = "exploratory"):
-        self.perception = Perception(perception_prompt_path)
-        self.decision = Decision(decision_prompt_path, multi_mcp)
+    def __init__(self, perception_prompt_path: str, decision_prompt_path: str, multi_mcp: MultiMCP, strategy: str = "exploratory",
+                 perception: Optional[Perception] = None, decision: Optional[Decision] = None):
+        # Perception/Decision may be shared between loops (see AgentService); all per-query state lives below
+        self.perception = perception or Perception(perception_prompt_path)
+        self.decision = decision or Decision(decision_prompt_path, multi_mcp)
         self.multi_mcp = multi_mcp
         self.strategy = strategy
         self.current_session: Optional[AgentSession] = None
         self.replanning_attempts = 0
         self.current_steps = 0
 
+    @tracing.traced("AgentLoop.run")
     async def run(self, query: str, hitl_input_data: Optional[str] = None, hitl_input_type: Optional[Literal["tool_failure", "plan_failure"]] = None) -> Union[AgentSession, HITLRequest]:
         self.replanning_attempts = 0
         self.current_steps = 0
@@ -35,6 +40,7 @@ class AgentLoop:
 
         if hitl_input_data and self.current_session and self.current_session.original_query == query:
             session = self.current_session
+            tracing.annotate(session_id=session.session_id, query=query, resumed=True)
             print(f"\n🔄 Resuming session {session.session_id} for query '{query}' with human input for {session.hitl_type_pending}.")
 
             if session.hitl_type_pending == "tool_failure":
@@ -58,7 +64,7 @@ class AgentLoop:
                         current_plan=session.plan_versions[-1]["plan_text"],
                         snapshot_type="step_result_human_provided"
                     )
-                    perception_result_after_hitl = self.perception.run(perception_input_for_hitl)
+                    perception_result_after_hitl = await self.perception.run_async(perception_input_for_hitl)
                     failed_step_obj.perception = PerceptionSnapshot(**perception_result_after_hitl)
                     live_update_session(session)
                     
@@ -66,7 +72,7 @@ class AgentLoop:
                     session.last_failed_step_index = None
                     session.hitl_prompt = None
 
-                    step_to_process_next = self.evaluate_step(failed_step_obj, session, query)
+                    step_to_process_next = await self.evaluate_step(failed_step_obj, session, query)
                 else:
                     print(f"⚠️ Error: Could not find failed step (index: {session.last_failed_step_index}) to inject human tool input. Re-planning.")
                     session.hitl_type_pending = None
@@ -77,7 +83,7 @@ class AgentLoop:
                         "current_plan": session.plan_versions[-1]["plan_text"] if session.plan_versions else [],
                         "completed_steps": [s.to_dict() for pv in session.plan_versions for s in pv["steps"] if s.status in ["completed", "completed_by_human"]],
                     }
-                    decision_output = self.decision.run(decision_input_fallback)
+                    decision_output = await self.decision.run_async(decision_input_fallback)
                     step_to_process_next = session.add_plan_version(decision_output["plan_text"], [self.create_step(decision_output)])
 
             elif session.hitl_type_pending == "plan_failure":
@@ -94,7 +100,7 @@ class AgentLoop:
                     "current_plan": session.plan_versions[-1]["plan_text"] if session.plan_versions else [],
                     "completed_steps": [s.to_dict() for pv in session.plan_versions for s in pv["steps"] if s.status in ["completed", "completed_by_human"]],
                 }
-                decision_output = self.decision.run(decision_input_human_guided)
+                decision_output = await self.decision.run_async(decision_input_human_guided)
                 step_to_process_next = session.add_plan_version(decision_output["plan_text"], [self.create_step(decision_output)])
                 
                 session.hitl_type_pending = None
@@ -114,16 +120,17 @@ class AgentLoop:
             _session_id = str(uuid.uuid4())
             session = AgentSession(session_id=_session_id, original_query=query)
             self.current_session = session
+            tracing.annotate(session_id=session.session_id, query=query)
             self.log_session_start(session, query)
 
-            historical_memory_results = self.search_memory(query)
+            historical_memory_results = await asyncio.to_thread(self.search_memory, query)  # file scan off the event loop
             
             perception_input_initial = self.perception.build_perception_input(
                 raw_input=query, 
                 memory=historical_memory_results,
                 snapshot_type="user_query"
             )
-            perception_result = self.perception.run(perception_input_initial)
+            perception_result = await self.perception.run_async(perception_input_initial)
             session.add_perception(PerceptionSnapshot(**perception_result))
 
             if perception_result.get("original_goal_achieved"):
@@ -131,7 +138,7 @@ class AgentLoop:
                 self.current_session = None
                 return session
 
-            decision_output = self.make_initial_decision(query, perception_result)
+            decision_output = await self.make_initial_decision(query, perception_result)
             step_to_process_next = session.add_plan_version(decision_output["plan_text"], [self.create_step(decision_output)])
             live_update_session(session)
             print(f"\n[Decision Plan Text: V{len(session.plan_versions)}]:")
@@ -173,7 +180,7 @@ class AgentLoop:
                     self.current_session = None
                     return final_session_state
 
-            active_step = self.evaluate_step(executed_step_obj, session, query) 
+            active_step = await self.evaluate_step(executed_step_obj, session, query) 
 
             if session.hitl_type_pending:
                 current_session_step_failures_memory.clear()
@@ -215,7 +222,7 @@ class AgentLoop:
         #         print(f"[{i}] File: {res['file']}\nQuery: {res['query']}\nResult Requirement: {res['result_requirement']}\nSummary: {res['solution_summary']}\n")
         return results
 
-    def run_perception(self, query, memory_results, session_step_failures_memory=None, snapshot_type="user_query", current_plan=None):
+    async def run_perception(self, query, memory_results, session_step_failures_memory=None, snapshot_type="user_query", current_plan=None):
         combined_memory = (memory_results or []) + (session_step_failures_memory or [])
         perception_input = self.perception.build_perception_input(
             raw_input=query, 
@@ -223,7 +230,7 @@ class AgentLoop:
             current_plan=current_plan, 
             snapshot_type=snapshot_type
         )
-        perception_result = self.perception.run(perception_input)
+        perception_result = await self.perception.run_async(perception_input)
         print("\n[Perception Result]:")
         print(json.dumps(perception_result, indent=2, ensure_ascii=False))
         return perception_result
@@ -239,14 +246,14 @@ class AgentLoop:
         })
         live_update_session(session)
 
-    def make_initial_decision(self, query, perception_result):
+    async def make_initial_decision(self, query, perception_result):
         decision_input = {
             "plan_mode": "initial",
             "planning_strategy": self.strategy,
             "original_query": query,
             "perception": perception_result
         }
-        decision_output = self.decision.run(decision_input)
+        decision_output = await self.decision.run_async(decision_input)
         return decision_output
 
     def create_step(self, decision_output):
@@ -312,7 +319,7 @@ class AgentLoop:
                 current_plan=session.plan_versions[-1]["plan_text"],
                 snapshot_type="step_result"
             )
-            perception_result = self.perception.run(perception_input_step)
+            perception_result = await self.perception.run_async(perception_input_step)
             step.perception = PerceptionSnapshot(**perception_result)
             live_update_session(session)
             return step
@@ -328,7 +335,7 @@ class AgentLoop:
                 current_plan=session.plan_versions[-1]["plan_text"],
                 snapshot_type="step_result"
             )
-            perception_result = self.perception.run(perception_input_conclude)
+            perception_result = await self.perception.run_async(perception_input_conclude)
             step.perception = PerceptionSnapshot(**perception_result)
             
             session.mark_complete(step.perception, final_answer=step.conclusion)
@@ -351,7 +358,7 @@ class AgentLoop:
 
         return step
 
-    def evaluate_step(self, step: Step, session: AgentSession, query: str) -> Optional[Step]:
+    async def evaluate_step(self, step: Step, session: AgentSession, query: str) -> Optional[Step]:
         if not step.perception:
             print(f"⚠️ Warning: Step {step.index} ('{step.description}') has no perception data. Assuming step was unhelpful.")
             step.perception = PerceptionSnapshot(entities=[], result_requirement="N/A", original_goal_achieved=False, 
@@ -389,7 +396,7 @@ class AgentLoop:
                     "current_step": step.to_dict(),
                     "perception": step.perception.__dict__
                 }
-                decision_output = self.decision.run(decision_input_continue)
+                decision_output = await self.decision.run_async(decision_input_continue)
                 next_step_obj = session.add_plan_version(decision_output["plan_text"], [self.create_step(decision_output)])
                 print(f"\n[Decision Plan Text (Continuation): V{len(session.plan_versions)}]:")
                 for line in session.plan_versions[-1]["plan_text"]:
@@ -424,7 +431,7 @@ class AgentLoop:
                 "current_step": step.to_dict(),
                 "perception": step.perception.__dict__
             }
-            decision_output = self.decision.run(decision_input_replan)
+            decision_output = await self.decision.run_async(decision_input_replan)
             next_step_obj = session.add_plan_version(decision_output["plan_text"], [self.create_step(decision_output)])
             print(f"\n[Decision Plan Text (Replanned): V{len(session.plan_versions)}]:")
             for line in session.plan_versions[-1]["plan_text"]:
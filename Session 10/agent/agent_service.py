@@ -0,0 +1,136 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from perception.perception import Perception
+from decision.decision import Decision
+from agent.agent_loop2 import AgentLoop
+from agent.hitl_request import HITLRequest
+from mcp_servers.multiMCP import MultiMCP
+
+MAX_CONCURRENT_SESSIONS = 4  # agent turns running at once; the rest wait in FIFO order
+
+
+@dataclass
+class _PausedSession:
+    loop: AgentLoop
+    query: str
+    hitl_type: str
+
+
+class AgentService:
+    """
+    Runs many queries concurrently in one process.
+
+    Every query gets its own AgentLoop (and so its own AgentSession, replanning
+    counters and step counters), while the Perception/Decision LLM clients, their
+    prompt caches and the MultiMCP server pools are shared. Turns — a new query or
+    a HITL resume — go through one FIFO queue served by `max_concurrent` workers,
+    so sessions are started in arrival order and a resumed session rejoins at the
+    back instead of jumping ahead of waiting queries.
+    """
+
+    def __init__(self, perception_prompt_path: str, decision_prompt_path: str, multi_mcp: MultiMCP,
+                 strategy: str = "exploratory", max_concurrent: int = MAX_CONCURRENT_SESSIONS):
+        self.multi_mcp = multi_mcp
+        self.strategy = strategy
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.perception = Perception(perception_prompt_path)
+        self.decision = Decision(decision_prompt_path, multi_mcp)
+        self.paused: Dict[str, _PausedSession] = {}
+        self.active = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    # ── Lifecycle ────────────────────────────────────────
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"agent-worker-{i}")
+            for i in range(self.max_concurrent)
+        ]
+
+    async def stop(self) -> None:
+        """Cancel running turns and every turn still queued, so no submit()/resume() caller waits forever."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        while self._queue is not None and not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            future.cancel()
+            self._queue.task_done()
+        self._queue = None
+        self.paused.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            loop, kwargs, future = await self._queue.get()
+            try:
+                if future.done():
+                    continue
+                self.active += 1
+                try:
+                    result = await loop.run(**kwargs)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                except BaseException:
+                    # Worker cancelled (stop()) or interpreter exiting: the caller must not wait forever
+                    future.cancel()
+                    raise
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    self.active -= 1
+            finally:
+                self._queue.task_done()
+
+    # ── Turns ────────────────────────────────────────────
+    def _new_loop(self) -> AgentLoop:
+        return AgentLoop(
+            perception_prompt_path=self.perception.perception_prompt_path,
+            decision_prompt_path=self.decision.decision_prompt_path,
+            multi_mcp=self.multi_mcp,
+            strategy=self.strategy,
+            perception=self.perception,
+            decision=self.decision,
+        )
+
+    async def _turn(self, loop: AgentLoop, query: str, **hitl) -> Any:
+        if not self._workers:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((loop, {"query": query, **hitl}, future))
+        result = await future
+
+        if isinstance(result, HITLRequest):
+            self.paused[result.session_id] = _PausedSession(loop, query, result.type)
+        return result
+
+    async def submit(self, query: str) -> Any:
+        """Run a new query in its own session; returns an AgentSession, a HITLRequest or an error dict."""
+        return await self._turn(self._new_loop(), query)
+
+    async def resume(self, session_id: str, human_input: str) -> Any:
+        """Continue a session that stopped with a HITLRequest, using the human's input."""
+        paused = self.paused.pop(session_id, None)
+        if paused is None:
+            raise KeyError(f"No session waiting for human input with id {session_id}")
+        return await self._turn(paused.loop, paused.query,
+                                hitl_input_data=human_input, hitl_input_type=paused.hitl_type)
+
+    def abandon(self, session_id: str) -> bool:
+        """Drop a session that is waiting for human input."""
+        paused = self.paused.pop(session_id, None)
+        if paused is None:
+            return False
+        paused.loop.current_session = None
+        return True
@@ -0,0 +1,64 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")  # perception/decision create a client on import; no call is made
+
+from agent import agent_service
+from agent.agent_service import AgentService
+
+
+class FakeLoop:
+    """An AgentLoop whose run() waits until released (or fails with `error`)."""
+
+    def __init__(self, result=None, error=None):
+        self.result, self.error = result, error
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def run(self, query, **hitl):
+        self.started.set()
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result or f"done: {query}"
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(agent_service, "Perception", lambda path: SimpleNamespace(perception_prompt_path=path))
+    monkeypatch.setattr(agent_service, "Decision", lambda path, mcp: SimpleNamespace(decision_prompt_path=path))
+    return AgentService("perception.txt", "decision.txt", multi_mcp=None, max_concurrent=1)
+
+
+def test_turns_run_in_order_and_errors_reach_the_caller(service):
+    async def main():
+        first, failing = FakeLoop(), FakeLoop(error=RuntimeError("boom"))
+        turns = [asyncio.create_task(service._turn(first, "a")), asyncio.create_task(service._turn(failing, "b"))]
+        await first.started.wait()
+        assert service.active == 1 and service.queued == 1
+        first.release.set()
+        failing.release.set()
+        results = await asyncio.gather(*turns, return_exceptions=True)
+        await service.stop()
+        return results
+
+    done, error = asyncio.run(main())
+    assert done == "done: a"
+    assert isinstance(error, RuntimeError) and str(error) == "boom"
+
+
+def test_stop_cancels_running_and_queued_turns(service):
+    async def main():
+        running, queued = FakeLoop(), FakeLoop()
+        turns = [asyncio.create_task(service._turn(running, "a")), asyncio.create_task(service._turn(queued, "b"))]
+        await running.started.wait()
+        await service.stop()
+        results = await asyncio.wait_for(asyncio.gather(*turns, return_exceptions=True), timeout=1)
+        return results, queued.started.is_set()
+
+    results, queued_started = asyncio.run(main())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert not queued_started
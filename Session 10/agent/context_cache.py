@@ -0,0 +1,232 @@
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+
+from google.genai import types
+from google.genai.errors import ClientError
+
+from agent import rate_limit
+from mcp_servers import tracing
+
+CACHE_TTL_SECONDS = 3600      # lifetime of a provider-side cached prefix
+CACHE_REFRESH_MARGIN = 60     # recreate a cache this many seconds before it expires
+MIN_PREFIX_TOKENS = 4096      # Gemini rejects cached contents smaller than this (gemini-2.0-flash); checked with count_tokens
+MAX_CACHED_PREFIXES = 8       # live provider caches per PrefixCache; the least recently used is deleted beyond this
+
+
+def is_cache_error(error: Exception) -> bool:
+    """
+    True if a request failed because its cached content is gone (expired, deleted,
+    not visible to this key) — the only case where resending without it can help.
+    Quota (429) and other request errors are not, and are raised to the caller.
+    """
+    code = getattr(error, "code", None)
+    message = (getattr(error, "message", None) or str(error)).lower()
+    return code == 404 or (code in (400, 403) and "cache" in message)
+
+
+class TokenUsage:
+    """Running totals of tokens sent vs. tokens served from a cached prefix across LLM calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, response: Any) -> Dict[str, int]:
+        usage = getattr(response, "usage_metadata", None)
+        return self.record_counts(
+            getattr(usage, "prompt_token_count", None) or 0,
+            getattr(usage, "cached_content_token_count", None) or 0,
+        )
+
+    def record_counts(self, prompt_tokens: int, cached_tokens: int = 0) -> Dict[str, int]:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+        }
+
+
+class PrefixCache:
+    """
+    Gemini context cache for the static head of a prompt (template + tool catalog).
+
+    `generate()` / `generate_async()` send only the per-call tail against the cached
+    prefix when one is available, and the full prompt otherwise. One provider cache
+    is kept per distinct prefix (by sha256) and recreated shortly before its TTL
+    runs out; the cache it replaces, and the least recently used one beyond
+    `max_caches`, are deleted on the provider rather than left to expire.
+    Prefixes below the model's minimum cacheable size (counted in tokens) or that
+    the backend refuses to cache are remembered, so we fall back to sending the
+    full prompt without retrying the create on every call. A request whose cache
+    has vanished is resent once with a fresh cache; any other error, including
+    quota, is raised so a rate-limited call is not immediately sent again.
+    """
+
+    def __init__(self, client: Any, model: str, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 min_prefix_tokens: int = MIN_PREFIX_TOKENS, max_caches: int = MAX_CACHED_PREFIXES,
+                 enabled: bool = True):
+        self.client = client
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.min_prefix_tokens = min_prefix_tokens
+        self.max_caches = max_caches
+        self.enabled = enabled
+        self._caches: Dict[str, Tuple[str, float]] = {}  # prefix hash -> (cache name, expires_at), LRU order
+        self._refused: set = set()
+        self._sized: set = set()  # prefix hashes already counted and large enough
+        self.usage = TokenUsage()
+        self._create_lock: Optional[asyncio.Lock] = None  # one create per prefix across concurrent sessions
+
+    def _lookup(self, prefix: str) -> Tuple[Optional[str], Optional[str]]:
+        """(cache name if a live cache exists, prefix hash if one should be created)."""
+        # Every token is at least one character, so shorter prefixes cannot reach the minimum
+        if not self.enabled or len(prefix) < self.min_prefix_tokens:
+            return None, None
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        if key in self._refused:
+            return None, None
+        cached = self._caches.get(key)
+        if cached and cached[1] - CACHE_REFRESH_MARGIN > time.time():
+            self._caches[key] = self._caches.pop(key)  # most recently used last
+            return cached[0], None
+        return None, key
+
+    def _config(self, prefix: str) -> types.CreateCachedContentConfig:
+        return types.CreateCachedContentConfig(contents=[prefix], ttl=f"{self.ttl_seconds}s")
+
+    def _big_enough(self, key: str, tokens: int) -> bool:
+        if tokens < self.min_prefix_tokens:
+            self._refused.add(key)
+            print(f"ℹ️ Prompt prefix is {tokens} tokens, below the {self.min_prefix_tokens}-token caching minimum; sending full prompts")
+            return False
+        self._sized.add(key)
+        return True
+
+    def _remember(self, key: str, cache: Any) -> Tuple[str, list]:
+        """Store a new cache; returns its name and the names it supersedes (to delete)."""
+        superseded = [self._caches.pop(key)[0]] if key in self._caches else []
+        self._caches[key] = (cache.name, time.time() + self.ttl_seconds)
+        while len(self._caches) > self.max_caches:
+            oldest = next(iter(self._caches))
+            superseded.append(self._caches.pop(oldest)[0])
+        return cache.name, superseded
+
+    def _refuse(self, key: str, error: Exception) -> None:
+        self._refused.add(key)
+        print(f"ℹ️ Context caching unavailable for this prompt prefix ({type(error).__name__}: {error}); sending full prompts")
+
+    def invalidate(self, cache_name: str) -> None:
+        self._caches = {key: value for key, value in self._caches.items() if value[0] != cache_name}
+
+    def _delete(self, names: list) -> None:
+        for name in names:
+            try:
+                self.client.caches.delete(name=name)
+            except Exception as e:
+                print(f"⚠️ Could not delete superseded context cache {name}: {e}")  # expires with its TTL anyway
+
+    async def _delete_async(self, names: list) -> None:
+        for name in names:
+            try:
+                await self.client.aio.caches.delete(name=name)
+            except Exception as e:
+                print(f"⚠️ Could not delete superseded context cache {name}: {e}")
+
+    def get(self, prefix: str) -> Optional[str]:
+        name, key = self._lookup(prefix)
+        if key is None:
+            return name
+        try:
+            if key not in self._sized:
+                tokens = self.client.models.count_tokens(model=self.model, contents=prefix).total_tokens
+                if not self._big_enough(key, tokens):
+                    return None
+            name, superseded = self._remember(key, self.client.caches.create(model=self.model, config=self._config(prefix)))
+        except Exception as e:
+            self._refuse(key, e)
+            return None
+        self._delete(superseded)
+        return name
+
+    async def get_async(self, prefix: str) -> Optional[str]:
+        name, key = self._lookup(prefix)
+        if key is None:
+            return name
+        if self._create_lock is None:
+            self._create_lock = asyncio.Lock()
+        async with self._create_lock:
+            name, key = self._lookup(prefix)  # another session may have created it meanwhile
+            if key is None:
+                return name
+            try:
+                if key not in self._sized:
+                    counted = await self.client.aio.models.count_tokens(model=self.model, contents=prefix)
+                    if not self._big_enough(key, counted.total_tokens):
+                        return None
+                cache = await self.client.aio.caches.create(model=self.model, config=self._config(prefix))
+                name, superseded = self._remember(key, cache)
+            except Exception as e:
+                self._refuse(key, e)
+                return None
+        await self._delete_async(superseded)
+        return name
+
+    @staticmethod
+    def _request(prefix: str, tail: str, cache_name: Optional[str]) -> Dict[str, Any]:
+        if cache_name:
+            return {"contents": tail, "config": types.GenerateContentConfig(cached_content=cache_name)}
+        return {"contents": prefix + tail}
+
+    def generate(self, prefix: str, tail: str) -> Any:
+        cache_name = self.get(prefix)
+        try:
+            return self._send(prefix, tail, cache_name)
+        except ClientError as e:
+            if not cache_name or not is_cache_error(e):
+                raise
+            self.invalidate(cache_name)  # expired or deleted on the provider side
+            return self._send(prefix, tail, self.get(prefix))
+
+    def _send(self, prefix: str, tail: str, cache_name: Optional[str]) -> Any:
+        with tracing.span("llm.rate_limit"):
+            rate_limit.acquire_blocking("gemini")
+        with tracing.span("llm.generate", model=self.model, cached_prefix=bool(cache_name)) as llm_span:
+            response = self.client.models.generate_content(model=self.model, **self._request(prefix, tail, cache_name))
+            llm_span["attrs"].update(self.usage.record(response))
+        return response
+
+    async def generate_async(self, prefix: str, tail: str, timeout: Optional[float] = None) -> Any:
+        """
+        `timeout` bounds each model call only: waiting for a rate-limit token and
+        creating the prefix cache happen first, so a queued call is not timed out
+        before it was ever sent (raises asyncio.TimeoutError).
+        """
+        cache_name = await self.get_async(prefix)
+        try:
+            return await self._send_async(prefix, tail, cache_name, timeout)
+        except ClientError as e:
+            if not cache_name or not is_cache_error(e):
+                raise
+            self.invalidate(cache_name)
+            return await self._send_async(prefix, tail, await self.get_async(prefix), timeout)
+
+    async def _send_async(self, prefix: str, tail: str, cache_name: Optional[str], timeout: Optional[float]) -> Any:
+        with tracing.span("llm.rate_limit"):
+            await rate_limit.acquire("gemini")
+        with tracing.span("llm.generate", model=self.model, cached_prefix=bool(cache_name)) as llm_span:
+            response = await asyncio.wait_for(
+                self.client.aio.models.generate_content(model=self.model, **self._request(prefix, tail, cache_name)),
+                timeout=timeout,
+            )
+            llm_span["attrs"].update(self.usage.record(response))
+        return response
@@ -0,0 +1,151 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.genai.errors import ClientError
+
+from agent import context_cache
+from agent.context_cache import PrefixCache, is_cache_error
+from agent.model_manager import ModelManager
+
+PREFIX = "static prompt prefix " * 50  # 1000 characters
+
+
+def client_error(code, message, status="FAILED_PRECONDITION"):
+    return ClientError(code, {"error": {"code": code, "message": message, "status": status}})
+
+
+class FakeGemini:
+    """The parts of genai.Client that PrefixCache uses, sync (`client.x`) and async (`client.aio.x`)."""
+
+    def __init__(self, prefix_tokens=5000, errors=()):
+        self.prefix_tokens = prefix_tokens
+        self.errors = list(errors)  # raised by the next generate_content calls, in order
+        self.calls = []
+        self.created = 0
+        self.models = SimpleNamespace(count_tokens=self._count, generate_content=self._generate)
+        self.caches = SimpleNamespace(create=self._create, delete=self._delete)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(count_tokens=self._async(self._count), generate_content=self._async(self._generate)),
+            caches=SimpleNamespace(create=self._async(self._create), delete=self._async(self._delete)),
+        )
+
+    @staticmethod
+    def _async(fn):
+        async def call(**kwargs):
+            return fn(**kwargs)
+        return call
+
+    def _count(self, model, contents):
+        self.calls.append(("count",))
+        return SimpleNamespace(total_tokens=self.prefix_tokens)
+
+    def _create(self, model, config):
+        self.created += 1
+        self.calls.append(("create", f"cache-{self.created}"))
+        return SimpleNamespace(name=f"cache-{self.created}")
+
+    def _delete(self, name):
+        self.calls.append(("delete", name))
+
+    def _generate(self, model, contents, config=None):
+        cached = config.cached_content if config else None
+        self.calls.append(("generate", cached))
+        if self.errors:
+            raise self.errors.pop(0)
+        usage = SimpleNamespace(prompt_token_count=5100, cached_content_token_count=5000 if cached else 0)
+        return SimpleNamespace(text="ok", usage_metadata=usage)
+
+
+
+@pytest.fixture(params=["sync", "async"])
+def generate(request):
+    def call(cache, tail="tail"):
+        if request.param == "sync":
+            return cache.generate(PREFIX, tail)
+        return asyncio.run(cache.generate_async(PREFIX, tail))
+    return call
+
+
+def test_prefix_is_cached_once_and_reused(generate):
+    client = FakeGemini()
+    cache = PrefixCache(client, "model", min_prefix_tokens=100)
+    generate(cache)
+    generate(cache)
+    assert client.calls == [("count",), ("create", "cache-1"), ("generate", "cache-1"), ("generate", "cache-1")]
+    assert cache.usage.summary()["cached_tokens"] == 10000
+
+
+def test_prefix_below_the_token_minimum_is_never_created(generate):
+    client = FakeGemini(prefix_tokens=300)
+    cache = PrefixCache(client, "model", min_prefix_tokens=1000)
+    generate(cache)
+    generate(cache)
+    assert client.calls == [("count",), ("generate", None), ("generate", None)]
+
+
+def test_short_prefix_is_not_even_counted(generate):
+    client = FakeGemini()
+    generate(PrefixCache(client, "model"))  # 1000 characters cannot hold MIN_PREFIX_TOKENS tokens
+    assert client.calls == [("generate", None)]
+
+
+def test_quota_errors_are_raised_not_resent(generate):
+    client = FakeGemini(errors=[client_error(429, "Resource has been exhausted", "RESOURCE_EXHAUSTED")])
+    cache = PrefixCache(client, "model", min_prefix_tokens=100)
+    with pytest.raises(ClientError):
+        generate(cache)
+    assert [call for call in client.calls if call[0] == "generate"] == [("generate", "cache-1")]
+
+
+def test_missing_cache_is_recreated_and_the_call_resent(generate):
+    client = FakeGemini(errors=[client_error(404, "CachedContent not found", "NOT_FOUND")])
+    cache = PrefixCache(client, "model", min_prefix_tokens=100)
+    response = generate(cache)
+    assert response.text == "ok"
+    assert client.calls == [("count",), ("create", "cache-1"), ("generate", "cache-1"),
+                            ("create", "cache-2"), ("generate", "cache-2")]
+
+
+def test_refreshed_and_evicted_caches_are_deleted(generate, monkeypatch):
+    client = FakeGemini()
+    cache = PrefixCache(client, "model", min_prefix_tokens=100, ttl_seconds=3600)
+    generate(cache)
+    now = context_cache.time.time()
+    monkeypatch.setattr(context_cache.time, "time", lambda: now + 3600)  # inside the refresh margin
+    generate(cache)
+    assert client.calls[-3:] == [("create", "cache-2"), ("delete", "cache-1"), ("generate", "cache-2")]
+
+    cache.max_caches = 1
+    other = PREFIX + "with another tool catalog"
+    cache.get(other)
+    assert client.calls[-2:] == [("create", "cache-3"), ("delete", "cache-2")]
+
+
+def test_is_cache_error():
+    assert is_cache_error(client_error(404, "CachedContent not found", "NOT_FOUND"))
+    assert is_cache_error(client_error(403, "Permission denied on cached content", "PERMISSION_DENIED"))
+    assert not is_cache_error(client_error(429, "Resource has been exhausted", "RESOURCE_EXHAUSTED"))
+    assert not is_cache_error(client_error(400, "Invalid JSON payload", "INVALID_ARGUMENT"))
+
+
+def test_ollama_reports_tokens_served_from_its_kv_cache(monkeypatch):
+    manager = ModelManager.__new__(ModelManager)
+    manager.model_info = {"model": "llama", "url": {"generate": "http://localhost:11434/api/generate"}}
+    manager.usage = context_cache.TokenUsage()
+    replies = iter([
+        {"response": "a", "prompt_eval_count": 120, "eval_count": 5, "context": list(range(125))},  # cold
+        {"response": "b", "prompt_eval_count": 20, "eval_count": 5, "context": list(range(125))},   # prefix reused
+        {"response": "c", "prompt_eval_count": 30, "eval_count": 5},                               # no context field
+    ])
+
+    def post(url, json):
+        data = next(replies)
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: data)
+
+    monkeypatch.setattr("agent.model_manager.requests.post", post)
+
+    for _ in range(3):
+        manager._ollama_generate("tail", prefix="static")
+    assert manager.usage.summary() == {"calls": 3, "prompt_tokens": 270, "cached_tokens": 100,
+                                       "cached_ratio": pytest.approx(100 / 270)}
@@ -1,16 +1,20 @@
 import os
 import json
+import asyncio
 import yaml
 import requests
 from pathlib import Path
 from google import genai
 from dotenv import load_dotenv
+from agent.context_cache import PrefixCache, TokenUsage
+from agent import rate_limit
 
 load_dotenv()
 
 ROOT = Path(__file__).parent.parent
 MODELS_JSON = ROOT / "config" / "models.json"
 PROFILE_YAML = ROOT / "config" / "profiles.yaml"
+OLLAMA_KEEP_ALIVE = "30m"  # keep the model (and its prompt KV cache) loaded between calls
 
 class ModelManager:
     def __init__(self):
@@ -22,24 +26,27 @@ class ModelManager:
         self.model_type = self.model_info["type"]
 
         # ✅ Gemini initialization (your style)
+        self.usage = TokenUsage()
         if self.model_type == "gemini":
             api_key = os.getenv("GEMINI_API_KEY")
             self.client = genai.Client(api_key=api_key)
+            self.prefix_cache = PrefixCache(self.client, self.model_info["model"])
+            self.usage = self.prefix_cache.usage
 
-    async def generate_text(self, prompt: str) -> str:
+    async def generate_text(self, prompt: str, prefix: str = "") -> str:
+        """`prefix` is the static part of the prompt (sent first and cached where the backend allows)."""
         if self.model_type == "gemini":
-            return self._gemini_generate(prompt)
+            return await self._gemini_generate(prompt, prefix)
 
         elif self.model_type == "ollama":
-            return self._ollama_generate(prompt)
+            await rate_limit.acquire("ollama")
+            # requests is blocking: run it in the default thread pool so the event loop stays free
+            return await asyncio.to_thread(self._ollama_generate, prompt, prefix)
 
         raise NotImplementedError(f"Unsupported model type: {self.model_type}")
 
-    def _gemini_generate(self, prompt: str) -> str:
-        response = self.client.models.generate_content(
-            model=self.model_info["model"],
-            contents=prompt
-        )
+    async def _gemini_generate(self, prompt: str, prefix: str = "") -> str:
+        response = await self.prefix_cache.generate_async(prefix, prompt)
 
         # ✅ Safely extract response text
         try:
@@ -50,10 +57,24 @@ class ModelManager:
             except Exception:
                 return str(response)
 
-    def _ollama_generate(self, prompt: str) -> str:
+    def _ollama_generate(self, prompt: str, prefix: str = "") -> str:
+        # Ollama reuses the KV cache for an unchanged prompt prefix as long as the model stays
+        # loaded, so keep it resident and always send the static prefix first.
         response = requests.post(
             self.model_info["url"]["generate"],
-            json={"model": self.model_info["model"], "prompt": prompt, "stream": False}
+            json={
+                "model": self.model_info["model"],
+                "prompt": prefix + prompt,
+                "stream": False,
+                "keep_alive": self.model_info.get("keep_alive", OLLAMA_KEEP_ALIVE),
+            }
         )
         response.raise_for_status()
-        return response.json()["response"].strip()
+        data = response.json()
+        # prompt_eval_count only covers tokens Ollama had to evaluate; `context` holds every prompt
+        # token plus the reply's eval_count tokens, so the difference was served from the KV cache
+        evaluated = data.get("prompt_eval_count", 0)
+        context = data.get("context")
+        prompt_tokens = max(len(context) - data.get("eval_count", 0), evaluated) if context else evaluated
+        self.usage.record_counts(prompt_tokens=prompt_tokens, cached_tokens=prompt_tokens - evaluated)
+        return data["response"].strip()
@@ -0,0 +1,59 @@
+import os
+import time
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Dict
+
+from action.histogram import LatencyHistogram
+
+
+class PromptTemplate:
+    """
+    A prompt file read once and kept in memory.
+
+    `text` re-stats the file on every access (cheap) and only rereads it when
+    its mtime or size changed, so editing a prompt still takes effect on the
+    next call without restarting the agent.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._stamp = None
+        self._text = ""
+        self.reloads = 0
+
+    @property
+    def text(self) -> str:
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            self._text = self.path.read_text(encoding="utf-8").strip()
+            self._stamp = stamp
+            self.reloads += 1
+        return self._text
+
+
+class StageTimer:
+    """Accumulates wall-clock time per named stage (e.g. prompt assembly steps) in fixed-size histograms."""
+
+    def __init__(self):
+        self.stages: Dict[str, LatencyHistogram] = {}
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(stage, LatencyHistogram()).record(time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": histogram.count,
+                "mean_ms": 1000 * histogram.mean,
+                "p95_ms": 1000 * histogram.percentile(95),
+                "total_ms": 1000 * histogram.total,
+            }
+            for stage, histogram in self.stages.items()
+        }
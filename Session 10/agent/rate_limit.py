@@ -0,0 +1,93 @@
+import time
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+# Requests per minute and burst size per LLM provider (Gemini free tier allows 15 RPM for flash models).
+# Limits are opt-in: nothing is throttled until configure() is called (the simulator's parallel mode does).
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "gemini": (15, 3),
+    "ollama": (600, 8),
+}
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every caller of one provider.
+
+    Tokens refill continuously at `rate_per_minute / 60` per second up to `burst`;
+    each request takes one, waiting for the refill when the bucket is empty. A
+    caller reserves its token on arrival (the balance may go negative) and then
+    sleeps until that token has refilled, so waiters are served first come,
+    first served and none of them can be starved by later arrivals. Both the
+    async agent loop and blocking callers (legacy sync paths, worker threads)
+    draw from the same bucket, so the state is guarded by a thread lock.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0  # total seconds callers spent waiting for a token
+
+    def _reserve(self) -> float:
+        """Take the next token; returns how long to wait until it has refilled (0 if available now)."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += delay
+            return delay
+
+    async def acquire(self) -> None:
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def acquire_blocking(self) -> None:
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+
+_limiters: Dict[str, TokenBucket] = {}
+_registry_lock = threading.Lock()
+
+
+def configure(provider: str, rate_per_minute: Optional[float] = None, burst: Optional[int] = None) -> TokenBucket:
+    """Start limiting a provider (DEFAULT_RATE_LIMITS unless given), e.g. from the simulator's settings."""
+    default_rate, default_burst = DEFAULT_RATE_LIMITS.get(provider, (60, 1))
+    with _registry_lock:
+        _limiters[provider] = TokenBucket(rate_per_minute or default_rate, burst or default_burst)
+        return _limiters[provider]
+
+
+def reset(provider: Optional[str] = None) -> None:
+    """Stop limiting one provider, or all of them."""
+    with _registry_lock:
+        if provider is None:
+            _limiters.clear()
+        else:
+            _limiters.pop(provider, None)
+
+
+def limiter(provider: str) -> Optional[TokenBucket]:
+    """The provider's bucket, or None when it has not been configured (calls are not limited)."""
+    with _registry_lock:
+        return _limiters.get(provider)
+
+
+async def acquire(provider: str) -> None:
+    bucket = limiter(provider)
+    if bucket is not None:
+        await bucket.acquire()
+
+
+def acquire_blocking(provider: str) -> None:
+    bucket = limiter(provider)
+    if bucket is not None:
+        bucket.acquire_blocking()
@@ -9,9 +9,9 @@ def print_status(message):
     print(f"  {message}")
     print(f"{'='*50}\n")
 
-async def build_document_index():
-    """Build the document index needed for RAG search"""
-    print_status("Building document index for simulation...")
+async def build_document_index(compact=False, strategy=None):
+    """Build the document index needed for RAG search (or, with compact=True, rebuild it without stale vectors)"""
+    print_status("Compacting document index..." if compact else "Building document index for simulation...")
     
     # Import the necessary module
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -20,6 +20,7 @@ async def build_document_index():
     try:
         # Create a symbolic link to models.py in the root directory if it doesn't exist
         mcp_server_dir = os.path.join(current_dir, "mcp_servers")
+        sys.path.append(mcp_server_dir)  # the server imports its siblings (tracing) directly
         models_source = os.path.join(mcp_server_dir, "models.py")
         models_target = os.path.join(current_dir, "models.py")
         
@@ -59,19 +60,22 @@ class MarkdownOutput(BaseModel):
 """)
         
         # Now import the modules
-        from mcp_servers.mcp_server_2 import process_documents, ensure_faiss_ready
+        from mcp_servers.mcp_server_2 import process_documents, compact_index, CHUNK_STRATEGY
         
         # Create faiss_index directory if needed
         faiss_dir = Path("mcp_servers/faiss_index")
         faiss_dir.mkdir(exist_ok=True, parents=True)
         
-        # Process the documents
-        print("Starting document processing...")
-        process_documents()
+        if compact:
+            compact_index()
+        else:
+            # Process the documents
+            print(f"Starting document processing ({strategy or CHUNK_STRATEGY} chunking)...")
+            process_documents(strategy or CHUNK_STRATEGY)
         
         # Verify the index was created
         index_path = Path("mcp_servers/faiss_index/index.bin")
-        meta_path = Path("mcp_servers/faiss_index/metadata.json")
+        meta_path = Path("mcp_servers/faiss_index/metadata.sqlite")
         
         if index_path.exists() and meta_path.exists():
             print_status("Document index successfully built!")
@@ -100,7 +104,10 @@ class MarkdownOutput(BaseModel):
     return True
 
 if __name__ == "__main__":
-    success = asyncio.run(build_document_index())
+    # python build_document_index.py --compact → drop removed/replaced vectors and retrain
+    # python build_document_index.py --chunking similarity → pick the chunker (markdown, similarity, llm)
+    strategy = sys.argv[sys.argv.index("--chunking") + 1] if "--chunking" in sys.argv[:-1] else None
+    success = asyncio.run(build_document_index(compact="--compact" in sys.argv, strategy=strategy))
     if success:
         print("\nYou can now run the simulator with: python tool_performance_simulator.py")
     else:
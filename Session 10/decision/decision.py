@@ -1,11 +1,15 @@
 import os
 import json
+import asyncio
 from pathlib import Path
 from dotenv import load_dotenv
 from google import genai
 from google.genai.errors import ServerError
 import re
 from mcp_servers.multiMCP import MultiMCP
+from agent.prompt_loader import PromptTemplate, StageTimer
+from agent.context_cache import PrefixCache
+from mcp_servers import tracing
 import ast
 
 
@@ -13,24 +17,36 @@ load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 client = genai.Client(api_key=api_key)
 
+LLM_TIMEOUT = 90  # seconds before an async decision call is cancelled
+
 class Decision:
-    def __init__(self, decision_prompt_path: str, multi_mcp: MultiMCP, api_key: str | None = None, model: str = "gemini-2.0-flash"):
+    def __init__(self, decision_prompt_path: str, multi_mcp: MultiMCP, api_key: str | None = None, model: str = "gemini-2.0-flash",
+                 timeout: float = LLM_TIMEOUT):
         load_dotenv()
         self.decision_prompt_path = decision_prompt_path
+        self.prompt_template = PromptTemplate(decision_prompt_path)
+        self.prompt_timer = StageTimer()  # prompt assembly cost per stage, see prompt_timer.summary()
         self.multi_mcp = multi_mcp
         self.model = model
+        self.timeout = timeout
 
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found in environment or explicitly provided.")
         self.client = genai.Client(api_key=self.api_key)
-        
-
-    def run(self, decision_input: dict) -> dict:
-        prompt_template = Path(self.decision_prompt_path).read_text(encoding="utf-8")
-        function_list_text = self.multi_mcp.tool_description_wrapper()
-        tool_descriptions = "\n".join(f"- `{desc.strip()}`" for desc in function_list_text)
-        tool_descriptions_segment = "\n\n### The ONLY Available Tools\n\n---\n\n" + tool_descriptions
+        self.prefix_cache = PrefixCache(self.client, model)  # prefix_cache.usage: tokens sent vs cached
+
+
+    def build_prompt_parts(self, decision_input: dict) -> tuple[str, str]:
+        """
+        (static prefix, per-call tail). Template and tool catalog only change when the
+        prompt file or tool set does, so they lead and can be served from the provider's
+        context cache; the user suggestion and step JSON follow.
+        """
+        with self.prompt_timer.measure("template"):
+            prompt_template = self.prompt_template.text
+        with self.prompt_timer.measure("tool_catalog"):
+            tool_descriptions_segment = "\n\n### The ONLY Available Tools\n\n---\n\n" + self.multi_mcp.tool_catalog()
         
         user_suggestion_prompt_segment = ""
         if "user_plan_suggestion" in decision_input and decision_input["user_plan_suggestion"]:
@@ -43,22 +59,25 @@ class Decision:
                 f"User's Suggestion: \"\"\"{user_suggestion}\"\"\"\n---"
             )
 
-        decision_input_for_json = {k: v for k, v in decision_input.items() if k != "user_plan_suggestion"}
-        main_prompt_body_json = f"\n\n```json\n{json.dumps(decision_input_for_json, indent=2)}\n```"
+        with self.prompt_timer.measure("input_json"):
+            decision_input_for_json = {k: v for k, v in decision_input.items() if k != "user_plan_suggestion"}
+            main_prompt_body_json = f"\n\n```json\n{json.dumps(decision_input_for_json, indent=2)}\n```"
 
-        full_prompt = f"{prompt_template.strip()}{user_suggestion_prompt_segment}{tool_descriptions_segment}{main_prompt_body_json}"
+        prefix = f"{prompt_template}{tool_descriptions_segment}"
+        tail = f"{user_suggestion_prompt_segment}{main_prompt_body_json}"
 
         # For debugging:
         # print("--- Decision Prompt to LLM ---")
-        # print(full_prompt)
+        # print(prefix + tail)
         # print("-----------------------------")
+        return prefix, tail
 
-        try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=full_prompt
-            )
-        except ServerError as e:
+    def build_prompt(self, decision_input: dict) -> str:
+        return "".join(self.build_prompt_parts(decision_input))
+
+    @staticmethod
+    def _call_failed(e: Exception) -> dict:
+        if isinstance(e, ServerError):
             print(f"🚫 Decision LLM ServerError: {e}")
             return {
                 "step_index": 0, "description": "Decision model unavailable: server overload.",
@@ -66,15 +85,39 @@ class Decision:
                 "plan_text": ["Step 0: Decision model returned a 503. Exiting to avoid loop."],
                 "raw_text": str(e)
             }
+        print(f"🚫 Decision LLM API call failed: {e}")
+        return {
+            "step_index": 0, "description": f"Decision model API call failed: {e}",
+            "type": "NOOP", "code": "", "conclusion": "",
+            "plan_text": ["Step 0: LLM API call failed."],
+            "raw_text": str(e)
+        }
+
+    @tracing.traced("Decision.run")
+    def run(self, decision_input: dict) -> dict:
+        """Blocking decision call; the agent loop uses run_async()."""
+        with tracing.span("decision.prompt_build"):
+            prefix, tail = self.build_prompt_parts(decision_input)
+        try:
+            response = self.prefix_cache.generate(prefix, tail)
         except Exception as e:
-            print(f"🚫 Decision LLM API call failed: {e}")
-            return {
-                "step_index": 0, "description": f"Decision model API call failed: {e}",
-                "type": "NOOP", "code": "", "conclusion": "",
-                "plan_text": ["Step 0: LLM API call failed."],
-                "raw_text": str(e)
-            }
+            return self._call_failed(e)
+        return self.parse_response(response)
+
+    @tracing.traced("Decision.run")
+    async def run_async(self, decision_input: dict) -> dict:
+        """Awaits the SDK's async client (cancelled after `timeout` seconds) so other sessions keep running."""
+        with tracing.span("decision.prompt_build"):
+            prefix, tail = self.build_prompt_parts(decision_input)
+        try:
+            response = await self.prefix_cache.generate_async(prefix, tail, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return self._call_failed(TimeoutError(f"timed out after {self.timeout}s"))
+        except Exception as e:
+            return self._call_failed(e)
+        return self.parse_response(response)
 
+    def parse_response(self, response) -> dict:
         if not response.candidates or not response.candidates[0].content or not response.candidates[0].content.parts:
             print("🚫 Decision LLM response is empty or malformed.")
             return {
@@ -0,0 +1,159 @@
+import os
+import sys
+import csv
+import time
+import argparse
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "mcp_servers"))  # the server imports its siblings directly
+
+from action.histogram import LatencyHistogram
+from mcp_servers.doc_store import DocumentStore, POINTS_PER_CENTROID, training_size, tune_index
+from mcp_servers.mcp_server_2 import chunk_document, embedding_cache, extract_markdown, get_embeddings
+
+DEFAULT_FACTORIES = ["Flat", "IVF64,Flat", "IVF64,PQ16", "HNSW32"]
+DEFAULT_NPROBES = "1,4,16,64"
+DEFAULT_EF_SEARCH = "16,64,256"
+RESULT_FILE = "index_benchmark.csv"
+CHUNKING_RESULT_FILE = "chunking_benchmark.csv"
+DOC_DIR = os.path.join(ROOT, "mcp_servers", "documents")
+
+
+def load_corpus(index_dir):
+    store = DocumentStore(index_dir)
+    rows = store.chunks()
+    store.close()
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32)
+    # The embedding cache already holds every indexed chunk, so this does not call Ollama again
+    return get_embeddings([chunk for _, chunk in rows])
+
+
+def sweep(factory, args):
+    """Search-time settings to try for a factory string: (label, nprobe, ef_search)."""
+    if factory.startswith("IVF"):
+        return [(f"nprobe={n}", int(n), None) for n in args.nprobe.split(",")]
+    if factory.startswith("HNSW"):
+        return [(f"efSearch={ef}", None, int(ef)) for ef in args.ef_search.split(",")]
+    return [("", None, None)]
+
+
+def measure(index, queries, truth, k):
+    histogram = LatencyHistogram()
+    found = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        histogram.record(time.perf_counter() - started)
+        found += len(set(ids[0]) & set(expected))
+    return found / (len(queries) * k), histogram
+
+
+def run(args):
+    vectors = load_corpus(os.path.join(ROOT, "mcp_servers", "faiss_index"))
+    if not len(vectors):
+        print("🚨 No indexed chunks found. Run build_document_index.py first.")
+        return
+    n, dim = vectors.shape
+    k = min(args.k, n)
+
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(n, size=min(args.queries, n), replace=False)]
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+    print(f"Corpus: {n} chunks × {dim} dims, {len(queries)} queries, recall@{k} against exact search\n")
+
+    rows = []
+    print(f"{'Index':<18} {'Setting':<14} {'Recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'Build s':>8}")
+    for factory in args.factories:
+        needed = training_size(factory, dim)
+        if needed and n < needed // POINTS_PER_CENTROID:
+            print(f"{factory:<18} ⚠️ needs at least {needed // POINTS_PER_CENTROID} vectors to train, skipped")
+            continue
+
+        started = time.perf_counter()
+        index = faiss.index_factory(dim, factory)
+        if needed:
+            index.train(vectors)  # under POINTS_PER_CENTROID per centroid the indexer would stay flat
+        index.add(vectors)
+        build_s = time.perf_counter() - started
+
+        for label, nprobe, ef_search in sweep(factory, args):
+            tune_index(index, nprobe, ef_search)
+            recall, histogram = measure(index, queries, truth, k)
+            latency = histogram.summary_ms()
+            note = " (under-trained)" if needed and n < needed else ""
+            print(f"{factory:<18} {label:<14} {recall:>7.3f} {latency['p50']:>8.3f} {latency['p95']:>8.3f} {build_s:>8.2f}{note}")
+            rows.append([factory, label, f"{recall:.4f}", f"{latency['p50']:.4f}", f"{latency['p95']:.4f}",
+                         f"{latency['mean']:.4f}", f"{build_s:.3f}", n])
+
+    with open(args.csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Index", "Setting", f"Recall@{k}", "P50 (ms)", "P95 (ms)", "Mean (ms)", "Build (s)", "Vectors"])
+        writer.writerows(rows)
+    print(f"\n✅ Results saved to {args.csv}")
+
+
+def compare_chunking(args):
+    """Chunking + embedding time per strategy on documents/ (extraction runs once, untimed)."""
+    files = sorted(f for f in os.listdir(DOC_DIR) if os.path.isfile(os.path.join(DOC_DIR, f)))[:args.max_docs]
+    documents = []
+    for name in files:
+        try:
+            markdown = extract_markdown(Path(os.path.join(DOC_DIR, name)))
+        except Exception as e:
+            print(f"⚠️ Skipping {name}: {e}")
+            continue
+        if markdown.strip():
+            documents.append(markdown)
+    words = sum(len(d.split()) for d in documents)
+    print(f"Corpus: {len(documents)} documents, {words} words\n")
+
+    rows = []
+    cache = embedding_cache()
+    print(f"{'Strategy':<12} {'Chunks':>7} {'Words/chunk':>12} {'Chunk s':>9} {'Embed s':>9} {'Embedded':>9} {'Total s':>9}")
+    for strategy in args.chunking:
+        started = time.perf_counter()
+        chunks = [chunk for markdown in documents for chunk in chunk_document(markdown, strategy)]
+        chunk_s = time.perf_counter() - started
+
+        misses = cache.misses
+        started = time.perf_counter()
+        get_embeddings(chunks)
+        embed_s = time.perf_counter() - started
+        embedded = cache.misses - misses  # chunks not already in the embedding cache
+
+        mean_words = words / len(chunks) if chunks else 0
+        print(f"{strategy:<12} {len(chunks):>7} {mean_words:>12.0f} {chunk_s:>9.2f} {embed_s:>9.2f} {embedded:>9} {chunk_s + embed_s:>9.2f}")
+        rows.append([strategy, len(chunks), f"{mean_words:.1f}", f"{chunk_s:.3f}", f"{embed_s:.3f}", embedded,
+                     f"{chunk_s + embed_s:.3f}"])
+
+    with open(CHUNKING_RESULT_FILE, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Strategy", "Chunks", "Words/Chunk", "Chunking (s)", "Embedding (s)", "Embedded", "Total (s)"])
+        writer.writerows(rows)
+    print(f"\n✅ Results saved to {CHUNKING_RESULT_FILE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency of FAISS index types on the indexed documents")
+    parser.add_argument("--factories", nargs="+", default=DEFAULT_FACTORIES, help="faiss.index_factory strings")
+    parser.add_argument("--nprobe", default=DEFAULT_NPROBES, help="IVF nprobe values to sweep")
+    parser.add_argument("--ef-search", default=DEFAULT_EF_SEARCH, help="HNSW efSearch values to sweep")
+    parser.add_argument("--k", type=int, default=5, help="neighbours per query (the RAG tool uses 5)")
+    parser.add_argument("--queries", type=int, default=200, help="chunks sampled as queries")
+    parser.add_argument("--csv", default=RESULT_FILE, help="where to write the results")
+    parser.add_argument("--chunking", nargs="+", choices=["markdown", "similarity", "llm"],
+                        help="compare indexing time of these chunking strategies instead")
+    parser.add_argument("--max-docs", type=int, default=None, help="documents used by --chunking")
+    args = parser.parse_args()
+    if args.chunking:
+        compare_chunking(args)
+    else:
+        run(args)
@@ -1,11 +1,12 @@
 import asyncio
 import yaml
 from mcp_servers.multiMCP import MultiMCP
-from typing import Optional, Literal
+from mcp_servers import tracing
+from typing import Optional
 
 from dotenv import load_dotenv
 # from agent.agent_loop import AgentLoop
-from agent.agent_loop2 import AgentLoop
+from agent.agent_service import AgentService, MAX_CONCURRENT_SESSIONS
 from agent.agentSession import AgentSession
 from agent.hitl_request import HITLRequest
 from pprint import pprint
@@ -14,11 +15,50 @@ BANNER = """
 ──────────────────────────────────────────────────────
 🔸  Agentic Query Assistant  🔸
 Type your question and press Enter.
+Several questions can run at once; answers print as they finish.
+Answer a help request with: /reply <session-id> <text>
 Type 'exit' or 'quit' to leave.
 ──────────────────────────────────────────────────────
 """
 
 
+def find_session(service: AgentService, session_prefix: str) -> Optional[str]:
+    matches = [session_id for session_id in service.paused if session_id.startswith(session_prefix)] if session_prefix else []
+    return matches[0] if len(matches) == 1 else None
+
+
+async def report(turn) -> None:
+    """Await one agent turn and print its outcome (runs alongside other sessions)."""
+    try:
+        response = await turn
+    except Exception as e:
+        print(f"🚨 Agent turn failed: {e}")
+        return
+
+    if isinstance(response, HITLRequest):
+        print(f"\nℹ️ Agent requires assistance (Session ID: {response.session_id}, Type: {response.type})")
+        print(f"❓ Agent: {response.prompt_to_user}")
+        print(f"🔵 Reply with: /reply {response.session_id[:8]} <your input>   (or /skip {response.session_id[:8]})")
+
+    elif isinstance(response, AgentSession):
+        print(f"\n🌟 Agent Task Concluded 🌟  [{response.original_query}]")
+        if response.state.get("current_step_summary"):
+            print(f"▶️ Last Action: {response.state['current_step_summary']}")
+        if response.state.get("final_answer"):
+            print(f"✅ Final Answer: {response.state['final_answer']}")
+        if response.state.get("reasoning_note"):
+            print(f"🤔 Reasoning: {response.state['reasoning_note']}")
+        # if response.state.get("solution_summary"):
+        #      print(f"📄 Summary: {response.state['solution_summary']}")
+        else:
+            pprint(response.to_json())
+        print("\n──────────────────────────────────────────────────────\n")
+
+    else:
+        print(f"🚨 Unexpected response type from AgentLoop: {type(response)}. Please check agent_loop2.py.")
+        print("\n──────────────────────────────────────────────────────\n")
+
+
 async def interactive() -> None:
     print(BANNER)
     print("Loading MCP Servers...")
@@ -27,6 +67,9 @@ async def interactive() -> None:
             profile = yaml.safe_load(f)
             mcp_servers_list = profile.get("mcp_servers", [])
             configs = list(mcp_servers_list)
+            tool_cache_config = profile.get("tool_cache")
+            service_config = profile.get("agent_service") or {}
+            tracing_config = profile.get("tracing") or {}
     except FileNotFoundError:
         print("🚨 Error: mcp_server_config.yaml not found. Please ensure the configuration file exists.")
         return
@@ -37,8 +80,12 @@ async def interactive() -> None:
         print(f"🚨 An unexpected error occurred during MCP config loading: {e}")
         return
 
+    if tracing_config.get("enabled"):
+        trace_path = tracing.configure(tracing_config.get("file", tracing.DEFAULT_TRACE_FILE))
+        print(f"🧵 Tracing spans to {trace_path}")
+
     # Initialize MCP + Dispatcher
-    multi_mcp = MultiMCP(server_configs=configs)
+    multi_mcp = MultiMCP(server_configs=configs, cache_config=tool_cache_config)
     try:
         await multi_mcp.initialize()
     except Exception as e:
@@ -46,84 +93,53 @@ async def interactive() -> None:
         return
 
     try:
-        loop = AgentLoop(
+        service = AgentService(
             perception_prompt_path="prompts/perception_prompt.txt",
             decision_prompt_path="prompts/decision_prompt.txt",
             multi_mcp=multi_mcp,
-            strategy="exploratory"
+            strategy="exploratory",
+            max_concurrent=service_config.get("max_concurrent_sessions", MAX_CONCURRENT_SESSIONS)
         )
+        await service.start()
     except Exception as e:
-        print(f"🚨 An unexpected error occurred during AgentLoop initialization: {e}")
+        print(f"🚨 An unexpected error occurred during AgentService initialization: {e}")
+        await multi_mcp.shutdown()
         return
 
-    active_query: Optional[str] = None
-    hitl_input_data: Optional[str] = None
-    hitl_input_type: Optional[Literal["tool_failure", "plan_failure"]] = None
+    running = set()
 
     while True:
-        current_input_query: Optional[str] = None
-        if not hitl_input_data:
-            user_input = input("🟢 You: ").strip()
-            if user_input.lower() in {"exit", "quit"}:
-                print("👋 Goodbye!")
-                break
-            active_query = user_input
-            current_input_query = active_query
-        else:
-            current_input_query = active_query
-
-
-        if active_query is None :
-            print("Logic error: active_query is None. Please restart.")
+        user_input = (await asyncio.to_thread(input, "🟢 You: ")).strip()
+        if not user_input:
+            continue
+        if user_input.lower() in {"exit", "quit"}:
+            print("👋 Goodbye!")
             break
 
-        print("Processing...")
-        response = await loop.run(
-            query=active_query,
-            hitl_input_data=hitl_input_data,
-            hitl_input_type=hitl_input_type
-        )
-
-        hitl_input_data = None
-        hitl_input_type = None
-
-        if isinstance(response, HITLRequest):
-            print(f"ℹ️ Agent requires assistance (Session ID: {response.session_id}, Type: {response.type})")
-            print(f"❓ Agent: {response.prompt_to_user}")
-            user_hitl_response = input("🔵 Your Input: ").strip()
-            
-            if user_hitl_response.lower() in {"exit", "quit"}:
-                print("👋 Goodbye! (Exited during HITL)")
-                loop.current_session = None
-                active_query = None
+        if user_input.startswith(("/reply ", "/skip ")):
+            command, _, rest = user_input.partition(" ")
+            session_prefix, _, human_input = rest.strip().partition(" ")
+            session_id = find_session(service, session_prefix)
+            if session_id is None:
+                print(f"⚠️ No session waiting for input matches '{session_prefix}'")
                 continue
+            if command == "/skip":
+                service.abandon(session_id)
+                print(f"⏭️ Dropped session {session_id}")
+                continue
+            turn = service.resume(session_id, human_input.strip())
+        else:
+            turn = service.submit(user_input)
+            print(f"Processing... ({service.active} running, {service.queued} queued)")
 
+        task = asyncio.create_task(report(turn))
+        running.add(task)
+        task.add_done_callback(running.discard)
 
-            hitl_input_data = user_hitl_response
-            hitl_input_type = response.type
-            continue 
-        
-        elif isinstance(response, AgentSession):
-            print("\n🌟 Agent Task Concluded 🌟")
-            if response.state.get("current_step_summary"):
-                print(f"▶️ Last Action: {response.state['current_step_summary']}")
-            if response.state.get("final_answer"):
-                print(f"✅ Final Answer: {response.state['final_answer']}")
-            if response.state.get("reasoning_note"):
-                print(f"🤔 Reasoning: {response.state['reasoning_note']}")
-            # if response.state.get("solution_summary"):
-            #      print(f"📄 Summary: {response.state['solution_summary']}")
-            else:
-                pprint(response.to_json())
-
-            active_query = None
-            print("\n──────────────────────────────────────────────────────\n")
-
-
-        else:
-            print(f"🚨 Unexpected response type from AgentLoop: {type(response)}. Please check agent_loop2.py.")
-            active_query = None
-            print("\n──────────────────────────────────────────────────────\n")
+    for task in running:
+        task.cancel()
+    await service.stop()
+    await multi_mcp.shutdown()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,57 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+class CaptionCache:
+    """
+    Image captions keyed by (model, sha256(image bytes)).
+
+    Backed by SQLite in WAL mode so the extraction worker processes and the RAG
+    server share one file: a logo repeated on every page, or a document that is
+    re-indexed after a small edit, is captioned once. Only real captions are
+    stored; failures are retried next time.
+    """
+
+    def __init__(self, sqlite_path: str):
+        Path(sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS captions ("
+            "model TEXT, digest TEXT, caption TEXT, created_at REAL, PRIMARY KEY (model, digest))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(image: bytes) -> str:
+        return hashlib.sha256(image).hexdigest()
+
+    def get(self, model: str, digest: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT caption FROM captions WHERE model = ? AND digest = ?", (model, digest)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, model: str, digest: str, caption: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO captions (model, digest, caption, created_at) VALUES (?, ?, ?, ?)",
+                (model, digest, caption, time.time()),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+
+import pytest
+
+import mcp_server_2
+from caption_cache import CaptionCache
+
+
+class FakeResponse:
+    def __init__(self, lines=(), content=b"", status=200):
+        self.lines = lines
+        self.content = content
+        self.status = status
+
+    def iter_lines(self):
+        yield from self.lines
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise RuntimeError(f"HTTP {self.status}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Stands in for mcp_server_2.http: post streams `lines`, get returns `content`."""
+
+    def __init__(self, lines=(), content=b"", status=200, error=None):
+        self.lines, self.content, self.status, self.error = lines, content, status, error
+        self.requests = []
+
+    def post(self, url, json=None, stream=False):
+        self.requests.append(("post", url, json))
+        if self.error:
+            raise self.error
+        return FakeResponse(self.lines)
+
+    def get(self, url):
+        self.requests.append(("get", url, None))
+        return FakeResponse(content=self.content, status=self.status)
+
+
+def stream(*objects):
+    return [json.dumps(o).encode() if isinstance(o, dict) else o for o in objects]
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def install(**kwargs):
+        fake = FakeSession(**kwargs)
+        monkeypatch.setattr(mcp_server_2, "http", fake)
+        return fake
+    return install
+
+
+def test_caption_is_joined_from_streamed_response_fields(session):
+    fake = session(lines=stream(
+        {"response": " A red ", "done": False},
+        b"",
+        b"not json",
+        {"response": "square. ", "done": True},
+        {"response": "ignored after done"},
+    ))
+    assert mcp_server_2._caption_bytes(b"png", "label") == "A red square."
+    _, url, body = fake.requests[0]
+    assert url == mcp_server_2.OLLAMA_URL and body["stream"] is True and body["images"] == ["cG5n"]
+
+
+def test_empty_or_failed_caption_is_none(session):
+    session(lines=stream({"done": True}))
+    assert mcp_server_2._caption_bytes(b"png", "label") is None
+    session(error=ConnectionError("refused"))
+    assert mcp_server_2._caption_bytes(b"png", "label") is None
+
+
+def test_web_images_are_downloaded_without_a_local_file_check(session, monkeypatch, tmp_path):
+    monkeypatch.setattr(mcp_server_2, "ROOT", tmp_path)  # no documents/ folder at all
+    fake = session(content=b"remote bytes")
+    assert mcp_server_2._load_image("https://example.com/a.png") == b"remote bytes"
+    assert fake.requests == [("get", "https://example.com/a.png", None)]
+
+    session(status=404)
+    with pytest.raises(RuntimeError):
+        mcp_server_2._load_image("https://example.com/missing.png")
+
+
+def test_local_images_are_read_from_documents(monkeypatch, tmp_path):
+    monkeypatch.setattr(mcp_server_2, "ROOT", tmp_path)
+    (tmp_path / "documents" / "images").mkdir(parents=True)
+    (tmp_path / "documents" / "images" / "a.png").write_bytes(b"local bytes")
+    assert mcp_server_2._load_image("images/a.png") == b"local bytes"
+    assert mcp_server_2._load_image("images/missing.png") is None
+
+
+def test_caption_images_dedupes_caches_and_caps_requests(monkeypatch, tmp_path):
+    images = {f"{i}.png": b"logo" if i < 3 else f"image {i}".encode() for i in range(10)}
+    monkeypatch.setattr(mcp_server_2, "_load_image", images.get)
+    monkeypatch.setattr(mcp_server_2, "_caption_cache", CaptionCache(str(tmp_path / "captions.sqlite")))
+    monkeypatch.setattr(mcp_server_2, "_caption_workers", 2)
+
+    lock = threading.Lock()
+    in_flight, peak, captioned = 0, 0, []
+
+    def caption(image, label):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            captioned.append(image)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        return None if image == b"image 9" else f"caption of {image.decode()}"
+
+    monkeypatch.setattr(mcp_server_2, "_caption_bytes", caption)
+    captions = mcp_server_2.caption_images(list(images) + ["0.png", "missing.png"])
+
+    assert len(captioned) == 8 and peak == 2  # the repeated logo once, two requests at a time
+    assert captions["0.png"] == captions["2.png"] == "caption of logo"
+    assert captions["9.png"] == "[No caption returned]"
+    assert captions["missing.png"] == "[Image could not be processed: missing.png]"
+
+    captioned.clear()
+    assert mcp_server_2.caption_images(["1.png", "9.png"])["1.png"] == "caption of logo"
+    assert captioned == [b"image 9"]  # failures are retried, captions come from the cache
+
+
+def test_extract_pool_splits_the_caption_budget(monkeypatch):
+    shares = {}
+
+    class RecordingPool:
+        def __init__(self, workers, mp_context=None, initializer=None, initargs=()):
+            shares[workers] = initargs[0]
+            assert initializer is mcp_server_2._init_extract_worker
+
+    monkeypatch.setattr(mcp_server_2, "ProcessPoolExecutor", RecordingPool)
+    monkeypatch.setattr(mcp_server_2, "CAPTION_MAX_IN_FLIGHT", 4)
+    for workers in (1, 2, 4, 8):
+        mcp_server_2.extract_pool(workers)
+    assert shares == {1: 4, 2: 2, 4: 1, 8: 1}
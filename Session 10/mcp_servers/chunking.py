@@ -0,0 +1,117 @@
+"""
+Local chunkers for the document indexer.
+
+`markdown_chunks` splits on headings and paragraphs without any model calls;
+`similarity_chunks` places breakpoints where consecutive sentences drift apart
+in embedding space, using one batched embedding pass. Both keep chunks under
+`max_words`. The LLM segmenter (`semantic_merge`) stays in mcp_server_2.
+"""
+import re
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+MAX_CHUNK_WORDS = 512  # same window the LLM segmenter works on
+MIN_CHUNK_WORDS = 40  # a heading does not close a chunk smaller than this
+BREAKPOINT_PERCENTILE = 90  # similarity_chunks splits at the largest 10% of sentence-to-sentence distances
+
+_HEADING = re.compile(r"^#{1,6}\s")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[*])")
+
+
+def _blocks(markdown: str) -> List[str]:
+    """Headings, paragraphs, tables and fenced code blocks, in order."""
+    blocks, current, in_fence = [], [], False
+    for line in markdown.splitlines():
+        if line.strip().startswith("```"):
+            in_fence = not in_fence
+        if not in_fence and (not line.strip() or _HEADING.match(line)):
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            if line.strip():
+                blocks.append(line)  # a heading is its own block
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_long(block: str, max_words: int) -> List[str]:
+    """Break a block over max_words at sentence ends, falling back to plain word windows."""
+    if len(block.split()) <= max_words:
+        return [block]
+    pieces, current = [], []
+    for sentence in _SENTENCE_END.split(block):
+        words = sentence.split()
+        if len(words) > max_words:
+            pieces.extend(" ".join(words[i:i + max_words]) for i in range(0, len(words), max_words))
+            continue
+        if current and len(current) + len(words) > max_words:
+            pieces.append(" ".join(current))
+            current = []
+        current.extend(words)
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def markdown_chunks(markdown: str, max_words: int = MAX_CHUNK_WORDS, min_words: int = MIN_CHUNK_WORDS) -> List[str]:
+    """
+    Pack paragraphs into chunks of up to max_words, starting a new chunk at each
+    heading (once the current one has min_words) so sections stay together.
+    """
+    chunks, current, size = [], [], 0
+
+    def close():
+        nonlocal current, size
+        if current:
+            chunks.append("\n\n".join(current).strip())
+        current, size = [], 0
+
+    for block in _blocks(markdown):
+        if _HEADING.match(block) and size >= min_words:
+            close()
+        for piece in _split_long(block, max_words):
+            words = len(piece.split())
+            if current and size + words > max_words:
+                close()
+            current.append(piece)
+            size += words
+    close()
+    return [c for c in chunks if c]
+
+
+def similarity_chunks(markdown: str, embed: Callable[[Sequence[str]], np.ndarray],
+                      max_words: int = MAX_CHUNK_WORDS, percentile: float = BREAKPOINT_PERCENTILE) -> List[str]:
+    """
+    Split where the cosine distance between neighbouring sentences is in the top
+    (100 - percentile)% for this document, or where a chunk would exceed max_words.
+    `embed` is called once with every sentence.
+    """
+    sentences = []
+    for block in _blocks(markdown):
+        if _HEADING.match(block):
+            sentences.append(block)
+            continue
+        for piece in _split_long(block, max_words):
+            sentences.extend(s for s in _SENTENCE_END.split(piece) if s.strip())
+    if len(sentences) < 3:
+        return markdown_chunks(markdown, max_words)
+
+    vectors = np.asarray(embed(sentences), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    distances = 1 - np.sum(vectors[:-1] * vectors[1:], axis=1)
+    threshold = np.percentile(distances, percentile)
+
+    chunks, current, size = [], [sentences[0]], len(sentences[0].split())
+    for sentence, distance in zip(sentences[1:], distances):
+        words = len(sentence.split())
+        if distance > threshold or size + words > max_words:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += words
+    chunks.append(" ".join(current))
+    return chunks
@@ -0,0 +1,83 @@
+import numpy as np
+
+from chunking import markdown_chunks, similarity_chunks
+
+
+def words(count, word="word"):
+    return " ".join([word] * count)
+
+
+def sentences(count, word):
+    return " ".join(f"{word.capitalize()} {word} {word}." for _ in range(count))
+
+
+def topic_embed(calls):
+    """Embeds a sentence as the one-hot of its first word's topic, recording each call."""
+    topics = {}
+
+    def embed(batch):
+        calls.append(list(batch))
+        out = np.zeros((len(batch), 16), dtype=np.float32)
+        for row, sentence in enumerate(batch):
+            topic = sentence.strip("# ").split()[0].lower().strip(".")
+            out[row, topics.setdefault(topic, len(topics))] = 1.0
+        return out
+
+    return embed
+
+
+def test_heading_starts_a_chunk_once_the_current_one_is_big_enough():
+    text = f"# One\n\n{words(50)}\n\n# Two\n\n{words(10)}"
+    assert markdown_chunks(text, max_words=512, min_words=40) == [f"# One\n\n{words(50)}", f"# Two\n\n{words(10)}"]
+
+
+def test_small_sections_are_packed_together():
+    text = f"# One\n\n{words(5)}\n\n# Two\n\n{words(5)}"
+    assert markdown_chunks(text, max_words=512, min_words=40) == [text]
+
+
+def test_paragraphs_are_packed_up_to_max_words():
+    paragraphs = [words(30, f"p{i}") for i in range(5)]
+    chunks = markdown_chunks("\n\n".join(paragraphs), max_words=100, min_words=10)
+    assert chunks == ["\n\n".join(paragraphs[:3]), "\n\n".join(paragraphs[3:])]
+    assert all(len(chunk.split()) <= 100 for chunk in chunks)
+
+
+def test_long_paragraph_splits_at_sentence_ends():
+    text = " ".join(f"Sentence {i} has exactly five." for i in range(10))  # 50 words
+    chunks = markdown_chunks(text, max_words=12, min_words=1)
+    assert chunks[0] == "Sentence 0 has exactly five. Sentence 1 has exactly five."
+    assert all(len(chunk.split()) <= 12 and chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_sentence_longer_than_max_words_falls_back_to_word_windows():
+    chunks = markdown_chunks(words(25), max_words=10, min_words=1)
+    assert [len(chunk.split()) for chunk in chunks] == [10, 10, 5]
+
+
+def test_fenced_code_stays_one_block():
+    code = "```python\ndef f():\n\n    return 1\n# not a heading\n```"
+    chunks = markdown_chunks(f"{words(50)}\n\n{code}\n\n# Next\n\ntext", max_words=512, min_words=10)
+    assert chunks == [f"{words(50)}\n\n{code}", "# Next\n\ntext"]
+
+
+def test_similarity_splits_at_topic_shifts_with_one_embed_call():
+    text = " ".join([sentences(4, "apple"), sentences(4, "rocket"), sentences(4, "violin")])
+    calls = []
+    chunks = similarity_chunks(text, topic_embed(calls), max_words=512, percentile=80)
+    assert len(calls) == 1 and len(calls[0]) == 12
+    assert chunks == [sentences(4, "apple"), sentences(4, "rocket"), sentences(4, "violin")]
+
+
+def test_similarity_respects_max_words():
+    text = sentences(10, "apple")  # one topic, 30 words
+    chunks = similarity_chunks(text, topic_embed([]), max_words=9)
+    assert [len(chunk.split()) for chunk in chunks] == [9, 9, 9, 3]
+
+
+def test_similarity_falls_back_for_short_text():
+    calls = []
+    text = "Only one sentence. And a second."
+    assert similarity_chunks(text, topic_embed(calls)) == markdown_chunks(text)
+    assert calls == []
@@ -0,0 +1,341 @@
+import os
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_FILE = "index.bin"
+METADATA_DB = "metadata.sqlite"
+LEGACY_METADATA_FILE = "metadata.json"  # pre-SQLite metadata, imported once if found
+
+# faiss.index_factory strings, e.g. "Flat" (exact), "IVF256,Flat", "IVF256,PQ32", "HNSW32"
+DEFAULT_INDEX_FACTORY = "Flat"
+POINTS_PER_CENTROID = 39  # faiss's minimum for stable k-means; fewer vectors stay in a flat index
+COMPACT_THRESHOLD = 0.3  # rebuild once this share of the index's vectors has been removed or replaced
+
+
+# ── Index factory ────────────────────────────────────────
+def training_size(factory: str, dim: int) -> int:
+    """Vectors needed before an index of this type can be trained (0 if it needs no training)."""
+    index = faiss.index_factory(dim, factory)
+    if index.is_trained:
+        return 0
+    centroids = 1
+    try:
+        ivf = faiss.downcast_index(faiss.extract_index_ivf(index))
+        centroids = ivf.nlist
+        if hasattr(ivf, "pq"):
+            centroids = max(centroids, ivf.pq.ksub)
+    except RuntimeError:
+        pass  # not IVF (e.g. plain PQ); k-means still needs a few points per centroid
+    return centroids * POINTS_PER_CENTROID
+
+
+def new_index(dim: int, factory: str = DEFAULT_INDEX_FACTORY):
+    """
+    An empty ID-mapped index for `factory`. Types that must be trained start as
+    a flat index and are converted by `train_if_ready` once the corpus is large enough.
+    """
+    base = faiss.IndexFlatL2(dim) if training_size(factory, dim) else faiss.index_factory(dim, factory)
+    return faiss.IndexIDMap2(base)
+
+
+def train_if_ready(index, factory: str = DEFAULT_INDEX_FACTORY):
+    """Swap a staging flat index for a trained `factory` index once it holds enough vectors."""
+    base = faiss.downcast_index(index.index)
+    if not isinstance(base, faiss.IndexFlat) or factory == "Flat":
+        return index
+    needed = training_size(factory, index.d)
+    if not needed or index.ntotal < needed:
+        return index
+    vectors = base.reconstruct_n(0, index.ntotal)
+    trained = faiss.IndexIDMap2(faiss.index_factory(index.d, factory))
+    trained.train(vectors)
+    trained.add_with_ids(vectors, faiss.vector_to_array(index.id_map))  # ids (and metadata rows) unchanged
+    return trained
+
+
+def with_ids(index):
+    """Wrap a positional (pre-IDMap) index so a vector's id is its old position."""
+    if isinstance(index, faiss.IndexIDMap):
+        return index
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()  # IVF cannot reconstruct without one
+    except RuntimeError:
+        pass
+    vectors = index.reconstruct_n(0, index.ntotal)
+    base = faiss.clone_index(index)
+    base.reset()  # keeps IVF/PQ training
+    wrapped = faiss.IndexIDMap2(base)
+    wrapped.add_with_ids(vectors, np.arange(index.ntotal, dtype=np.int64))
+    return wrapped
+
+
+def tune_index(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """Apply search-time knobs where the index type has them (IVF: nprobe, HNSW: efSearch)."""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # not applicable to this index type
+
+
+class DocumentStore:
+    """
+    The FAISS index and its chunk metadata, kept resident in one server process.
+
+    The index is read once and reused across searches; it is re-read only when
+    index.bin's mtime or size changes (the indexer replaced it). With `mmap=True`
+    it is opened with faiss.IO_FLAG_MMAP so large indexes are paged in by the OS
+    instead of copied into memory. The index type comes from the indexer
+    (`new_index`/`train_if_ready`); `nprobe`/`ef_search` are applied on every
+    load. Chunk metadata lives in SQLite keyed by the FAISS id, so a search
+    fetches only its top-k rows.
+
+    Vectors are stored under explicit ids (IndexIDMap2), and every document owns
+    a contiguous id range recorded in the `documents` table. Re-indexing a changed
+    file removes its old range and appends a fresh one taken from a high-water
+    mark (`next_id` in the `state` table) that only grows, so ids are never reused,
+    not even after the document holding the highest ids is deleted:
+    a search running against the previous index.bin can miss a document that is
+    being replaced, but never resolves an id to the wrong chunk. Index types that
+    cannot remove vectors (HNSW) keep them as stale entries that searches skip
+    until the index is compacted.
+    """
+
+    def __init__(self, index_dir: Path, mmap: bool = False, nprobe: Optional[int] = None,
+                 ef_search: Optional[int] = None):
+        self.index_dir = Path(index_dir)
+        self.index_path = self.index_dir / INDEX_FILE
+        self.db_path = self.index_dir / METADATA_DB
+        self.mmap = mmap
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.reloads = 0
+        self._index = None
+        self._stale = 0
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    # ── Metadata ─────────────────────────────────────────
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.index_dir.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id INTEGER PRIMARY KEY, doc TEXT, chunk_id TEXT, chunk TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS documents (doc TEXT PRIMARY KEY, first_id INTEGER, count INTEGER)"
+            )
+            # Counters such as vectors removed or replaced since the index was last built
+            self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)")
+            self._db.commit()
+            self._import_legacy_metadata()
+            self._seed_next_id()
+        return self._db
+
+    def _import_legacy_metadata(self) -> None:
+        legacy = self.index_dir / LEGACY_METADATA_FILE
+        if legacy.exists() and not self._db.execute("SELECT 1 FROM chunks LIMIT 1").fetchone():
+            # metadata.json was a list aligned with the FAISS positions
+            self._insert(0, json.loads(legacy.read_text()))
+        if not self._db.execute("SELECT 1 FROM documents LIMIT 1").fetchone():
+            # Before id ranges were tracked, each file's chunks were appended in one contiguous run
+            self._db.execute(
+                "INSERT INTO documents (doc, first_id, count) SELECT doc, MIN(id), COUNT(*) FROM chunks GROUP BY doc"
+            )
+            self._db.commit()
+
+    def _seed_next_id(self) -> None:
+        # Stores written before the high-water mark was kept start it past every id still in use
+        self._db.execute(
+            "INSERT OR IGNORE INTO state (key, value) SELECT 'next_id', MAX("
+            "COALESCE((SELECT MAX(first_id + count) FROM documents), 0), "
+            "COALESCE((SELECT MAX(id) + 1 FROM chunks), 0))"
+        )
+        self._db.commit()
+
+    def _allocate_ids(self, count: int) -> int:
+        """First of `count` fresh ids; advances the mark in the caller's transaction."""
+        first_id = self._db.execute("SELECT value FROM state WHERE key = 'next_id'").fetchone()[0]
+        self._db.execute("UPDATE state SET value = ? WHERE key = 'next_id'", (first_id + count,))
+        return first_id
+
+    def has_metadata(self) -> bool:
+        return self.db_path.exists() or (self.index_dir / LEGACY_METADATA_FILE).exists()
+
+    def _insert(self, first_id: int, rows: Sequence[Dict[str, Any]]) -> None:
+        self._db.executemany(
+            "INSERT OR REPLACE INTO chunks (id, doc, chunk_id, chunk) VALUES (?, ?, ?, ?)",
+            [(first_id + i, r["doc"], r["chunk_id"], r["chunk"]) for i, r in enumerate(rows)],
+        )
+        self._db.commit()
+
+    def fetch(self, ids: Sequence[int]) -> List[Dict[str, Any]]:
+        """Metadata rows for the given FAISS ids, in the same order (unknown ids are skipped)."""
+        ids = [int(i) for i in ids if i >= 0]
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._conn().execute(
+                f"SELECT id, doc, chunk_id, chunk FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        by_id = {row[0]: {"doc": row[1], "chunk_id": row[2], "chunk": row[3]} for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def chunks(self) -> List[Tuple[int, str]]:
+        """(id, chunk text) for every stored chunk, in id order."""
+        with self._lock:
+            return self._conn().execute("SELECT id, chunk FROM chunks ORDER BY id").fetchall()
+
+    # ── Documents ────────────────────────────────────────
+    def documents(self) -> Dict[str, Tuple[int, int]]:
+        """Indexed file name -> (first id, chunk count)."""
+        with self._lock:
+            rows = self._conn().execute("SELECT doc, first_id, count FROM documents").fetchall()
+        return {doc: (first_id, count) for doc, first_id, count in rows}
+
+    def _remove_vectors(self, index, doc: str) -> int:
+        row = self._db.execute("SELECT first_id, count FROM documents WHERE doc = ?", (doc,)).fetchone()
+        if row is None or index is None:
+            return 0
+        first_id, count = row
+        try:
+            index.remove_ids(np.arange(first_id, first_id + count, dtype=np.int64))
+        except RuntimeError:
+            pass  # e.g. HNSW: the vectors stay as stale entries until compaction
+        return count
+
+    def replace_document(self, index, doc: str, vectors: np.ndarray, rows: Sequence[Dict[str, Any]]):
+        """
+        Remove `doc`'s vectors and metadata and store the new ones under a fresh id
+        range (no rows = just remove). Returns the index; call save_index afterwards.
+        """
+        with self._lock:
+            db = self._conn()
+            removed = self._remove_vectors(index, doc)
+            first_id = self._allocate_ids(len(rows)) if rows else 0
+            db.execute("DELETE FROM chunks WHERE doc = ?", (doc,))
+            db.execute("DELETE FROM documents WHERE doc = ?", (doc,))
+            if rows:
+                db.execute("INSERT INTO documents (doc, first_id, count) VALUES (?, ?, ?)", (doc, first_id, len(rows)))
+            if removed:
+                db.execute(
+                    "INSERT INTO state (key, value) VALUES ('removed', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                    (removed,),
+                )
+            self._insert(first_id, rows)  # commits the whole swap
+
+        if rows:
+            index.add_with_ids(vectors, np.arange(first_id, first_id + len(rows), dtype=np.int64))
+        return index
+
+    def remove_document(self, index, doc: str):
+        return self.replace_document(index, doc, None, [])
+
+    def fragmentation(self) -> float:
+        """Share of the index's vectors removed or replaced since it was last built."""
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT value FROM state WHERE key = 'removed'").fetchone()
+            live = db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        removed = row[0] if row else 0
+        return removed / (live + removed) if removed else 0.0
+
+    def mark_compacted(self) -> None:
+        with self._lock:
+            self._conn().execute("DELETE FROM state WHERE key = 'removed'")
+            self._db.commit()
+
+    def embedding_format(self) -> Optional[int]:
+        """Version of the vectors in the index (see EMBED_FORMAT_VERSION); None for indexes built before it was tracked."""
+        with self._lock:
+            row = self._conn().execute("SELECT value FROM state WHERE key = 'embed_format'").fetchone()
+        return row[0] if row else None
+
+    def set_embedding_format(self, version: int) -> None:
+        with self._lock:
+            self._conn().execute(
+                "INSERT INTO state (key, value) VALUES ('embed_format', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (version,),
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        """Forget every document and its chunks before a full rebuild (ids keep counting up)."""
+        with self._lock:
+            db = self._conn()
+            db.execute("DELETE FROM chunks")
+            db.execute("DELETE FROM documents")
+            db.execute("DELETE FROM state WHERE key IN ('removed', 'embed_format')")
+            db.commit()
+
+    # ── Index ────────────────────────────────────────────
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.index_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_index(self):
+        if self.mmap:
+            try:
+                return faiss.read_index(str(self.index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                pass  # this index type cannot be mapped; read it normally
+        return faiss.read_index(str(self.index_path))
+
+    def index(self):
+        """The resident index, re-read only if index.bin changed since the last call (None if missing)."""
+        stamp = self._file_stamp()
+        with self._lock:
+            if stamp != self._stamp:
+                self._index = self._read_index() if stamp else None
+                self._stamp = stamp
+                self.reloads += 1
+                if self._index is not None:
+                    tune_index(self._index, self.nprobe, self.ef_search)
+                    live = self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+                    self._stale = max(0, self._index.ntotal - live)
+            return self._index
+
+    def load_for_update(self):
+        """A private, writable, ID-mapped copy of the index for the indexer (None if there is none yet)."""
+        if not self.index_path.exists():
+            return None
+        return with_ids(faiss.read_index(str(self.index_path)))
+
+    def save_index(self, index) -> None:
+        # Write beside the live file and swap, so readers (and mmaps) never see a partial index
+        tmp = self.index_path.with_suffix(".tmp")
+        faiss.write_index(index, str(tmp))
+        os.replace(tmp, self.index_path)
+
+    def search(self, query_vec: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        index = self.index()
+        if index is None or index.ntotal == 0:
+            return []
+        # Stale vectors (skipped by fetch) could crowd out live ones, so ask for that many extra
+        _, ids = index.search(np.asarray(query_vec, dtype=np.float32).reshape(1, -1), min(index.ntotal, k + self._stale))
+        return self.fetch(ids[0])[:k]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+
+import faiss
+import numpy as np
+import pytest
+
+from doc_store import METADATA_DB, DocumentStore, new_index, train_if_ready
+
+DIM = 8
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).random((count, DIM), dtype=np.float32)
+
+
+def rows(doc, count):
+    return [{"doc": doc, "chunk_id": f"{doc}_{i}", "chunk": f"{doc} chunk {i}"} for i in range(count)]
+
+
+def index_ids(index):
+    return sorted(faiss.vector_to_array(index.id_map).tolist())
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DocumentStore(tmp_path)
+    yield store
+    store.close()
+
+
+def add(store, index, doc, count, seed=0):
+    return store.replace_document(index, doc, vectors(count, seed), rows(doc, count))
+
+
+def test_documents_get_consecutive_id_ranges(store):
+    index = new_index(DIM)
+    index = add(store, index, "a.md", 3)
+    index = add(store, index, "b.md", 2)
+    assert store.documents() == {"a.md": (0, 3), "b.md": (3, 2)}
+    assert index_ids(index) == [0, 1, 2, 3, 4]
+    assert [row["chunk_id"] for row in store.fetch([4, 0])] == ["b.md_1", "a.md_0"]
+
+
+def test_replacing_a_document_moves_it_to_fresh_ids(store):
+    index = new_index(DIM)
+    index = add(store, index, "a.md", 3)
+    index = add(store, index, "b.md", 2)
+    index = add(store, index, "a.md", 2, seed=1)
+    assert store.documents() == {"a.md": (5, 2), "b.md": (3, 2)}
+    assert index_ids(index) == [3, 4, 5, 6]
+    assert store.fetch([0, 1, 2]) == []
+
+
+def test_removing_the_highest_range_does_not_free_its_ids(store):
+    index = new_index(DIM)
+    index = add(store, index, "a.md", 3)
+    index = add(store, index, "b.md", 3)
+    index = store.remove_document(index, "b.md")
+    index = add(store, index, "c.md", 2)
+    # A server still holding the previous index.bin may return ids 3..5; they must not resolve to c.md
+    assert store.documents() == {"a.md": (0, 3), "c.md": (6, 2)}
+    assert store.fetch([3, 4, 5]) == []
+    assert index_ids(index) == [0, 1, 2, 6, 7]
+
+
+def test_high_water_mark_survives_reopen_and_clear(tmp_path):
+    store = DocumentStore(tmp_path)
+    index = add(store, new_index(DIM), "a.md", 4)
+    store.remove_document(index, "a.md")
+    store.close()
+
+    store = DocumentStore(tmp_path)
+    store.clear()
+    store.mark_compacted()
+    add(store, new_index(DIM), "b.md", 1)
+    assert store.documents() == {"b.md": (4, 1)}
+    store.close()
+
+
+def test_legacy_store_starts_past_its_ids(tmp_path):
+    (tmp_path / "metadata.json").write_text(json.dumps(rows("a.md", 2) + rows("b.md", 3)))
+    store = DocumentStore(tmp_path)
+    assert store.documents() == {"a.md": (0, 2), "b.md": (2, 3)}
+    add(store, new_index(DIM), "c.md", 1)
+    assert store.documents()["c.md"] == (5, 1)
+    store.close()
+
+    db = sqlite3.connect(tmp_path / METADATA_DB)
+    assert db.execute("SELECT value FROM state WHERE key = 'next_id'").fetchone() == (6,)
+    db.close()
+
+
+def test_hnsw_keeps_stale_vectors_that_search_skips(store):
+    data = vectors(6)
+    index = new_index(DIM, "HNSW32")
+    index = store.replace_document(index, "a.md", data[:3], rows("a.md", 3))
+    index = store.replace_document(index, "b.md", data[3:], rows("b.md", 3))
+    index = store.replace_document(index, "a.md", data[:3], rows("a.md", 3))  # HNSW cannot remove ids 0..2
+    assert index.ntotal == 9
+    store.save_index(index)
+
+    # Searching all 6 live chunks still returns 6 even though 3 of the 9 neighbours are stale
+    hits = store.search(data[0], k=6)
+    assert hits[0]["chunk_id"] == "a.md_0"
+    assert sorted(hit["chunk_id"] for hit in hits) == sorted(r["chunk_id"] for r in rows("a.md", 3) + rows("b.md", 3))
+
+
+def test_fragmentation_and_compaction_keep_ids(store):
+    data = vectors(8)
+    index = new_index(DIM, "HNSW32")
+    index = store.replace_document(index, "a.md", data[:4], rows("a.md", 4))
+    index = store.replace_document(index, "b.md", data[4:], rows("b.md", 4))
+    index = store.remove_document(index, "a.md")
+    assert store.fragmentation() == pytest.approx(0.5)
+
+    # As compact_index does: rebuild from the live chunks under their existing ids
+    live = store.chunks()
+    compacted = new_index(DIM, "HNSW32")
+    compacted.add_with_ids(data[4:], np.array([vector_id for vector_id, _ in live], dtype=np.int64))
+    store.save_index(compacted)
+    store.mark_compacted()
+
+    assert store.fragmentation() == 0.0
+    assert index_ids(store.index()) == [4, 5, 6, 7]
+    hits = store.search(data[5], k=1)
+    assert hits[0]["chunk_id"] == "b.md_1"
+    index = add(store, store.load_for_update(), "c.md", 1)
+    assert store.documents()["c.md"] == (8, 1)
+
+
+def test_training_keeps_ids(store):
+    index = new_index(DIM, "IVF1,Flat")
+    assert isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)  # staged until trainable
+    index = add(store, index, "a.md", 10)
+    index = store.remove_document(index, "a.md")
+    index = add(store, index, "b.md", 40, seed=2)
+    trained = train_if_ready(index, "IVF1,Flat")
+    assert trained is not index and trained.is_trained
+    assert index_ids(trained) == list(range(10, 50))
@@ -0,0 +1,103 @@
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MEMORY_ENTRIES = 4096  # recent vectors (mostly repeated queries) kept in process
+SQLITE_MAX_PARAMS = 500  # keys per IN (...) lookup, well under SQLite's variable limit
+
+
+class EmbeddingCache:
+    """
+    Content-addressed store of embedding vectors keyed by (model, sha256(text)).
+
+    Vectors live in SQLite as raw float32 blobs, so the indexer and the RAG server
+    (separate processes) share one file: a re-indexed document only pays for the
+    chunks whose text actually changed, and repeated queries skip the embedding
+    call. A small LRU in front serves hot keys without touching the database.
+    The connection is shared across threads (search runs in `asyncio.to_thread`,
+    embedding batches in a pool), so access goes through a lock.
+    """
+
+    def __init__(self, sqlite_path: str, memory_entries: int = MEMORY_ENTRIES):
+        Path(sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")  # indexer writes while the server reads
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT, digest TEXT, dim INTEGER, created_at REAL, vector BLOB, PRIMARY KEY (model, digest))"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Cached vector for each text, or None where it has not been embedded yet."""
+        digests = [self.digest(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            missing = []
+            for d in set(digests):
+                vector = self._memory.get((model, d))
+                if vector is not None:
+                    self._memory.move_to_end((model, d))
+                    found[d] = vector
+                else:
+                    missing.append(d)
+
+            for i in range(0, len(missing), SQLITE_MAX_PARAMS):
+                part = missing[i:i + SQLITE_MAX_PARAMS]
+                rows = self._db.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({','.join('?' * len(part))})",
+                    (model, *part),
+                ).fetchall()
+                for d, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[d] = vector
+                    self._remember((model, d), vector)
+
+            results = [found.get(d) for d in digests]
+            hits = sum(v is not None for v in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[np.ndarray]) -> None:
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                d = self.digest(text)
+                self._remember((model, d), vector)
+                rows.append((model, d, vector.shape[0], now, vector.tobytes()))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, digest, dim, created_at, vector) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
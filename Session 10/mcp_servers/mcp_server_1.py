@@ -16,6 +16,9 @@ import sqlite3
 from io import StringIO
 from tqdm import tqdm
 import hashlib
+from collections import defaultdict
+
+import tracing
 
 # Models
 from models import (
@@ -37,9 +40,12 @@ from models import (
     FibonacciInput, FibonacciOutput,
     PythonCodeInput, PythonCodeOutput,
     ShellCommandInput,
+    EvaluateBatchInput, EvaluateBatchOutput,
+    ExpressionDagInput, ExpressionDagOutput,
 )
 
 mcp = FastMCP("Calculator")
+tracing.trace_tools(mcp)  # spans for every tool body when TRACE_FILE is set
 
 # ------------------- Tools -------------------
 
@@ -153,6 +159,106 @@ def fibonacci_numbers(input: FibonacciInput) -> FibonacciOutput:
 
 
 
+# ------------------- Batched Math -------------------
+
+# op → (the scalar tool's arithmetic, its input model, its output model)
+MATH_OPS = {
+    "add": (lambda a, b: a + b, AddInput, AddOutput),
+    "subtract": (lambda a, b: a - b, SubtractInput, SubtractOutput),
+    "multiply": (lambda a, b: a * b, MultiplyInput, MultiplyOutput),
+    "divide": (lambda a, b: a / b, DivideInput, DivideOutput),
+    "power": (lambda a, b: a ** b, PowerInput, PowerOutput),
+    "remainder": (lambda a, b: a % b, RemainderInput, RemainderOutput),
+    "mine": (lambda a, b: a - b - b, MineInput, MineOutput),
+    "factorial": (math.factorial, FactorialInput, FactorialOutput),
+    "cbrt": (lambda a: a ** (1/3), CbrtInput, CbrtOutput),
+    "sin": (math.sin, SinInput, SinOutput),
+    "cos": (math.cos, CosInput, CosOutput),
+    "tan": (math.tan, TanInput, TanOutput),
+}
+MATH_UFUNCS = {op: np.frompyfunc(fn, len(model.model_fields), 1) for op, (fn, model, _) in MATH_OPS.items()}
+
+
+def _parse_operand(value, index: int, values: list):
+    """Resolve an operand: '$j' → result of operation j (< index); anything else is left to the op's input model."""
+    if isinstance(value, str) and value.strip().startswith("$"):
+        ref = int(value.strip()[1:])
+        if not 0 <= ref < index:
+            raise ValueError(f"Operation {index} references ${ref}, which is not an earlier operation")
+        return values[ref]
+    return value
+
+
+def evaluate_operations(operations: list) -> list:
+    """
+    Evaluate a list of (op, args) operations in one pass, with the same results
+    and errors as calling each op's own tool: arguments are validated by the
+    tool's input model (so floats with a fraction are rejected like in `add`),
+    and results by its output model. Operations are grouped by dependency level
+    and op, and each group is computed with one NumPy ufunc call over Python
+    objects, so ints stay exact and e.g. division by zero raises.
+    """
+    levels = []
+    for i, (op, args) in enumerate(operations):
+        if op not in MATH_OPS:
+            raise ValueError(f"Unsupported operation '{op}'. Supported: {sorted(MATH_OPS)}")
+        arity = MATH_UFUNCS[op].nin
+        if len(args) != arity:
+            raise ValueError(f"Operation {i} '{op}' expects {arity} args, got {len(args)}")
+        refs = [int(a.strip()[1:]) for a in args if isinstance(a, str) and a.strip().startswith("$")]
+        if any(not 0 <= r < i for r in refs):
+            raise ValueError(f"Operation {i} may only reference earlier operations")
+        levels.append(1 + max((levels[r] for r in refs), default=0))
+
+    groups = defaultdict(list)
+    for i, (op, _) in enumerate(operations):
+        groups[(levels[i], op)].append(i)
+
+    values = [None] * len(operations)
+    for level, op in sorted(groups):
+        indices = groups[(level, op)]
+        _, input_model, output_model = MATH_OPS[op]
+        fields = list(input_model.model_fields)
+        inputs = [
+            input_model(**dict(zip(fields, (_parse_operand(arg, i, values) for arg in operations[i][1]))))
+            for i in indices
+        ]
+        columns = [np.array([getattr(x, field) for x in inputs], dtype=object) for field in fields]
+        for i, value in zip(indices, MATH_UFUNCS[op](*columns)):
+            values[i] = output_model(result=value).result
+    return values
+
+
+def flatten_expression(node, operations: list):
+    """Post-order flatten an expression tree into `operations`; returns an operand for the node."""
+    if isinstance(node, dict):
+        if "op" not in node:
+            raise ValueError(f"Expression node is missing 'op': {node}")
+        args = [flatten_expression(arg, operations) for arg in node.get("args", [])]
+        operations.append((node["op"], args))
+        return f"${len(operations) - 1}"
+    return node
+
+
+@mcp.tool()
+def evaluate_batch(input: EvaluateBatchInput) -> EvaluateBatchOutput:
+    """Run many math operations in one call. Each op is {"op": "add", "args": [2, 3]}; use "$i" as an arg to reuse the result of operation i. """
+    print("CALLED: evaluate_batch(EvaluateBatchInput) -> EvaluateBatchOutput")
+    results = evaluate_operations([(operation.op, operation.args) for operation in input.operations])
+    return EvaluateBatchOutput(results=results)
+
+@mcp.tool()
+def eval_expression_dag(input: ExpressionDagInput) -> ExpressionDagOutput:
+    """Evaluate a nested math expression in one call, e.g. {"op": "add", "args": [{"op": "multiply", "args": [2, 3]}, 4]}. """
+    print("CALLED: eval_expression_dag(ExpressionDagInput) -> ExpressionDagOutput")
+    operations = []
+    root = flatten_expression(input.expression, operations)
+    if not operations:
+        return ExpressionDagOutput(result=_parse_operand(root, 0, []))
+    return ExpressionDagOutput(result=evaluate_operations(operations)[-1])
+
+
+
 # @mcp.tool()
 # def run_python_sandbox(input: PythonCodeInput) -> PythonCodeOutput:
 #     """Run math code in Python sandbox. """
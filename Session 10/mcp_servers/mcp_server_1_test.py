@@ -0,0 +1,50 @@
+import pytest
+
+import mcp_server_1
+from mcp_server_1 import MATH_OPS, evaluate_operations
+
+
+def scalar(op, args):
+    """What the op's own tool returns (or raises) for these arguments."""
+    _, input_model, _ = MATH_OPS[op]
+    return getattr(mcp_server_1, op)(input_model(**dict(zip(input_model.model_fields, args)))).result
+
+
+def outcome(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return type(e)
+
+
+CASES = [
+    ("add", [2, 3]), ("add", [2.0, "3"]), ("add", [2.5, 1]), ("add", [10**30, 1]),
+    ("subtract", [2, 5]), ("multiply", [10**20, 10**20]), ("mine", [10, 3]),
+    ("divide", [7, 2]), ("divide", [1, 0]), ("remainder", [7, 0]), ("remainder", [-7, 3]),
+    ("power", [2, 100]), ("power", [2, -1]), ("factorial", [20]), ("factorial", [-1]), ("factorial", [2.5]),
+    ("cbrt", [27]), ("cbrt", [-8]), ("sin", [1]), ("cos", [0]), ("tan", [1]), ("sin", [0.5]),
+]
+
+
+@pytest.mark.parametrize("op, args", CASES)
+def test_each_op_matches_its_tool(op, args):
+    batched = outcome(lambda: evaluate_operations([(op, args)])[0])
+    assert batched == outcome(scalar, op, args)
+
+
+def test_a_group_mixing_exact_and_inexact_results_matches_the_tools():
+    ops = [("divide", [6, 3]), ("divide", [7, 2]), ("power", [3, 40]), ("power", [2, 3]), ("cbrt", [27]), ("sin", [1])]
+    assert evaluate_operations(ops) == [scalar(op, args) for op, args in ops]
+
+
+def test_references_feed_earlier_results_through_the_next_tools_input():
+    assert evaluate_operations([("divide", [6, 3]), ("add", ["$0", 1])]) == [2.0, 3]
+    with pytest.raises(ValueError):
+        evaluate_operations([("divide", [7, 2]), ("add", ["$0", 1])])  # 3.5 is not an int
+    with pytest.raises(ValueError, match="earlier operations"):
+        evaluate_operations([("add", ["$1", 1]), ("add", [1, 1])])
+
+
+def test_division_by_zero_in_a_group_raises():
+    with pytest.raises(ZeroDivisionError):
+        evaluate_operations([("divide", [1, 2]), ("divide", [1, 0])])
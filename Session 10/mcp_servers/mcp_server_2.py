@@ -13,6 +13,11 @@ from pathlib import Path
 import requests
 from markitdown import MarkItDown
 import time
+import tracing
+from embedding_cache import EmbeddingCache
+from caption_cache import CaptionCache
+from chunking import markdown_chunks, similarity_chunks
+from doc_store import DocumentStore, COMPACT_THRESHOLD, new_index, train_if_ready
 from models import AddInput, AddOutput, SqrtInput, SqrtOutput, StringsToIntsInput, StringsToIntsOutput, ExpSumInput, ExpSumOutput, PythonCodeInput, PythonCodeOutput, UrlInput, FilePathInput, MarkdownInput, MarkdownOutput, ChunkListOutput, SearchDocumentsInput
 from tqdm import tqdm
 import hashlib
@@ -20,17 +25,39 @@ from pydantic import BaseModel
 import subprocess
 import sqlite3
 import trafilatura
+import pymupdf
 import pymupdf4llm
 import re
 import base64 # ollama needs base64-encoded-image
+import asyncio
+import queue
+import threading
+import multiprocessing
+import errno
+from contextlib import contextmanager
+from collections import deque
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 
 mcp = FastMCP("Calculator")
+tracing.trace_tools(mcp)  # spans for every tool body when TRACE_FILE is set
 
-EMBED_URL = "http://localhost:11434/api/embeddings"
+EMBED_URL = "http://localhost:11434/api/embed"  # takes a list of inputs per request
+LEGACY_EMBED_URL = "http://localhost:11434/api/embeddings"  # one prompt per request (Ollama < 0.3)
 OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
 OLLAMA_URL = "http://localhost:11434/api/generate"
 EMBED_MODEL = "nomic-embed-text"
+# Bump when stored vectors stop being comparable with new ones (endpoint, model output or normalisation);
+# the embedding cache is keyed on it and an index built with another version is re-embedded.
+# 1: raw /api/embeddings vectors, 2: L2-normalised vectors from either endpoint.
+EMBED_FORMAT_VERSION = 2
+EMBED_CACHE_MODEL = f"{EMBED_MODEL}@v{EMBED_FORMAT_VERSION}"
 GEMMA_MODEL = "gemma3:12b"
 PHI_MODEL = "phi4:latest"
 QWEN_MODEL = "qwen2.5:32b-instruct-q4_0"
@@ -38,13 +65,183 @@ CHUNK_SIZE = 256
 CHUNK_OVERLAP = 40
 MAX_CHUNK_LENGTH = 512  # characters
 TOP_K = 3  # FAISS top-K matches
+EMBED_BATCH_SIZE = 32  # chunks per embedding request
+EMBED_MAX_IN_FLIGHT = 4  # concurrent batch requests, enough to keep the embedding server busy
 ROOT = Path(__file__).parent.resolve()
+EMBED_CACHE_FILE = ROOT / "faiss_index" / "embedding_cache.sqlite"  # shared by the indexer and search
+CAPTION_CACHE_FILE = ROOT / "faiss_index" / "caption_cache.sqlite"
+INDEX_BUILD_LOCK = ROOT / "faiss_index" / "build.lock"  # held while any process builds or compacts the index
+CAPTION_MAX_IN_FLIGHT = 4  # vision requests in flight at once, shared by all extraction worker processes
+FAISS_MMAP = False  # map index.bin instead of reading it into memory (for indexes larger than RAM)
+FAISS_INDEX_FACTORY = "Flat"  # exact search; "IVF256,Flat", "IVF256,PQ32" or "HNSW32" for large corpora (see index_benchmark.py)
+FAISS_NPROBE = 16  # IVF lists scanned per query
+FAISS_EF_SEARCH = 64  # HNSW candidate list size per query
+CHUNK_STRATEGY = "markdown"  # "markdown" (headings/paragraphs), "similarity" (embedding breakpoints) or "llm" (semantic_merge, slow)
+INGEST_EXTRACT_WORKERS = min(4, os.cpu_count() or 1)  # processes converting PDF/HTML/DOCX to markdown
+INGEST_EMBED_WORKERS = 2  # documents embedded at once; their batches share EMBED_MAX_IN_FLIGHT
+INGEST_QUEUE_SIZE = 8  # extracted documents waiting between stages; bounds memory when embedding lags
+INGEST_COMMIT_SECONDS = 5  # how often the writer saves index.bin while documents keep arriving
+PDF_PAGE_BATCH = 8  # pages converted per task; bounds the markdown and images held in memory at once
+PDF_WORKERS = INGEST_EXTRACT_WORKERS  # processes extract_pdf uses for PDFs longer than two batches
+
+# One pooled HTTP session for every Ollama call, sized for the in-flight embedding batches
+http = requests.Session()
+http.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=EMBED_MAX_IN_FLIGHT * 2))
+
+
+_legacy_embed_api = False
+
+
+def _normalize(embeddings: list[list[float]]) -> np.ndarray:
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def _embed_batch(texts: list[str]) -> np.ndarray:
+    """
+    One row per text, L2-normalised: /api/embed normalises and the legacy endpoint
+    does not, so both are normalised here to keep every vector in the index comparable.
+    """
+    global _legacy_embed_api
+    with tracing.span("embedding.http", batch=len(texts), chars=sum(len(t) for t in texts)):
+        if not _legacy_embed_api:
+            result = http.post(EMBED_URL, json={"model": EMBED_MODEL, "input": texts})
+            if result.status_code != 404:
+                result.raise_for_status()
+                return _normalize(result.json()["embeddings"])
+            mcp_log("WARN", "Ollama has no /api/embed; falling back to one request per chunk")
+            _legacy_embed_api = True
+
+        embeddings = []
+        for text in texts:
+            result = http.post(LEGACY_EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
+            result.raise_for_status()
+            embeddings.append(result.json()["embedding"])
+        return _normalize(embeddings)
+
+
+def _embed_batches(texts: list[str], batch_size: int, max_in_flight: int, progress=None,
+                   pool: ThreadPoolExecutor = None) -> list[list[float]]:
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    def embed(batch):
+        vectors = _embed_batch(batch)
+        if progress is not None:
+            progress.update(len(batch))
+        return vectors
+
+    if pool is not None:
+        results = list(pool.map(embed, batches))
+    elif len(batches) <= 1 or max_in_flight <= 1:
+        results = [embed(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(batches))) as pool:
+            results = list(pool.map(embed, batches))  # map keeps batch order
+    return [vector for batch in results for vector in batch]
+
+
+# Searches run in worker threads (asyncio.to_thread), so the lazy singletons below are created under a lock
+_singleton_lock = threading.Lock()
+_embedding_cache = None
+
+
+def embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _singleton_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(str(EMBED_CACHE_FILE))
+    return _embedding_cache
+
+
+_doc_store = None
+
+
+def doc_store() -> DocumentStore:
+    """The process-wide index + metadata, loaded on first search and kept resident."""
+    global _doc_store
+    if _doc_store is None:
+        with _singleton_lock:
+            if _doc_store is None:
+                _doc_store = DocumentStore(ROOT / "faiss_index", mmap=FAISS_MMAP,
+                                           nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH)
+    return _doc_store
+
+
+_build_lock = threading.RLock()
+_build_lock_depth = 0
+
+
+@contextmanager
+def index_build_lock():
+    """
+    Hold INDEX_BUILD_LOCK: one index build or compaction at a time across the
+    threads of this process, the server's worker processes and
+    build_document_index.py. Re-entrant within a thread (process_documents
+    compacts while holding it). The OS drops the file lock if the holder dies.
+    """
+    global _build_lock_depth
+    with _build_lock:
+        if _build_lock_depth:
+            _build_lock_depth += 1
+            try:
+                yield
+            finally:
+                _build_lock_depth -= 1
+            return
+
+        INDEX_BUILD_LOCK.parent.mkdir(parents=True, exist_ok=True)
+        with open(INDEX_BUILD_LOCK, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError as e:
+                        if e.errno != errno.EDEADLOCK:  # LK_LOCK gives up after ~10s with EDEADLOCK; keep waiting
+                            raise
+            _build_lock_depth = 1
+            try:
+                yield
+            finally:
+                _build_lock_depth = 0
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def get_embeddings(texts: list[str], batch_size: int = EMBED_BATCH_SIZE,
+                   max_in_flight: int = EMBED_MAX_IN_FLIGHT, progress=None,
+                   pool: ThreadPoolExecutor = None) -> np.ndarray:
+    """
+    Embed many texts, rows in the order of `texts`. Texts already in the embedding
+    cache are not sent; the rest (deduplicated) go out in batches with up to
+    `max_in_flight` requests running at once, and are cached for next time.
+    Pass a shared `pool` to bound in-flight batches across several callers instead.
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+
+    cache = embedding_cache()
+    vectors = cache.get_many(EMBED_CACHE_MODEL, texts)
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if progress is not None:
+        progress.update(len(texts) - len(missing))
+
+    if missing:
+        fresh = dict(zip(missing, _embed_batches(missing, batch_size, max_in_flight, progress, pool)))
+        cache.put_many(EMBED_CACHE_MODEL, missing, [fresh[t] for t in missing])
+        vectors = [fresh[t] if v is None else v for t, v in zip(texts, vectors)]
+    return np.array(vectors, dtype=np.float32)
 
 
 def get_embedding(text: str) -> np.ndarray:
-    result = requests.post(EMBED_URL, json={"model": EMBED_MODEL, "prompt": text})
-    result.raise_for_status()
-    return np.array(result.json()["embedding"], dtype=np.float32)
+    return get_embeddings([text])[0]
 
 def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     words = text.split()
@@ -84,7 +281,7 @@ Just respond in one word (Yes or No), and do not provide any further explanation
     print(f"  Chunk {index} → {chunk1[:60]}{'...' if len(chunk1) > 60 else ''}")
     print(f"  Chunk {index+1} → {chunk2[:60]}{'...' if len(chunk2) > 60 else ''}")
 
-    result = requests.post(OLLAMA_CHAT_URL, json={
+    result = http.post(OLLAMA_CHAT_URL, json={
         "model": PHI_MODEL,
         "messages": [{"role": "user", "content": prompt}],
         "stream": False
@@ -104,94 +301,173 @@ def search_stored_documents(input: SearchDocumentsInput) -> list[str]:
     query = input.query
     mcp_log("SEARCH", f"Query: {query}")
     try:
-        index = faiss.read_index(str(ROOT / "faiss_index" / "index.bin"))
-        metadata = json.loads((ROOT / "faiss_index" / "metadata.json").read_text())
-        query_vec = get_embedding(query ).reshape(1, -1)
-        D, I = index.search(query_vec, k=5)
-        results = []
-        for idx in I[0]:
-            data = metadata[idx]
-            results.append(f"{data['chunk']}\n[Source: {data['doc']}, ID: {data['chunk_id']}]")
-        return results
+        store = doc_store()
+        with tracing.span("faiss.load") as load_span:
+            reloads = store.reloads
+            store.index()  # no-op unless index.bin changed since the last search
+            load_span["attrs"]["reloaded"] = store.reloads != reloads
+        query_vec = get_embedding(query)
+        with tracing.span("faiss.search", k=5):
+            hits = store.search(query_vec, k=5)
+        return [f"{data['chunk']}\n[Source: {data['doc']}, ID: {data['chunk_id']}]" for data in hits]
     except Exception as e:
         return [f"ERROR: Failed to search: {str(e)}"]
 
 
 @mcp.tool()
-def search_stored_documents_rag(input: SearchDocumentsInput) -> list[str]:
+async def search_stored_documents_rag(input: SearchDocumentsInput) -> list[str]:
     """Search documents using RAG to get relevant extracts. Usage: input={"input": {"query": "your query"}} result = await mcp.call_tool('search_stored_documents_rag', input)"""
     mcp_log("RAG_SEARCH", f"RAG Query: {input.query}")
-    # Call the existing function with the same input
-    return search_stored_documents(input)
+    # Run the blocking search off the event loop so concurrent requests on one session overlap
+    return await asyncio.to_thread(search_stored_documents, input)
 
 
-def caption_image(img_url_or_path: str) -> str:
-    mcp_log("CAPTION", f"🖼️ Attempting to caption image: {img_url_or_path}")
+_caption_cache = None
+
+
+def caption_cache() -> CaptionCache:
+    global _caption_cache
+    if _caption_cache is None:
+        with _singleton_lock:
+            if _caption_cache is None:
+                _caption_cache = CaptionCache(str(CAPTION_CACHE_FILE))
+    return _caption_cache
 
-    full_path = Path(__file__).parent / "documents" / img_url_or_path
-    full_path = full_path.resolve()
 
+_caption_workers = CAPTION_MAX_IN_FLIGHT  # this process's share; extraction workers get theirs from extract_pool
+
+
+def _init_extract_worker(caption_workers: int) -> None:
+    global _caption_workers
+    _caption_workers = caption_workers
+
+
+def extract_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    A pool of extraction processes that split CAPTION_MAX_IN_FLIGHT between them,
+    so documents captioned in parallel never put more vision requests on Ollama
+    than one process captioning alone (at least one each if workers exceed the cap).
+    """
+    # spawn, not fork: this process already runs threads (embedding, HTTP pool)
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_extract_worker,
+                               initargs=(max(1, CAPTION_MAX_IN_FLIGHT // workers),))
+
+
+def _load_image(img_url_or_path: str) -> bytes | None:
+    # Web images (from convert_webpage_url_into_markdown) are downloaded; only local paths are checked on disk
+    if img_url_or_path.startswith("http"):
+        result = http.get(img_url_or_path)
+        result.raise_for_status()
+        return result.content
+
+    full_path = (ROOT / "documents" / img_url_or_path).resolve()
     if not full_path.exists():
         mcp_log("ERROR", f"❌ Image file not found: {full_path}")
-        return f"[Image file not found: {img_url_or_path}]"
+        return None
+    return full_path.read_bytes()
 
-    try:
-        if img_url_or_path.startswith("http"): # for extract_web_pages
-            result = requests.get(img_url_or_path)
-            encoded_image = base64.b64encode(result.content).decode("utf-8")
-        else:
-            with open(full_path, "rb") as img_file:
-                encoded_image = base64.b64encode(img_file.read()).decode("utf-8")
 
+def _caption_bytes(image: bytes, label: str) -> str | None:
+    """Ask the vision model for a caption; None if it fails or returns nothing."""
+    try:
         # Set stream=True to get the full generator-style output
-        with requests.post(OLLAMA_URL, json={
+        with http.post(OLLAMA_URL, json={
             "model": GEMMA_MODEL,
             "prompt": "If there is lot of text in the image, then ONLY reply back with exact text in the image, else Describe the image such that your result can replace 'alt-text' for it. Only explain the contents of the image and provide no further explaination.",
-            "images": [encoded_image],
+            "images": [base64.b64encode(image).decode("utf-8")],
             "stream": True
         }, stream=True) as result:
 
             caption_parts = []
+            # One JSON object per line; the text is in "response" and the last line has "done": true
             for line in result.iter_lines():
                 if not line:
                     continue
                 try:
                     data = json.loads(line)
-                    caption_parts.append(data.get("result", ""))
+                    caption_parts.append(data.get("response", ""))
                     if data.get("done", False):
                         break
                 except json.JSONDecodeError:
                     continue  # silently skip malformed lines
 
             caption = "".join(caption_parts).strip()
-            mcp_log("CAPTION", f"✅ Caption generated: {caption}")
-            return caption if caption else "[No caption returned]"
+            mcp_log("CAPTION", f"✅ Caption generated for {label}: {caption}")
+            return caption or None
 
     except Exception as e:
-        mcp_log("ERROR", f"⚠️ Failed to caption image {img_url_or_path}: {e}")
-        return f"[Image could not be processed: {img_url_or_path}]"
+        mcp_log("ERROR", f"⚠️ Failed to caption image {label}: {e}")
+        return None
+
+
+def caption_images(sources: list[str]) -> dict[str, str]:
+    """
+    Caption many images at once: each distinct image (by content hash) is looked
+    up in the caption cache, and the misses are sent to the vision model with up
+    to this process's share of CAPTION_MAX_IN_FLIGHT requests in flight.
+    Returns src -> caption text.
+    """
+    cache = caption_cache()
+    captions = {}
+    digests = {}  # src -> content hash
+    known = {}  # content hash -> cached caption
+    images = {}  # content hash -> bytes still to caption
+    for src in dict.fromkeys(sources):
+        try:
+            image = _load_image(src)
+        except Exception as e:
+            mcp_log("ERROR", f"⚠️ Failed to load image {src}: {e}")
+            image = None
+        if image is None:
+            captions[src] = f"[Image could not be processed: {src}]"
+            continue
+        digest = CaptionCache.digest(image)
+        digests[src] = digest
+        if digest in known or digest in images:
+            continue
+        cached = cache.get(GEMMA_MODEL, digest)
+        if cached is None:
+            images[digest] = image
+        else:
+            known[digest] = cached
+
+    if images:
+        mcp_log("CAPTION", f"🖼️ Captioning {len(images)} image(s), {len(known)} from cache")
+        with ThreadPoolExecutor(min(_caption_workers, len(images)), thread_name_prefix="caption") as pool:
+            fresh = dict(zip(images, pool.map(lambda d: _caption_bytes(images[d], d[:12]), images)))
+        for digest, caption in fresh.items():
+            if caption:
+                cache.put(GEMMA_MODEL, digest, caption)
+                known[digest] = caption
 
+    for src, digest in digests.items():
+        captions[src] = known.get(digest, "[No caption returned]")
+    return captions
 
 
+def caption_image(img_url_or_path: str) -> str:
+    mcp_log("CAPTION", f"🖼️ Attempting to caption image: {img_url_or_path}")
+    return caption_images([img_url_or_path])[img_url_or_path]
 
 
 def replace_images_with_captions(markdown: str) -> str:
-    def replace(match):
-        alt, src = match.group(1), match.group(2)
+    pattern = r'!\[(.*?)\]\((.*?)\)'
+    captions = caption_images([match.group(2) for match in re.finditer(pattern, markdown)])
+
+    for src in captions:
+        # Attempt to delete only if local and file exists
+        if src.startswith("http"):
+            continue
         try:
-            caption = caption_image(src)
-            # Attempt to delete only if local and file exists
-            if not src.startswith("http"):
-                img_path = Path(__file__).parent / "documents" / src
-                if img_path.exists():
-                    img_path.unlink()
-                    mcp_log("INFO", f"🗑️ Deleted image after captioning: {img_path}")
-            return f"**Image:** {caption}"
+            img_path = Path(__file__).parent / "documents" / src
+            if img_path.exists():
+                img_path.unlink()
+                mcp_log("INFO", f"🗑️ Deleted image after captioning: {img_path}")
         except Exception as e:
             mcp_log("WARN", f"Image deletion failed: {e}")
-            return f"[Image could not be processed: {src}]"
 
-    return re.sub(r'!\[(.*?)\]\((.*?)\)', replace, markdown)
+    return re.sub(pattern, lambda match: f"**Image:** {captions[match.group(2)]}", markdown)
 
 
 @mcp.tool()
@@ -221,13 +497,25 @@ def extract_pdf(input: FilePathInput) -> MarkdownOutput:
     if not os.path.exists(input.file_path):
         return MarkdownOutput(markdown=f"File not found: {input.file_path}")
 
+    return MarkdownOutput(markdown="\n\n".join(iter_pdf_markdown(input.file_path)))
+
+
+def pdf_page_batches(path: str, pages_per_batch: int = PDF_PAGE_BATCH) -> list[list[int]]:
+    with pymupdf.open(path) as doc:
+        count = doc.page_count
+    return [list(range(i, min(i + pages_per_batch, count))) for i in range(0, count, pages_per_batch)]
+
+
+def pdf_pages_markdown(path: str, pages: list[int] | None = None) -> str:
+    """Markdown (images captioned) for some 0-based pages of a PDF, or all of it."""
     ROOT = Path(__file__).parent.resolve()
     global_image_dir = ROOT / "documents" / "images"
     global_image_dir.mkdir(parents=True, exist_ok=True)
 
-    # Actual markdown with relative image paths
+    # Actual markdown with relative image paths (image files are named by page, so batches never collide)
     markdown = pymupdf4llm.to_markdown(
-        input.file_path,
+        path,
+        pages=pages,
         write_images=True,
         image_path=str(global_image_dir)
     )
@@ -239,8 +527,29 @@ def extract_pdf(input: FilePathInput) -> MarkdownOutput:
         markdown.replace("\\", "/")
     )
 
-    markdown = replace_images_with_captions(markdown)
-    return MarkdownOutput(markdown=markdown)
+    return replace_images_with_captions(markdown)
+
+
+def iter_pdf_markdown(path: str, pages_per_batch: int = PDF_PAGE_BATCH, workers: int = PDF_WORKERS):
+    """
+    Yield a PDF's markdown one page batch at a time, in page order, so callers can
+    chunk and embed early pages while later ones are still being converted. Long
+    PDFs are converted in a process pool with at most 2 × workers batches
+    pending, so only a few batches of markdown are ever held at once.
+    """
+    batches = pdf_page_batches(path, pages_per_batch)
+    if workers <= 1 or len(batches) <= 2:
+        for pages in batches:
+            yield pdf_pages_markdown(path, pages)
+        return
+
+    remaining = iter(batches)
+    with extract_pool(workers) as pool:
+        pending = deque(pool.submit(pdf_pages_markdown, path, pages) for pages in islice(remaining, workers * 2))
+        while pending:
+            markdown = pending.popleft().result()
+            pending.extend(pool.submit(pdf_pages_markdown, path, pages) for pages in islice(remaining, 1))
+            yield markdown
 
 
 def semantic_merge(text: str) -> list[str]:
@@ -272,7 +581,7 @@ Keep markdown formatting intact.
 """
 
         try:
-            result = requests.post(OLLAMA_CHAT_URL, json={
+            result = http.post(OLLAMA_CHAT_URL, json={
                 "model": PHI_MODEL,
                 "messages": [{"role": "user", "content": prompt}],
                 "stream": False
@@ -313,100 +622,360 @@ Keep markdown formatting intact.
 
 
 
-def process_documents():
-    """Process documents and create FAISS index using unified multimodal strategy."""
+def chunk_document(markdown: str, strategy: str = CHUNK_STRATEGY) -> list[str]:
+    if strategy == "llm":
+        return semantic_merge(markdown)
+    if strategy == "similarity":
+        return similarity_chunks(markdown, get_embeddings)
+    if strategy == "markdown":
+        return markdown_chunks(markdown)
+    raise ValueError(f"Unknown chunking strategy: {strategy}")
+
+
+def extract_markdown(file: Path) -> str:
+    ext = file.suffix.lower()
+
+    if ext == ".pdf":
+        mcp_log("INFO", f"Using MuPDF4LLM to extract {file.name}")
+        markdown = extract_pdf(FilePathInput(file_path=str(file))).markdown
+
+    elif ext in [".html", ".htm", ".url"]:
+        mcp_log("INFO", f"Using Trafilatura to extract {file.name}")
+        markdown = convert_webpage_url_into_markdown(UrlInput(url=file.read_text().strip())).markdown
+
+    else:
+        # Fallback to MarkItDown for other formats
+        converter = MarkItDown()
+        mcp_log("INFO", f"Using MarkItDown fallback for {file.name}")
+        markdown = converter.convert(str(file)).text_content
+    return markdown
+
+
+def _extract_document(path: str, strategy: str = CHUNK_STRATEGY,
+                      pages: list[int] | None = None) -> tuple[list[str], float, float]:
+    """Convert one file (or some pages of a PDF) to markdown and chunk it. Runs in an extraction worker process."""
+    started = time.perf_counter()
+    file = Path(path)
+    markdown = pdf_pages_markdown(path, pages) if pages is not None else extract_markdown(file)
+    extracted = time.perf_counter()
+
+    if not markdown.strip():
+        chunks = []
+    elif len(markdown.split()) < 10:
+        mcp_log("WARN", f"Content too short for chunking in {file.name} → Skipping chunking.")
+        chunks = [markdown.strip()]
+    else:
+        mcp_log("INFO", f"Chunking {file.name} ({len(markdown.split())} words) with the {strategy} strategy")
+        chunks = chunk_document(markdown, strategy)
+    return chunks, extracted - started, time.perf_counter() - extracted
+
+
+class IngestProgress:
+    """Documents, chunks and busy time per pipeline stage, logged every few seconds and at the end."""
+
+    STAGES = ("extract", "chunk", "embed", "write")
+
+    def __init__(self, total_files: int, strategy: str = CHUNK_STRATEGY, interval: float = 2.0):
+        self.total_files = total_files
+        self.strategy = strategy
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.docs = {stage: 0 for stage in self.STAGES}
+        self.chunks = {stage: 0 for stage in self.STAGES}
+        self.busy = {stage: 0.0 for stage in self.STAGES}
+        self._lock = threading.Lock()
+        self._last_report = self.started
+
+    def done(self, stage: str, chunks: int, seconds: float, doc: bool = True) -> None:
+        """Record work on a document; `doc` is False for all but the last page batch of a PDF."""
+        with self._lock:
+            self.docs[stage] += doc
+            self.chunks[stage] += chunks
+            self.busy[stage] += seconds
+            now = time.perf_counter()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def report(self) -> None:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        mcp_log("PROGRESS", " | ".join(
+            f"{stage} {self.docs[stage]}/{self.total_files} docs, {self.chunks[stage]} chunks "
+            f"({self.chunks[stage] / elapsed:.1f} chunks/s)"
+            for stage in self.STAGES
+        ))
+
+    def summary(self) -> None:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        mcp_log("INFO", f"Ingested {self.docs['write']}/{self.total_files} documents in {elapsed:.1f}s "
+                        f"({self.strategy} chunking)")
+        for stage in self.STAGES:
+            mcp_log("INFO", f"  {stage:<8} {self.docs[stage]:>4} docs {self.chunks[stage]:>6} chunks  "
+                            f"{self.docs[stage] / elapsed:6.2f} docs/s {self.chunks[stage] / elapsed:8.1f} chunks/s  "
+                            f"busy {self.busy[stage]:.1f}s")
+
+
+@index_build_lock()
+def process_documents(strategy: str = CHUNK_STRATEGY):
+    """
+    Process documents and create FAISS index using unified multimodal strategy.
+
+    Changed files flow through three stages joined by bounded queues: a process
+    pool extracts and chunks them, INGEST_EMBED_WORKERS threads embed them (all
+    batches share one pool of EMBED_MAX_IN_FLIGHT requests), and this thread is
+    the only writer to the index and metadata. PDFs are split into parts of
+    PDF_PAGE_BATCH pages, so a long PDF is converted by several workers and its
+    first pages are embedded while the rest are still being parsed; the writer
+    indexes the document once every part has arrived. `strategy` picks the
+    chunker (see CHUNK_STRATEGY); the final summary reports time spent in each stage.
+    """
     mcp_log("INFO", "Indexing documents with unified RAG pipeline...")
     ROOT = Path(__file__).parent.resolve()
     DOC_PATH = ROOT / "documents"
     INDEX_CACHE = ROOT / "faiss_index"
     INDEX_CACHE.mkdir(exist_ok=True)
-    INDEX_FILE = INDEX_CACHE / "index.bin"
-    METADATA_FILE = INDEX_CACHE / "metadata.json"
     CACHE_FILE = INDEX_CACHE / "doc_index_cache.json"
 
     def file_hash(path):
         return hashlib.md5(Path(path).read_bytes()).hexdigest()
 
     CACHE_META = json.loads(CACHE_FILE.read_text()) if CACHE_FILE.exists() else {}
-    metadata = json.loads(METADATA_FILE.read_text()) if METADATA_FILE.exists() else []
-    index = faiss.read_index(str(INDEX_FILE)) if INDEX_FILE.exists() else None
-
+    store = DocumentStore(INDEX_CACHE)
+    index = store.load_for_update()
+    if index is not None and store.embedding_format() != EMBED_FORMAT_VERSION:
+        # Old vectors are not comparable with new queries (e.g. unnormalised), so re-embed everything
+        mcp_log("INFO", f"Index holds embedding format {store.embedding_format() or 1}, expected "
+                        f"{EMBED_FORMAT_VERSION} → rebuilding from all documents")
+        store.clear()
+        index = None
+        CACHE_META.clear()
+        CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
+
+    pending = []
     for file in DOC_PATH.glob("*.*"):
         fhash = file_hash(file)
         if file.name in CACHE_META and CACHE_META[file.name] == fhash:
             mcp_log("SKIP", f"Skipping unchanged file: {file.name}")
             continue
+        pending.append((file, fhash))
+
+    progress = IngestProgress(len(pending), strategy)
+    to_embed = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    to_write = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    DONE = None
+
+    def parts():
+        """(file, fhash, part, n_parts, pages) tasks; pages is None for a whole document."""
+        for file, fhash in pending:
+            batches = []
+            if file.suffix.lower() == ".pdf":
+                try:
+                    batches = pdf_page_batches(str(file))
+                except Exception as e:
+                    mcp_log("WARN", f"Could not count pages of {file.name}, extracting it whole: {e}")
+            if len(batches) <= 1:
+                yield file, fhash, 0, 1, None
+                continue
+            for part, pages in enumerate(batches):
+                yield file, fhash, part, len(batches), pages
 
-        mcp_log("PROC", f"Processing: {file.name}")
+    def extract_stage():
         try:
-            ext = file.suffix.lower()
-            markdown = ""
-
-            if ext == ".pdf":
-                mcp_log("INFO", f"Using MuPDF4LLM to extract {file.name}")
-                markdown = extract_pdf(FilePathInput(file_path=str(file))).markdown
-
-            elif ext in [".html", ".htm", ".url"]:
-                mcp_log("INFO", f"Using Trafilatura to extract {file.name}")
-                markdown = convert_webpage_url_into_markdown(UrlInput(url=file.read_text().strip())).markdown
-
-            else:
-                # Fallback to MarkItDown for other formats
-                converter = MarkItDown()
-                mcp_log("INFO", f"Using MarkItDown fallback for {file.name}")
-                markdown = converter.convert(str(file)).text_content
+            with extract_pool(INGEST_EXTRACT_WORKERS) as pool:
+                tasks = parts()
+                running = {}
+
+                def submit_next():
+                    for task in tasks:
+                        file, _, part, n_parts, pages = task
+                        if pages is None:
+                            mcp_log("PROC", f"Processing: {file.name}")
+                        else:
+                            mcp_log("PROC", f"Processing: {file.name} pages {pages[0] + 1}-{pages[-1] + 1} "
+                                            f"(part {part + 1}/{n_parts})")
+                        running[pool.submit(_extract_document, str(file), strategy, pages)] = task
+                        return
+
+                for _ in range(INGEST_EXTRACT_WORKERS * 2):  # keep workers busy without extracting everything up front
+                    submit_next()
+                while running:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        file, fhash, part, n_parts, _ = running.pop(future)
+                        last = part == n_parts - 1
+                        try:
+                            chunks, extract_seconds, chunk_seconds = future.result()
+                        except Exception as e:
+                            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
+                            chunks = None  # the writer drops the whole document
+                        else:
+                            progress.done("extract", len(chunks), extract_seconds, doc=last)
+                            progress.done("chunk", len(chunks), chunk_seconds, doc=last)
+                        if chunks is not None or n_parts > 1:
+                            # blocks while embedding is behind; empty parts still go on so the writer can count them
+                            to_embed.put((file, fhash, part, n_parts, chunks))
+                        submit_next()
+        except Exception as e:
+            mcp_log("ERROR", f"Extraction stage failed: {e}")
+        finally:
+            for _ in range(INGEST_EMBED_WORKERS):
+                to_embed.put(DONE)
 
-            if not markdown.strip():
+    def embed_stage(batch_pool):
+        try:
+            while (item := to_embed.get()) is not DONE:
+                file, fhash, part, n_parts, chunks = item
+                vectors = None
+                if chunks:
+                    started = time.perf_counter()
+                    try:
+                        vectors = get_embeddings(chunks, pool=batch_pool)
+                    except Exception as e:
+                        mcp_log("ERROR", f"Failed to embed {file.name}: {e}")
+                        chunks = None
+                    else:
+                        progress.done("embed", len(chunks), time.perf_counter() - started, doc=part == n_parts - 1)
+                if chunks is not None or n_parts > 1:
+                    to_write.put((file, fhash, part, n_parts, chunks, vectors))
+        finally:
+            to_write.put(DONE)
+
+    written = {}
+    last_commit = time.monotonic()
+
+    def commit():
+        nonlocal last_commit
+        # ✅ Save index and metadata; file hashes are recorded only once their vectors are on disk
+        store.save_index(index)
+        store.set_embedding_format(EMBED_FORMAT_VERSION)
+        CACHE_META.update(written)
+        CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
+        mcp_log("SAVE", f"Saved FAISS index and metadata after {len(written)} document(s)")
+        written.clear()
+        last_commit = time.monotonic()
+
+    with ThreadPoolExecutor(EMBED_MAX_IN_FLIGHT, thread_name_prefix="embed-batch") as batch_pool:
+        stages = [threading.Thread(target=extract_stage, name="ingest-extract", daemon=True)]
+        stages += [threading.Thread(target=embed_stage, args=(batch_pool,), name=f"ingest-embed-{i}", daemon=True)
+                   for i in range(INGEST_EMBED_WORKERS)]
+        for stage in stages:
+            stage.start()
+
+        finished = 0
+        arrived = {}  # file name → {part: (chunks, vectors)} for PDFs still missing parts
+        while finished < INGEST_EMBED_WORKERS:
+            item = to_write.get()
+            if item is DONE:
+                finished += 1
+                continue
+            file, fhash, part, n_parts, chunks, vectors = item
+            if n_parts > 1:
+                received = arrived.setdefault(file.name, {})
+                received[part] = (chunks, vectors)
+                if len(received) < n_parts:
+                    continue
+                del arrived[file.name]
+                results = [received[i] for i in range(n_parts)]
+                if any(c is None for c, _ in results):
+                    mcp_log("ERROR", f"Skipping {file.name}: some of its pages failed")
+                    continue
+                chunks = [c for part_chunks, _ in results for c in part_chunks]
+                vectors = np.vstack([v for _, v in results if v is not None]) if chunks else None
+            if not chunks:
                 mcp_log("WARN", f"No content extracted from {file.name}")
                 continue
-
-            if len(markdown.split()) < 10:
-                mcp_log("WARN", f"Content too short for semantic merge in {file.name} → Skipping chunking.")
-                chunks = [markdown.strip()]
-            else:
-                mcp_log("INFO", f"Running semantic merge on {file.name} with {len(markdown.split())} words")
-                chunks = semantic_merge(markdown)
-
-
-            embeddings_for_file = []
-            new_metadata = []
-            for i, chunk in enumerate(tqdm(chunks, desc=f"Embedding {file.name}")):
-                embedding = get_embedding(chunk)
-                embeddings_for_file.append(embedding)
-                new_metadata.append({
-                    "doc": file.name,
-                    "chunk": chunk,
-                    "chunk_id": f"{file.stem}_{i}"
-                })
-
-            if embeddings_for_file:
+            started = time.perf_counter()
+            try:
                 if index is None:
-                    dim = len(embeddings_for_file[0])
-                    index = faiss.IndexFlatL2(dim)
-                index.add(np.stack(embeddings_for_file))
-                metadata.extend(new_metadata)
-                CACHE_META[file.name] = fhash
-
-                # ✅ Immediately save index and metadata
-                CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
-                METADATA_FILE.write_text(json.dumps(metadata, indent=2))
-                faiss.write_index(index, str(INDEX_FILE))
-                mcp_log("SAVE", f"Saved FAISS index and metadata after processing {file.name}")
+                    index = new_index(vectors.shape[1], FAISS_INDEX_FACTORY)
+                new_metadata = [
+                    {"doc": file.name, "chunk": chunk, "chunk_id": f"{file.stem}_{i}"}
+                    for i, chunk in enumerate(chunks)
+                ]
+                # Drops the file's previous vectors (if it changed) and adds the new ones under fresh ids
+                index = store.replace_document(index, file.name, vectors, new_metadata)
+                trained = train_if_ready(index, FAISS_INDEX_FACTORY)
+                if trained is not index:
+                    mcp_log("INFO", f"Trained {FAISS_INDEX_FACTORY} index on {index.ntotal} vectors")
+                    index = trained
+                written[file.name] = fhash
+            except Exception as e:
+                mcp_log("ERROR", f"Failed to index {file.name}: {e}")
+            progress.done("write", len(chunks), time.perf_counter() - started)
+            if written and time.monotonic() - last_commit >= INGEST_COMMIT_SECONDS:
+                commit()
+
+        for stage in stages:
+            stage.join()
+    if written:
+        commit()
+    if pending:
+        progress.summary()
+
+    present = {file.name for file in DOC_PATH.glob("*.*")}
+    removed = [doc for doc in store.documents() if doc not in present]
+    for doc in removed:
+        mcp_log("DEL", f"Removing deleted file from index: {doc}")
+        index = store.remove_document(index, doc)
+        CACHE_META.pop(doc, None)
+    if removed:
+        CACHE_FILE.write_text(json.dumps(CACHE_META, indent=2))
+        if index is not None:
+            store.save_index(index)
+
+    fragmentation = store.fragmentation()
+    store.close()
+    if fragmentation >= COMPACT_THRESHOLD:
+        mcp_log("INFO", f"{fragmentation:.0%} of the index was removed or replaced → compacting")
+        compact_index()
+
+
+@index_build_lock()
+def compact_index():
+    """
+    Rebuild index.bin from the live chunks only, dropping stale vectors and
+    retraining IVF/PQ centroids on the current corpus. Ids are kept, so the
+    metadata stays valid and a running server just reloads the new file.
+    Vectors come from the embedding cache (Ollama only for chunks missing there).
+    """
+    store = DocumentStore(ROOT / "faiss_index")
+    try:
+        old = store.load_for_update()
+        rows = store.chunks()
+        if old is None:
+            return
+        index = new_index(old.d, FAISS_INDEX_FACTORY)
+        if rows:
+            with tqdm(total=len(rows), desc="Compacting index") as progress:
+                vectors = get_embeddings([chunk for _, chunk in rows], progress=progress)
+            index.add_with_ids(vectors, np.array([vector_id for vector_id, _ in rows], dtype=np.int64))
+            index = train_if_ready(index, FAISS_INDEX_FACTORY)
+        store.save_index(index)
+        store.mark_compacted()
+        mcp_log("SAVE", f"Compacted index: {old.ntotal} → {index.ntotal} vectors")
+    finally:
+        store.close()
 
-        except Exception as e:
-            mcp_log("ERROR", f"Failed to process {file.name}: {e}")
 
+def ensure_faiss_ready():
+    store = doc_store()
 
+    def ready():
+        return (store.index_path.exists() and store.has_metadata()
+                and store.embedding_format() == EMBED_FORMAT_VERSION)
 
-def ensure_faiss_ready():
-    from pathlib import Path
-    index_path = ROOT / "faiss_index" / "index.bin"
-    meta_path = ROOT / "faiss_index" / "metadata.json"
-    if not (index_path.exists() and meta_path.exists()):
-        mcp_log("INFO", "Index not found — running process_documents()...")
-        process_documents()
-    else:
+    if ready():
         mcp_log("INFO", "Index already exists. Skipping regeneration.")
+        return
+    # Single flight: concurrent searches (threads here, other worker processes) wait for the
+    # one build in progress and then find the index instead of starting their own
+    with index_build_lock():
+        if ready():
+            mcp_log("INFO", "Index was built by another worker.")
+            return
+        mcp_log("INFO", "Index missing or built with an older embedding format — running process_documents()...")
+        process_documents()
 
 
 if __name__ == "__main__":
@@ -11,6 +11,7 @@ from datetime import datetime, timedelta
 import time
 import re
 from pydantic import BaseModel, Field
+import tracing
 from models import SearchInput, UrlInput
 from models import PythonCodeOutput  # Import the models we need
 
@@ -210,6 +211,7 @@ class WebContentFetcher:
 
 # Initialize FastMCP server
 mcp = FastMCP("ddg-search")
+tracing.trace_tools(mcp)  # spans for every tool body when TRACE_FILE is set
 searcher = DuckDuckGoSearcher()
 fetcher = WebContentFetcher()
 
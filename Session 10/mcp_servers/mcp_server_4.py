@@ -17,6 +17,8 @@ from io import StringIO
 from tqdm import tqdm
 import hashlib
 
+import tracing
+
 # Models
 from models import (
     AddInput, AddOutput,
@@ -34,6 +36,7 @@ from models import (
 )
 
 mcp = FastMCP("Mixed 4")
+tracing.trace_tools(mcp)  # spans for every tool body when TRACE_FILE is set
 
 @mcp.tool()
 def add(input: AddInput) -> AddOutput:
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Any, Dict, List, Union
 
 # --- Math Tools ---
 
@@ -89,6 +89,24 @@ class MineInput(BaseModel):
 class MineOutput(BaseModel):
     result: int
 
+# --- Batched Math ---
+
+class MathOperation(BaseModel):
+    op: str = Field(description="Math tool name, e.g. add, multiply, power, sin")
+    args: List[Union[int, float, str]] = Field(description="Numbers, or '$i' to use the result of operation i")
+
+class EvaluateBatchInput(BaseModel):
+    operations: List[MathOperation]
+
+class EvaluateBatchOutput(BaseModel):
+    results: List[Union[int, float]]
+
+class ExpressionDagInput(BaseModel):
+    expression: Dict[str, Any] = Field(description='Nested tree like {"op": "add", "args": [{"op": "multiply", "args": [2, 3]}, 4]}')
+
+class ExpressionDagOutput(BaseModel):
+    result: Union[int, float]
+
 # --- String & List Tools ---
 
 class StringsToIntsInput(BaseModel):
@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 import asyncio
 import json
 from typing import Optional, Any, List, Dict
@@ -8,6 +9,14 @@ from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 import ast
 
+from mcp_servers.server_pool import ServerPool
+from mcp_servers.tool_cache import ToolSchemaCache, ToolResultCache, dependency_stamp
+from mcp_servers.tool_binder import ToolBinder
+from mcp_servers import tracing
+
+HEALTH_CHECK_INTERVAL = 60  # seconds between background health checks / idle reaping (0 disables)
+DISCOVERY_TIMEOUT = 60      # default per-server startup + list_tools timeout (override with startup_timeout)
+
 class MCP:
     def __init__(
         self,
@@ -42,68 +51,151 @@ class MCP:
                 await session.initialize()
                 return await session.call_tool(tool_name, arguments=arguments)
 
+def result_size(result: Any) -> int:
+    """Bytes of payload in a CallToolResult (text as UTF-8, binary content as its encoded data)."""
+    size = 0
+    for item in getattr(result, "content", None) or []:
+        text = getattr(item, "text", None)
+        if text is not None:
+            size += len(text.encode("utf-8"))
+        else:
+            size += len(getattr(item, "data", "") or "")
+    return size
+
+
 class MultiMCP:
-    def __init__(self, server_configs: List[dict]):
+    def __init__(self, server_configs: List[dict], health_check_interval: float = HEALTH_CHECK_INTERVAL, use_schema_cache: bool = True,
+                 cache_config: Optional[dict] = None):
         self.server_configs = server_configs
+        self.schema_cache = ToolSchemaCache() if use_schema_cache else None
+        self.result_cache = ToolResultCache.from_config(cache_config) if (cache_config or {}).get("enabled", True) else None
         self.tool_map: Dict[str, Dict[str, Any]] = {}
         self.server_tools: Dict[str, List[Any]] = {}
+        self.pools: Dict[str, ServerPool] = {}
+        self.health_check_interval = health_check_interval
+        self._health_task: Optional[asyncio.Task] = None
+        self.startup_timings: Dict[str, Dict[str, Any]] = {}
+        self.tool_version = 0  # bumped whenever the registered tool set changes
+        self._catalog_cache: Dict[Any, str] = {}
 
     async def initialize(self):
         print("in MultiMCP initialize")
-        for config in self.server_configs:
-            try:
-                params = StdioServerParameters(
-                    command=sys.executable,
-                    args=[config["script"]],
-                    cwd=config.get("cwd", os.getcwd())
-                )
-                print(f"→ Scanning tools from: {config['script']} in {params.cwd}")
-                async with stdio_client(params) as (read, write):
-                    print("Connection established, creating session...")
-                    try:
-                        async with ClientSession(read, write) as session:
-                            print("[agent] Session created, initializing...")
-                            await session.initialize()
-                            print("[agent] MCP session initialized")
-                            tools = await session.list_tools()
-                            print(f"\n→ Tools received: {[tool.name for tool in tools.tools]}")
-                            for tool in tools.tools:
-                                self.tool_map[tool.name] = {
-                                    "config": config,
-                                    "tool": tool
-                                }
-                                server_key = config["id"]
-                                if server_key not in self.server_tools:
-                                    self.server_tools[server_key] = []
-                                self.server_tools[server_key].append(tool)
-                    except Exception as se:
-                        print(f"❌ Session error: {se}")
-            except Exception as e:
-                print(f"❌ Error initializing MCP server {config['script']}: {e}")
+        boot_start = time.perf_counter()
+        results = await asyncio.gather(*(self._discover(config) for config in self.server_configs))
+        if self.schema_cache and any(t["status"].startswith("ok") for t in self.startup_timings.values()):
+            self.schema_cache.save()
 
-    async def call_tool(self, tool_name: str, arguments: dict) -> Any:
+        # Register in config order so later servers still override duplicate tool names
+        for config, tools in zip(self.server_configs, results):
+            cacheable_tools = config.get("cacheable_tools") or {}
+            cache_depends_on = config.get("cache_depends_on") or {}
+            cache_skip_if = config.get("cache_skip_if") or {}
+            for tool in tools:
+                self.tool_map[tool.name] = {
+                    "config": config,
+                    "tool": tool,
+                    "binder": ToolBinder(tool),
+                    "cacheable": tool.name in cacheable_tools,
+                    "cache_ttl": cacheable_tools.get(tool.name),  # seconds; None = never expires
+                    "cache_depends_on": cache_depends_on.get(tool.name),  # e.g. "arg:file_path"
+                    "cache_skip_if": cache_skip_if.get(tool.name),  # e.g. ["prefix:Error:"]
+                }
+                server_key = config["id"]
+                if server_key not in self.server_tools:
+                    self.server_tools[server_key] = []
+                self.server_tools[server_key].append(tool)
+        self.tool_version += 1
+        self._catalog_cache.clear()
+
+        self.print_startup_report(time.perf_counter() - boot_start)
+
+        if self.health_check_interval and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop(), name="mcp-health-check")
+
+    async def _discover(self, config: dict) -> List[Any]:
+        """
+        Start one server pool and list its tools, giving up after its startup timeout.
+        With a valid schema cache entry the server is not started at all; its pool
+        spawns a process on the first real tool call.
+        """
+        pool = ServerPool(config)
+        self.pools[pool.server_id] = pool
+
+        cached_tools = self.schema_cache.get(config) if self.schema_cache else None
+        if cached_tools is not None:
+            print(f"→ Loaded {len(cached_tools)} cached tool schemas for {pool.server_id} (server starts on first call)")
+            self.startup_timings[pool.server_id] = {"seconds": 0.0, "tools": len(cached_tools), "status": "cached"}
+            return cached_tools
+
+        timeout = float(config.get("startup_timeout", DISCOVERY_TIMEOUT))
+        started = time.perf_counter()
+        status = "ok"
+        tools: List[Any] = []
+        try:
+            print(f"→ Scanning tools from: {config['script']} in {config.get('cwd', os.getcwd())}")
+            async def start_and_list():
+                await pool.start()
+                return await pool.list_tools()
+            tools = await asyncio.wait_for(start_and_list(), timeout=timeout)
+            print(f"\n→ Tools received from {pool.server_id}: {[tool.name for tool in tools]}")
+            if self.schema_cache:
+                self.schema_cache.put(config, tools)
+            if pool.lazy_start:
+                status = "ok, stopped until first use"
+        except asyncio.TimeoutError:
+            status = f"timeout after {timeout:.0f}s"
+            print(f"❌ MCP server {config['script']} did not start within {timeout:.0f}s; continuing without it")
+        except Exception as e:
+            status = "error"
+            print(f"❌ Error initializing MCP server {config['script']}: {e}")
+        self.startup_timings[pool.server_id] = {
+            "seconds": time.perf_counter() - started,
+            "tools": len(tools),
+            "status": status,
+        }
+        if status != "ok":
+            await pool.stop()  # failed, timed out or lazy: no process is left running
+        return tools
+
+    def print_startup_report(self, total_seconds: float) -> None:
+        """Print per-server boot times, slowest first."""
+        if not self.startup_timings:
+            return
+        ranked = sorted(self.startup_timings.items(), key=lambda item: item[1]["seconds"], reverse=True)
+        print("\n── MCP startup report ──────────────────────────────")
+        for i, (server_id, timing) in enumerate(ranked):
+            marker = "  ← dominated boot" if i == 0 and timing["seconds"] > 0 else ""
+            print(f"  {server_id:<12} {timing['seconds']:7.2f}s  {timing['tools']:3d} tools  {timing['status']}{marker}")
+        print(f"  {'total':<12} {total_seconds:7.2f}s  (servers started concurrently)")
+        print("────────────────────────────────────────────────────\n")
+
+    async def call_tool(self, tool_name: str, arguments: dict, timings: Optional[Dict[str, float]] = None) -> Any:
         entry = self.tool_map.get(tool_name)
         if not entry:
             raise ValueError(f"Tool '{tool_name}' not found on any server.")
 
-        config = entry["config"]
-        params = StdioServerParameters(
-            command=sys.executable,
-            args=[config["script"]],
-            cwd=config.get("cwd", os.getcwd())
-        )
+        pool = self.pools[entry["config"]["id"]]
+        with tracing.span("mcp.call_tool", tool=tool_name, server=pool.server_id):
+            return await pool.call_tool(tool_name, arguments, timings=timings)
 
-        async with stdio_client(params) as (read, write):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                return await session.call_tool(tool_name, arguments)
+    async def health_check(self) -> Dict[str, bool]:
+        """Ping every server worker; restart the ones that stopped answering."""
+        return {server_id: await pool.health_check() for server_id, pool in self.pools.items()}
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.health_check()
+            for pool in self.pools.values():
+                await pool.reap_idle()
 
 
 
-    async def function_wrapper(self, tool_name: str, *args):
+    async def function_wrapper(self, tool_name: str, *args, timings: Optional[Dict[str, float]] = None):
         """
         Call a tool like a function with positional args OR a single string like 'add(45, 55)'.
-        Returns the most relevant parsed result.
+        Returns the most relevant parsed result. If `timings` is given it is filled with the
+        queue_wait / server / parse seconds and the bytes returned.
         """
         # ── Handle LLM-style string input like: "add(45, 55) or ("send_email", ("a@b.com", "hello"))" ─────────────────
         # ── Handle string-form function call like "add(10, 20)" ──────────────
@@ -125,65 +217,56 @@ class MultiMCP:
         if not tool_entry:
             raise ValueError(f"Tool '{tool_name}' not found.")
 
-        tool = tool_entry["tool"]
-        schema = tool.inputSchema
-        params = {}
-
-        # ── Build input payload ──────────────────────────────
-        if "input" in schema.get("properties", {}):
-            inner_key = next(iter(schema.get("$defs", {})), None)
-            inner_props = schema["$defs"][inner_key]["properties"]
-            param_names = list(inner_props.keys())
-            if len(param_names) != len(args):
-                raise ValueError(f"{tool_name} expects {len(param_names)} args, got {len(args)}")
-            params["input"] = dict(zip(param_names, args))
-        else:
-            param_names = list(schema["properties"].keys())
-            if len(param_names) != len(args):
-                raise ValueError(f"{tool_name} expects {len(param_names)} args, got {len(args)}")
-            params = dict(zip(param_names, args))
-
-        # ── Call and Normalize Output ────────────────────────
-        result = await self.call_tool(tool_name, params)
-
-        try:
-            content_text = getattr(result, "content", [])[0].text.strip()
-            parsed = json.loads(content_text)
+        binder = tool_entry["binder"]
+        params = binder.bind(args)
 
-            if isinstance(parsed, dict):
-                if "result" in parsed:
-                    return parsed["result"]
-                if len(parsed) == 1:
-                    return next(iter(parsed.values()))
-                return parsed
+        # ── Call (or reuse a memoized result) and Normalize Output ──
+        if timings is None:
+            timings = {}
+        if self.result_cache and tool_entry["cacheable"]:
+            rule = tool_entry["cache_depends_on"]
+            version = dependency_stamp(rule, params, tool_entry["config"].get("cwd")) if rule else None
+            cache_key = self.result_cache.make_key(tool_name, params, version)
+            hit, result = self.result_cache.get(tool_name, cache_key)
+            if not hit:
+                result = await self.call_tool(tool_name, params, timings=timings)
+                self.result_cache.put(tool_name, cache_key, result, tool_entry["cache_ttl"],
+                                      skip_if=tool_entry["cache_skip_if"])
+        else:
+            result = await self.call_tool(tool_name, params, timings=timings)
 
-            return parsed  # primitive type
-        except Exception:
-            return result  # fallback if parse fails
+        parse_start = time.perf_counter()
+        value = binder.unwrap(result)
+        timings["parse"] = time.perf_counter() - parse_start
+        timings["bytes"] = result_size(result)
+        return value
 
 
 
     def tool_description_wrapper(self) -> List[str]:
         """Format tool usage as: tool(type, type)  # description"""
         examples = []
-        for tool in self.get_all_tools():
-            schema = tool.inputSchema
-            if "input" in schema.get("properties", {}):
-                inner_key = next(iter(schema.get("$defs", {})), None)
-                props = schema["$defs"][inner_key]["properties"]
-            else:
-                props = schema["properties"]
-
-            arg_types = []
-            for k, v in props.items():
-                t = v.get("type", "any")
-                arg_types.append(t)
-
-            signature_str = ", ".join(arg_types)
-            examples.append(f"{tool.name}({signature_str})  # {tool.description}")
+        for entry in self.tool_map.values():
+            binder = entry["binder"]
+            examples.append(f"{binder.signature}  # {binder.description}")
         return examples
 
-
+    def tool_catalog(self, server_ids: Optional[List[str]] = None) -> str:
+        """
+        Markdown bullet list of tool signatures for the prompt, rendered once per
+        set of servers (None = every registered tool) and tool_version.
+        """
+        key = (tuple(sorted(server_ids)) if server_ids is not None else None, self.tool_version)
+        catalog = self._catalog_cache.get(key)
+        if catalog is None:
+            if server_ids is None:
+                binders = [entry["binder"] for entry in self.tool_map.values()]
+            else:
+                binders = [self.tool_map[tool.name]["binder"]
+                           for server in server_ids for tool in self.server_tools.get(server, [])]
+            catalog = "\n".join(f"- `{f'{binder.signature}  # {binder.description}'.strip()}`" for binder in binders)
+            self._catalog_cache[key] = catalog
+        return catalog
 
     async def list_all_tools(self) -> List[str]:
         return list(self.tool_map.keys())
@@ -198,5 +281,34 @@ class MultiMCP:
                 tools.extend(self.server_tools[server])
         return tools
 
+    def warm_up(self, server_ids: List[str]) -> None:
+        """
+        Start the given (not yet running) servers in the background so their first
+        call is warm. run_user_code passes the servers whose tools a plan calls.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        for server_id in server_ids:
+            pool = self.pools.get(server_id)
+            if pool is None or pool.is_running:
+                continue
+            print(f"🔥 Warming up MCP server '{server_id}'")
+            task = loop.create_task(pool.start(), name=f"mcp-warm-up:{server_id}")
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # errors resurface on the real call
+
+    @property
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-tool result cache hits/misses (empty when the cache is disabled)."""
+        return self.result_cache.stats if self.result_cache else {}
+
     async def shutdown(self):
-        pass
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for pool in self.pools.values():
+            await pool.stop()
+        self.pools.clear()
+        if self.result_cache:
+            self.result_cache.close()
@@ -0,0 +1,373 @@
+import os
+import sys
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+
+import anyio
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client, get_default_environment
+
+from mcp_servers import tracing
+
+STARTUP_TIMEOUT = 120          # seconds to wait for a server to come up
+HEALTH_CHECK_TIMEOUT = 10      # seconds a ping may take before the server is considered dead
+MAX_CONCURRENT_CALLS = 8       # default in-flight requests multiplexed over one session
+IDLE_TIMEOUT = 300             # seconds an extra (above min_workers) worker may sit idle before it is reaped
+
+# Errors that mean the stdio pipe to the server is gone (process exited / crashed)
+CONNECTION_ERRORS = (
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+    ConnectionError,
+    BrokenPipeError,
+)
+
+
+class ServerBusyError(RuntimeError):
+    """Raised when a server's pending-call queue is full (backpressure)."""
+
+
+class ServerConnection:
+    """
+    Long-lived stdio session to a single MCP server process.
+
+    The stdio_client / ClientSession contexts are entered and exited inside one
+    background task (anyio cancel scopes must stay in the task that opened them),
+    so callers only ever touch `self.session`.
+    """
+
+    def __init__(self, config: dict, name: Optional[str] = None):
+        self.config = config
+        self.server_id = config.get("id", config["script"])
+        self.name = name or self.server_id
+        self.session: Optional[ClientSession] = None
+        self.restarts = 0
+        self.last_used = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._start_lock = asyncio.Lock()
+
+        # ── Multiplexing: many in-flight requests share the one ClientSession.
+        # The session correlates responses by JSON-RPC request id; call ids here
+        # only track what is in flight for logging and load reporting.
+        self.max_concurrent = int(config.get("max_concurrent", MAX_CONCURRENT_CALLS))
+        self.max_pending = config.get("max_pending")  # None = callers wait indefinitely
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._next_call_id = 0
+        self.in_flight: Dict[int, str] = {}
+        self.pending = 0
+
+    def _params(self) -> StdioServerParameters:
+        env = None  # None = the SDK's default (filtered) environment
+        if tracing.enabled():
+            env = {**get_default_environment(), tracing.TRACE_ENV: tracing.trace_file(), "TRACE_SERVICE": self.server_id}
+        return StdioServerParameters(
+            command=sys.executable,
+            args=[self.config["script"]],
+            cwd=self.config.get("cwd", os.getcwd()),
+            env=env
+        )
+
+    @property
+    def is_alive(self) -> bool:
+        return (
+            self.session is not None
+            and self._task is not None
+            and not self._task.done()
+            and not self._lost.is_set()
+        )
+
+    # ── Lifecycle ────────────────────────────────────────
+    async def start(self) -> None:
+        """Spawn the server process and initialize the session (no-op if already running)."""
+        async with self._start_lock:
+            if self.is_alive:
+                return
+            if self._task is not None:
+                # Previous process died: reap it before spawning a replacement
+                self.restarts += 1
+                print(f"🔄 Reconnecting MCP server '{self.name}' (restart #{self.restarts})")
+                await self._close()
+
+            self._ready = asyncio.Event()
+            self._stop = asyncio.Event()
+            self._lost = asyncio.Event()
+            self._error = None
+            self._task = asyncio.create_task(self._run(), name=f"mcp-server:{self.name}")
+
+            try:
+                with tracing.span("mcp.spawn", server=self.name, restart=self.restarts):
+                    await asyncio.wait_for(self._ready.wait(), timeout=STARTUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self._close()
+                raise RuntimeError(f"MCP server '{self.name}' did not start within {STARTUP_TIMEOUT}s")
+
+            if self.session is None:
+                raise RuntimeError(f"MCP server '{self.name}' failed to start: {self._error}")
+
+    async def _run(self) -> None:
+        try:
+            async with stdio_client(self._params()) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    print(f"[agent] MCP server '{self.name}' connected")
+                    await self._stop.wait()
+        except Exception as e:
+            self._error = e
+            if not self._stop.is_set():
+                print(f"❌ MCP server '{self.name}' connection error: {e}")
+        finally:
+            self.session = None
+            self._lost.set()
+            self._ready.set()
+
+    async def _close(self) -> None:
+        self._stop.set()
+        task, self._task = self._task, None
+        if task is None:
+            return
+        if not self._ready.is_set():
+            task.cancel()  # still starting up: nothing to shut down gracefully
+        try:
+            await asyncio.wait_for(task, timeout=HEALTH_CHECK_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            task.cancel()
+        except Exception:
+            pass
+
+    async def stop(self) -> None:
+        async with self._start_lock:
+            await self._close()
+
+    async def restart(self) -> None:
+        """Force a fresh process; in-flight requests on the old one fail with ConnectionError."""
+        self._lost.set()
+        await self.start()
+
+    # ── Health ───────────────────────────────────────────
+    async def health_check(self) -> bool:
+        """Ping the server; marks the connection lost if it does not answer in time."""
+        session = self.session
+        if session is None or not self.is_alive:
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout=HEALTH_CHECK_TIMEOUT)
+            return True
+        except Exception as e:
+            print(f"⚠️ Health check failed for MCP server '{self.name}': {e}")
+            self._lost.set()
+            return False
+
+    # ── Requests ─────────────────────────────────────────
+    async def _request(self, coro_factory) -> Any:
+        """Run a session request, aborting it if the connection is lost meanwhile."""
+        session = self.session
+        if session is None or not self.is_alive:
+            raise ConnectionError(f"MCP server '{self.name}' is not running")
+
+        request = asyncio.ensure_future(coro_factory(session))
+        lost = asyncio.ensure_future(self._lost.wait())
+        try:
+            await asyncio.wait({request, lost}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            lost.cancel()
+
+        if request.done():
+            try:
+                return request.result()
+            except CONNECTION_ERRORS:
+                # Pipe is closed: flag this session (not a newer replacement) as lost
+                if self.session is session:
+                    self._lost.set()
+                raise
+        request.cancel()
+        raise ConnectionError(f"MCP server '{self.name}' exited during request")
+
+    async def list_tools(self) -> list:
+        await self.start()
+        result = await self._request(lambda s: s.list_tools())
+        return result.tools
+
+    @property
+    def load(self) -> int:
+        """Requests in flight plus requests waiting for a slot."""
+        return len(self.in_flight) + self.pending
+
+    async def call_tool(self, tool_name: str, arguments: dict, timings: Optional[Dict[str, float]] = None) -> Any:
+        """
+        Call a tool over the shared session, reconnecting once if the server process has died.
+        At most `max_concurrent` calls are in flight at a time; the rest wait for a slot.
+        `timings` (if given) gets the seconds spent queued/starting and on the server round trip.
+        """
+        queued_at = time.perf_counter()
+        if self.max_pending is not None and self.pending >= int(self.max_pending):
+            raise ServerBusyError(
+                f"MCP server '{self.name}' has {self.pending} calls queued (max_pending={self.max_pending})"
+            )
+
+        self.pending += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.pending -= 1
+
+        self._next_call_id += 1
+        call_id = self._next_call_id
+        self.in_flight[call_id] = tool_name
+        try:
+            for attempt in range(2):
+                await self.start()
+                sent_at = time.perf_counter()
+                try:
+                    result = await self._request(lambda s: s.call_tool(tool_name, arguments))
+                    if timings is not None:
+                        timings["queue_wait"] = timings.get("queue_wait", 0.0) + sent_at - queued_at
+                        timings["server"] = time.perf_counter() - sent_at
+                    return result
+                except CONNECTION_ERRORS as e:
+                    if attempt:
+                        raise
+                    print(f"⚠️ Lost connection to MCP server '{self.name}' during call #{call_id} "
+                          f"{tool_name} ({type(e).__name__}: {e}); reconnecting...")
+        finally:
+            del self.in_flight[call_id]
+            self.last_used = time.monotonic()
+            self._slots.release()
+
+
+class ServerPool:
+    """
+    Pool of warm worker processes for one configured server id.
+
+    `min_workers` processes are started up front and kept running; when every
+    worker is busy another one is spawned in the background (up to
+    `max_workers`) so later calls land on a process that has already imported
+    the server and loaded its state. Extra workers idle for longer than
+    `idle_timeout` seconds are reaped. With `idle_shutdown` set, the whole
+    pool is stopped once it has been unused that long and is started again on
+    the next call.
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.server_id = config.get("id", config["script"])
+        self.min_workers = max(1, int(config.get("min_workers", 1)))
+        self.max_workers = max(self.min_workers, int(config.get("max_workers", self.min_workers)))
+        self.idle_timeout = float(config.get("idle_timeout", IDLE_TIMEOUT))
+        self.idle_shutdown = config.get("idle_shutdown")  # None = keep min_workers running
+        self.lazy_start = bool(config.get("lazy_start", False))
+        self.workers: List[ServerConnection] = []
+        self._spawned = 0
+        self._growing: Optional[asyncio.Task] = None
+
+    def _new_worker(self) -> ServerConnection:
+        self._spawned += 1
+        name = self.server_id if self.max_workers == 1 else f"{self.server_id}#{self._spawned}"
+        return ServerConnection(self.config, name=name)
+
+    @property
+    def load(self) -> int:
+        return sum(worker.load for worker in self.workers)
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self.workers)
+
+    @property
+    def last_used(self) -> float:
+        return max((worker.last_used for worker in self.workers), default=0.0)
+
+    # ── Lifecycle ────────────────────────────────────────
+    async def start(self) -> None:
+        """Bring the pool up to `min_workers` running processes."""
+        while len(self.workers) < self.min_workers:
+            self.workers.append(self._new_worker())
+        await asyncio.gather(*(worker.start() for worker in self.workers[:self.min_workers]))
+
+    async def stop(self) -> None:
+        if self._growing:
+            self._growing.cancel()
+            self._growing = None
+        workers, self.workers = self.workers, []
+        await asyncio.gather(*(worker.stop() for worker in workers), return_exceptions=True)
+
+    async def _grow(self) -> None:
+        worker = self._new_worker()
+        try:
+            await worker.start()
+        except Exception as e:
+            print(f"❌ Could not add worker to MCP server pool '{self.server_id}': {e}")
+            return
+        self.workers.append(worker)
+        print(f"➕ MCP server pool '{self.server_id}' scaled up to {len(self.workers)} workers")
+
+    def _maybe_grow(self) -> None:
+        if len(self.workers) >= self.max_workers:
+            return
+        if self._growing and not self._growing.done():
+            return
+        if all(worker.load > 0 for worker in self.workers):
+            self._growing = asyncio.create_task(self._grow(), name=f"mcp-pool-grow:{self.server_id}")
+
+    async def reap_idle(self) -> int:
+        """Stop extra workers idle for longer than `idle_timeout`, or the whole pool after `idle_shutdown`."""
+        now = time.monotonic()
+        if self.idle_shutdown is not None and self.workers and self.load == 0 \
+                and now - self.last_used > float(self.idle_shutdown):
+            reaped = len(self.workers)
+            await self.stop()
+            print(f"💤 MCP server pool '{self.server_id}' idle for {float(self.idle_shutdown):.0f}s; stopped {reaped} worker(s)")
+            return reaped
+
+        reaped = 0
+        for worker in list(self.workers):
+            if len(self.workers) <= self.min_workers:
+                break
+            if worker.load == 0 and now - worker.last_used > self.idle_timeout:
+                self.workers.remove(worker)
+                await worker.stop()
+                reaped += 1
+        if reaped:
+            print(f"➖ MCP server pool '{self.server_id}' reaped {reaped} idle worker(s), {len(self.workers)} left")
+        return reaped
+
+    # ── Health ───────────────────────────────────────────
+    async def health_check(self) -> bool:
+        """Ping every worker, restarting the ones that stopped answering."""
+        healthy = True
+        for worker in list(self.workers):
+            if await worker.health_check():
+                continue
+            try:
+                await worker.restart()
+                healthy = await worker.health_check() and healthy
+            except Exception as e:
+                print(f"❌ Could not restart MCP server '{worker.name}': {e}")
+                healthy = False
+        return healthy
+
+    # ── Requests ─────────────────────────────────────────
+    def _least_loaded(self) -> ServerConnection:
+        return min(self.workers, key=lambda worker: (not worker.is_alive, worker.load))
+
+    async def list_tools(self) -> list:
+        if not self.workers:
+            await self.start()
+        return await self._least_loaded().list_tools()
+
+    async def call_tool(self, tool_name: str, arguments: dict, timings: Optional[Dict[str, float]] = None) -> Any:
+        """Dispatch to the least-loaded warm worker, scaling up in the background when all are busy."""
+        if not self.workers:
+            started_at = time.perf_counter()
+            await self.start()
+            if timings is not None:
+                timings["queue_wait"] = timings.get("queue_wait", 0.0) + time.perf_counter() - started_at  # cold start
+        self._maybe_grow()
+        return await self._least_loaded().call_tool(tool_name, arguments, timings=timings)
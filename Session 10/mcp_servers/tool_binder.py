@@ -0,0 +1,121 @@
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+
+def _to_int(value: Any) -> Any:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value.strip())
+        except ValueError:
+            return value
+    return value
+
+
+def _to_float(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return value
+    return value
+
+
+def _to_str(value: Any) -> Any:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def _from_json(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+# Coercion per JSON-schema type; anything unconvertible is passed through for the server to reject
+COERCERS: Dict[str, Callable[[Any], Any]] = {
+    "integer": _to_int,
+    "number": _to_float,
+    "string": _to_str,
+    "array": _from_json,
+    "object": _from_json,
+}
+
+
+class ToolBinder:
+    """
+    Positional-args → tool-arguments mapping for one tool, compiled once from its input schema.
+
+    Tools either take their parameters flat or wrapped in a single pydantic `input`
+    model (`{"input": {...}}` with the model under `$defs`); both are resolved here
+    so `bind()` and `unwrap()` do no schema reflection per call.
+    """
+
+    def __init__(self, tool: Any):
+        self.name = tool.name
+        self.description = tool.description
+        schema = tool.inputSchema or {}
+        properties = schema.get("properties", {})
+
+        self.wrapped = "input" in properties
+        if self.wrapped:
+            props = self._resolve_input_model(schema, properties["input"]).get("properties", {})
+        else:
+            props = properties
+
+        self.param_names: Tuple[str, ...] = tuple(props.keys())
+        self.arg_types: Tuple[str, ...] = tuple(spec.get("type", "any") for spec in props.values())
+        self.coercers: Tuple[Callable[[Any], Any], ...] = tuple(
+            COERCERS.get(arg_type, _identity) for arg_type in self.arg_types
+        )
+
+    @staticmethod
+    def _resolve_input_model(schema: dict, input_prop: dict) -> dict:
+        defs = schema.get("$defs", {})
+        ref = input_prop.get("$ref") or next(
+            (option["$ref"] for option in input_prop.get("allOf", []) if "$ref" in option), None
+        )
+        if ref and ref.split("/")[-1] in defs:
+            return defs[ref.split("/")[-1]]
+        if defs:
+            return next(iter(defs.values()))
+        return input_prop
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}({', '.join(self.arg_types)})"
+
+    def bind(self, args: Tuple[Any, ...] | List[Any]) -> dict:
+        if len(args) != len(self.param_names):
+            raise ValueError(f"{self.name} expects {len(self.param_names)} args, got {len(args)}")
+        values = {name: coerce(arg) for name, coerce, arg in zip(self.param_names, self.coercers, args)}
+        return {"input": values} if self.wrapped else values
+
+    @staticmethod
+    def unwrap(result: Any) -> Any:
+        """Return the most relevant parsed value from a CallToolResult (the raw result if it is not JSON)."""
+        try:
+            content_text = getattr(result, "content", [])[0].text.strip()
+            parsed = json.loads(content_text)
+
+            if isinstance(parsed, dict):
+                if "result" in parsed:
+                    return parsed["result"]
+                if len(parsed) == 1:
+                    return next(iter(parsed.values()))
+                return parsed
+
+            return parsed  # primitive type
+        except Exception:
+            return result  # fallback if parse fails
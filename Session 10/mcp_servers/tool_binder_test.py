@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+
+from models import AddInput, StringsToIntsInput
+from tool_binder import ToolBinder
+
+
+def wrapped_tool(name, model):
+    """A tool as FastMCP lists it: one `input` parameter referencing the pydantic model."""
+    schema = {
+        "$defs": {model.__name__: model.model_json_schema()},
+        "properties": {"input": {"$ref": f"#/$defs/{model.__name__}"}},
+        "required": ["input"],
+        "type": "object",
+    }
+    return SimpleNamespace(name=name, description=f"{name} tool", inputSchema=schema)
+
+
+def flat_tool(name, properties):
+    return SimpleNamespace(name=name, description="", inputSchema={"properties": properties, "type": "object"})
+
+
+def test_wrapped_schema_binds_under_input():
+    binder = ToolBinder(wrapped_tool("add", AddInput))
+    assert binder.wrapped
+    assert binder.signature == "add(integer, integer)"
+    assert binder.bind([2, 3]) == {"input": {"a": 2, "b": 3}}
+
+
+def test_integer_coercion():
+    binder = ToolBinder(wrapped_tool("add", AddInput))
+    assert binder.bind(["4", 5.0]) == {"input": {"a": 4, "b": 5}}
+    # Values that are not whole numbers are passed through for the server to reject
+    assert binder.bind([2.5, "seven"]) == {"input": {"a": 2.5, "b": "seven"}}
+    assert binder.bind([True, 1]) == {"input": {"a": True, "b": 1}}
+
+
+def test_number_string_and_json_coercion():
+    binder = ToolBinder(flat_tool("mixed", {
+        "x": {"type": "number"},
+        "label": {"type": "string"},
+        "items": {"type": "array"},
+        "options": {"type": "object"},
+        "anything": {},
+    }))
+    assert not binder.wrapped
+    assert binder.bind([" 1.5 ", 42, "[1, 2]", '{"k": 1}', "raw"]) == {
+        "x": 1.5, "label": "42", "items": [1, 2], "options": {"k": 1}, "anything": "raw",
+    }
+    # Already-typed and unparseable values are left alone
+    assert binder.bind([2, "text", [3], "not json", None]) == {
+        "x": 2, "label": "text", "items": [3], "options": "not json", "anything": None,
+    }
+
+
+def test_string_argument_of_wrapped_model():
+    binder = ToolBinder(wrapped_tool("strings_to_chars_to_int", StringsToIntsInput))
+    assert binder.arg_types == ("string",)
+    assert binder.bind([123]) == {"input": {"string": "123"}}
+
+
+def test_wrong_arity_raises():
+    binder = ToolBinder(wrapped_tool("add", AddInput))
+    with pytest.raises(ValueError, match="add expects 2 args, got 1"):
+        binder.bind([1])
+
+
+def test_unwrap_prefers_result_field():
+    def result(text):
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+    assert ToolBinder.unwrap(result('{"result": 7}')) == 7
+    assert ToolBinder.unwrap(result('{"only": [1, 2]}')) == [1, 2]
+    assert ToolBinder.unwrap(result('{"a": 1, "b": 2}')) == {"a": 1, "b": 2}
+    assert ToolBinder.unwrap(result("3.5")) == 3.5
+    plain = result("not json")
+    assert ToolBinder.unwrap(plain) is plain
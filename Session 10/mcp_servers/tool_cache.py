@@ -0,0 +1,283 @@
+import os
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from mcp.types import CallToolResult, Tool
+
+SCHEMA_CACHE_FILE = Path(__file__).parent / "tool_schema_cache.json"
+RESULT_CACHE_MAX_ENTRIES = 1024
+
+
+def _local_imports(script_path: Path) -> List[Path]:
+    """Sibling modules imported by a server script (e.g. models.py), which also shape its schemas."""
+    try:
+        tree = ast.parse(script_path.read_text(encoding="utf-8"))
+    except (OSError, SyntaxError, UnicodeDecodeError):
+        return []
+
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+
+    candidates = (script_path.parent / f"{name}.py" for name in sorted(names))
+    return [path for path in candidates if path.exists()]
+
+
+def server_fingerprint(config: dict) -> Optional[str]:
+    """sha256 over the server script and the local modules it imports; None if the script is missing."""
+    cwd = Path(config.get("cwd", os.getcwd()))
+    script_path = cwd / config["script"]
+    if not script_path.exists():
+        return None
+
+    digest = hashlib.sha256()
+    for path in [script_path, *_local_imports(script_path)]:
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _file_stamp(path: Path) -> str:
+    try:
+        stat = path.stat()
+    except OSError:
+        return "missing"
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def dependency_stamp(rule: str, arguments: dict, cwd: Optional[str] = None) -> str:
+    """
+    Version of what a tool result depends on besides its arguments, from a
+    `cache_depends_on` rule: "arg:<name>" is the file named by that argument,
+    "file:<path>" a fixed file; relative paths resolve against the server's cwd.
+    Files are stamped by mtime and size, so editing the file (or re-indexing,
+    which replaces index.bin) makes earlier cached results unreachable.
+    """
+    kind, _, value = rule.partition(":")
+    if kind == "arg":
+        wrapped = arguments.get("input")  # pydantic-model tools take {"input": {...}}
+        value = (wrapped if isinstance(wrapped, dict) else arguments).get(value)
+        if not isinstance(value, str):
+            return "none"
+    elif kind != "file":
+        raise ValueError(f"Unknown cache_depends_on rule '{rule}' (expected arg:<name> or file:<path>)")
+    return _file_stamp(Path(cwd or os.getcwd()) / value)
+
+
+def _result_values(result: Any) -> List[Any]:
+    """A result's payload one level down: JSON objects give their values, lists their items."""
+    values = []
+    for item in getattr(result, "content", None) or []:
+        text = getattr(item, "text", None)
+        if text is None:
+            values.append(item)  # images and other non-text content
+            continue
+        try:
+            value = json.loads(text)
+        except ValueError:
+            value = text
+        if isinstance(value, dict):
+            values.extend(value.values())
+        elif isinstance(value, list):
+            values.extend(value)
+        else:
+            values.append(value)
+    return values
+
+
+def is_failure(result: Any, rules: List[str]) -> bool:
+    """
+    True if a tool result is a failure reported as a normal result, per its
+    `cache_skip_if` rules: "empty" matches a result with no content (e.g. `[]`),
+    "prefix:<text>" one whose text, or any field or item of it, starts with <text>.
+    """
+    values = _result_values(result)
+    for rule in rules:
+        kind, _, value = rule.partition(":")
+        if kind == "empty":
+            if not any(v.strip() if isinstance(v, str) else v not in (None, [], {}) for v in values):
+                return True
+        elif kind == "prefix":
+            if any(isinstance(v, str) and v.lstrip().startswith(value) for v in values):
+                return True
+        else:
+            raise ValueError(f"Unknown cache_skip_if rule '{rule}' (expected empty or prefix:<text>)")
+    return False
+
+
+class ToolSchemaCache:
+    """
+    On-disk cache of each server's `list_tools` result.
+
+    Entries are keyed by the server's cwd + script and carry a content hash of
+    the script (and the sibling modules it imports); a changed hash invalidates
+    the entry so the server is rediscovered on the next start.
+    """
+
+    def __init__(self, path: Path = SCHEMA_CACHE_FILE):
+        self.path = Path(path)
+        self.entries = self._load()
+
+    def _load(self) -> dict:
+        if not self.path.exists():
+            return {}
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ Ignoring unreadable tool schema cache {self.path}: {e}")
+            return {}
+
+    @staticmethod
+    def _key(config: dict) -> str:
+        cwd = os.path.abspath(config.get("cwd", os.getcwd()))
+        return f"{cwd}::{config['script']}"
+
+    def get(self, config: dict) -> Optional[List[Any]]:
+        entry = self.entries.get(self._key(config))
+        if not entry:
+            return None
+        if entry.get("hash") != server_fingerprint(config):
+            print(f"♻️ Tool schema cache stale for {config['script']} (source changed)")
+            return None
+        try:
+            return [Tool.model_validate(tool) for tool in entry["tools"]]
+        except Exception as e:
+            print(f"⚠️ Tool schema cache entry for {config['script']} is invalid: {e}")
+            return None
+
+    def put(self, config: dict, tools: List[Any]) -> None:
+        fingerprint = server_fingerprint(config)
+        if fingerprint is None:
+            return
+        self.entries[self._key(config)] = {
+            "server_id": config.get("id"),
+            "hash": fingerprint,
+            "tools": [tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in tools],
+        }
+
+    def save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self.entries, indent=2), encoding="utf-8")
+            tmp_path.replace(self.path)
+        except OSError as e:
+            print(f"⚠️ Could not write tool schema cache {self.path}: {e}")
+
+
+class ToolResultCache:
+    """
+    Memoizes tool results keyed on (tool_name, canonical JSON args), plus a
+    version stamp for tools whose results also depend on a file (see `dependency_stamp`).
+
+    An in-memory LRU tier holds up to `max_entries` results; with `sqlite_path`
+    set, results are also written to a SQLite tier that survives across agent
+    sessions and simulator runs. Every entry carries its tool's TTL (None = never
+    expires). Error results are never cached: those flagged `isError`, and those
+    matching the tool's `skip_if` rules (see `is_failure`) for tools that report
+    failures as ordinary text. Hit/miss counters are kept per tool.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, sqlite_path: Optional[str] = None,
+                 persistent_max_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+        self.persistent_max_entries = persistent_max_entries or max_entries * 10
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            Path(sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tool_results ("
+                "key TEXT PRIMARY KEY, tool TEXT, expires_at REAL, accessed_at REAL, result TEXT)"
+            )
+            self._db.commit()
+
+    @classmethod
+    def from_config(cls, cache_config: Optional[dict]) -> "ToolResultCache":
+        cache_config = cache_config or {}
+        return cls(
+            max_entries=int(cache_config.get("max_entries", RESULT_CACHE_MAX_ENTRIES)),
+            sqlite_path=cache_config.get("sqlite_path"),
+            persistent_max_entries=cache_config.get("persistent_max_entries"),
+        )
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: dict, version: Optional[str] = None) -> str:
+        parts = [tool_name, arguments] if version is None else [tool_name, arguments, version]
+        return json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+
+    def _count(self, tool_name: str, field: str) -> None:
+        tool_stats = self.stats.setdefault(tool_name, {"hits": 0, "misses": 0})
+        tool_stats[field] += 1
+
+    def get(self, tool_name: str, key: str) -> Tuple[bool, Any]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at is None or expires_at > now:
+                self._entries.move_to_end(key)
+                self._count(tool_name, "hits")
+                return True, result
+            del self._entries[key]
+
+        if self._db is not None:
+            row = self._db.execute("SELECT expires_at, result FROM tool_results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                expires_at, payload = row
+                if expires_at is None or expires_at > now:
+                    result = CallToolResult.model_validate_json(payload)
+                    self._db.execute("UPDATE tool_results SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, expires_at, result)
+                    self._count(tool_name, "hits")
+                    return True, result
+                self._db.execute("DELETE FROM tool_results WHERE key = ?", (key,))
+                self._db.commit()
+
+        self._count(tool_name, "misses")
+        return False, None
+
+    def _remember(self, key: str, expires_at: Optional[float], result: Any) -> None:
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, tool_name: str, key: str, result: Any, ttl: Optional[float],
+            skip_if: Optional[List[str]] = None) -> None:
+        if getattr(result, "isError", False) or (skip_if and is_failure(result, skip_if)):
+            return
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        self._remember(key, expires_at, result)
+
+        if self._db is not None and isinstance(result, CallToolResult):
+            self._db.execute(
+                "INSERT OR REPLACE INTO tool_results (key, tool, expires_at, accessed_at, result) VALUES (?, ?, ?, ?, ?)",
+                (key, tool_name, expires_at, now, result.model_dump_json(by_alias=True)),
+            )
+            # Keep the persistent tier bounded too: drop least recently used rows
+            self._db.execute(
+                "DELETE FROM tool_results WHERE key IN ("
+                "SELECT key FROM tool_results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.persistent_max_entries,),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
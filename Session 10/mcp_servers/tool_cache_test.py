@@ -0,0 +1,76 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+from mcp.types import CallToolResult, TextContent
+
+from tool_cache import ToolResultCache, is_failure
+
+CONFIG = Path(__file__).parent.parent / "config" / "mcp_server_config.yaml"
+
+
+def skip_rules(tool_name):
+    for server in yaml.safe_load(CONFIG.read_text())["mcp_servers"]:
+        rules = (server.get("cache_skip_if") or {}).get(tool_name)
+        if rules:
+            return rules
+    return None
+
+
+def result(*texts):
+    return CallToolResult(content=[TextContent(type="text", text=text) for text in texts])
+
+
+def output(**fields):
+    """A pydantic-model tool result as FastMCP serialises it."""
+    return result(json.dumps(fields))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ToolResultCache(sqlite_path=str(tmp_path / "results.sqlite"))
+    yield cache
+    cache.close()
+
+
+@pytest.mark.parametrize("tool_name, failed", [
+    ("duckduckgo_search_results", output(result="No results were found for your search query. This could be...")),
+    ("duckduckgo_search_results", result("An error occurred while searching: boom")),
+    ("duckduckgo_search_results", result()),
+    ("download_raw_html_from_url", output(result="Error: The request timed out while trying to fetch the webpage.")),
+    ("search_stored_documents_rag", result("ERROR: Failed to search: index missing")),
+    ("convert_webpage_url_into_markdown", output(markdown="Failed to download the webpage.")),
+])
+def test_failures_reported_as_results_are_not_cached(cache, tmp_path, tool_name, failed):
+    key = ToolResultCache.make_key(tool_name, {"input": {"query": "x"}})
+    cache.put(tool_name, key, failed, ttl=900, skip_if=skip_rules(tool_name))
+    assert cache.get(tool_name, key) == (False, None)
+
+    reopened = ToolResultCache(sqlite_path=str(tmp_path / "results.sqlite"))
+    assert reopened.get(tool_name, key) == (False, None)  # nothing reached the persistent tier either
+    reopened.close()
+
+
+def test_successful_websearch_is_cached(cache):
+    key = ToolResultCache.make_key("duckduckgo_search_results", {"input": {"query": "x"}})
+    found = output(result="Found 1 search results:\n\n1. Title\n   URL: https://example.com")
+    cache.put("duckduckgo_search_results", key, found, ttl=900, skip_if=skip_rules("duckduckgo_search_results"))
+    assert cache.get("duckduckgo_search_results", key) == (True, found)
+
+
+def test_error_flag_is_never_cached(cache):
+    key = ToolResultCache.make_key("add", {"a": 1})
+    cache.put("add", key, CallToolResult(content=[], isError=True), ttl=None)
+    assert cache.get("add", key) == (False, None)
+
+
+def test_is_failure_rules():
+    assert is_failure(result(), ["empty"])
+    assert is_failure(result("[]"), ["empty"])
+    assert is_failure(output(result="  "), ["empty"])
+    assert not is_failure(result("0"), ["empty"])
+    assert is_failure(result("fine", "Error: second item"), ["prefix:Error:"])
+    assert not is_failure(output(result="No Error: here"), ["prefix:Error:"])
+    with pytest.raises(ValueError, match="Unknown cache_skip_if rule"):
+        is_failure(result("x"), ["regex:.*"])
@@ -0,0 +1,132 @@
+"""
+Lightweight span tracing shared by the agent process and the MCP servers.
+
+Spans nest through a ContextVar (so concurrent asyncio sessions keep separate
+stacks) and are appended as one JSON line each to TRACE_FILE. Tracing is off
+unless TRACE_FILE is set, either in the environment or via `configure()`; the
+agent forwards it to the server processes it spawns. The servers import this
+module as a sibling (`import tracing`), like `models`.
+"""
+import os
+import json
+import time
+import uuid
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+TRACE_ENV = "TRACE_FILE"
+DEFAULT_TRACE_FILE = "traces/spans.jsonl"
+SERVICE_NAME = os.getenv("TRACE_SERVICE", "agent")
+
+_current: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+
+
+def trace_file() -> Optional[str]:
+    return os.getenv(TRACE_ENV) or None
+
+
+def enabled() -> bool:
+    return trace_file() is not None
+
+
+def configure(path: str = DEFAULT_TRACE_FILE, service: Optional[str] = None) -> str:
+    """Turn tracing on for this process (and the servers it spawns afterwards)."""
+    global SERVICE_NAME
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.environ[TRACE_ENV] = path
+    if service:
+        SERVICE_NAME = service
+    return path
+
+
+def _write(record: Dict[str, Any]) -> None:
+    path = trace_file()
+    if not path:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    with _write_lock:
+        # One short O_APPEND write per span, so lines from several processes do not interleave
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+@contextmanager
+def span(name: str, **attrs: Any):
+    """Time a block as a child of the current span. Yields the span dict (attrs can be added)."""
+    if not enabled():
+        yield {"attrs": attrs}
+        return
+
+    parent = _current.get()
+    record = {
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "service": SERVICE_NAME,
+        "pid": os.getpid(),
+        "start": time.time(),
+        "attrs": attrs,
+    }
+    token = _current.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration_ms"] = 1000 * (time.perf_counter() - started)
+        _current.reset(token)
+        _write(record)
+
+
+def annotate(**attrs: Any) -> None:
+    """Add attributes to the current span (e.g. a session id only known mid-way)."""
+    current = _current.get()
+    if current is not None:
+        current["attrs"].update(attrs)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator form of span() for sync and async functions."""
+    def decorate(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace_tools(mcp: Any) -> None:
+    """
+    Make every tool registered on a FastMCP server afterwards emit a `tool:<name>` span.
+    functools.wraps keeps the signature FastMCP builds the tool schema from.
+    """
+    register = mcp.tool
+
+    def tool(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def wrap(fn: Callable) -> Callable:
+            decorator(traced(f"tool:{fn.__name__}")(fn))
+            return fn
+        return wrap
+
+    mcp.tool = tool
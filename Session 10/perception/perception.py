@@ -1,24 +1,36 @@
 import os
 import json
+import asyncio
 import uuid
 import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 from google import genai
 from google.genai.errors import ServerError
+from agent.prompt_loader import PromptTemplate, StageTimer
+from agent.context_cache import PrefixCache
+from mcp_servers import tracing
 
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 client = genai.Client(api_key=api_key)
 
+LLM_TIMEOUT = 60  # seconds before an async perception call is cancelled
+
 class Perception:
-    def __init__(self, perception_prompt_path: str, api_key: str | None = None, model: str = "gemini-2.0-flash"):
+    def __init__(self, perception_prompt_path: str, api_key: str | None = None, model: str = "gemini-2.0-flash",
+                 timeout: float = LLM_TIMEOUT):
         load_dotenv()
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found in environment or explicitly provided.")
         self.client = genai.Client(api_key=self.api_key)
         self.perception_prompt_path = perception_prompt_path
+        self.prompt_template = PromptTemplate(perception_prompt_path)
+        self.prompt_timer = StageTimer()
+        self.model = model
+        self.timeout = timeout
+        self.prefix_cache = PrefixCache(self.client, model)  # prefix_cache.usage: tokens sent vs cached
 
     def build_perception_input(self, raw_input: str, memory: list, current_plan = "", snapshot_type: str = "user_query") -> dict:
         if memory:
@@ -44,29 +56,65 @@ class Perception:
             "current_plan" : current_plan or "Inain Query Mode, plan not created"
         }
     
+    def build_prompt_parts(self, perception_input: dict) -> tuple[str, str]:
+        """(static prefix, per-call tail): the template comes first so the provider can cache it."""
+        with self.prompt_timer.measure("template"):
+            prompt_template = self.prompt_template.text
+        with self.prompt_timer.measure("input_json"):
+            input_json = json.dumps(perception_input, indent=2)
+        return prompt_template, f"\n\n```json\n{input_json}\n```"
+
+    def build_prompt(self, perception_input: dict) -> str:
+        return "".join(self.build_prompt_parts(perception_input))
+
+    @staticmethod
+    def _unavailable(reason: str, error: Exception) -> dict:
+        """A PerceptionSnapshot-shaped result for a failed call (goal not achieved, so Decision still plans)."""
+        return {
+            "entities": [],
+            "result_requirement": "N/A",
+            "original_goal_achieved": False,
+            "reasoning": f"Perception model {reason}.",
+            "local_goal_achieved": False,
+            "local_reasoning": f"Perception unavailable: {str(error) or type(error).__name__}",
+            "last_tooluse_summary": "None",
+            "solution_summary": "Not ready yet",
+            "confidence": "0.0"
+        }
+
+    @tracing.traced("Perception.run")
     def run(self, perception_input: dict) -> dict:
-        """Run perception on given input using the specified prompt file."""
-        prompt_template = Path(self.perception_prompt_path).read_text(encoding="utf-8")
-        full_prompt = f"{prompt_template.strip()}\n\n```json\n{json.dumps(perception_input, indent=2)}\n```"
+        """Run perception on given input using the specified prompt file (blocking)."""
+        with tracing.span("perception.prompt_build"):
+            prefix, tail = self.build_prompt_parts(perception_input)
 
         try:
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=full_prompt
-            )
+            response = self.prefix_cache.generate(prefix, tail)
         except ServerError as e:
             print(f"🚫 Perception LLM ServerError: {e}")
-            return {
-                "step_index": 0,
-                "description": "Perception model unavailable: server overload.",
-                "type": "NOP",
-                "code": "",
-                "conclusion": "",
-                "plan_text": ["Step 0: Perception model returned a 503. Exiting to avoid loop."],
-                "raw_text": str(e)
-            }
+            return self._unavailable("returned a 503", e)
+
+        return self.parse_response(response)
 
-        raw_text = response.text.strip()
+    @tracing.traced("Perception.run")
+    async def run_async(self, perception_input: dict) -> dict:
+        """Same as run(), but awaits the SDK's async client so the event loop keeps serving other sessions."""
+        with tracing.span("perception.prompt_build"):
+            prefix, tail = self.build_prompt_parts(perception_input)
+
+        try:
+            response = await self.prefix_cache.generate_async(prefix, tail, timeout=self.timeout)
+        except ServerError as e:
+            print(f"🚫 Perception LLM ServerError: {e}")
+            return self._unavailable("returned a 503", e)
+        except asyncio.TimeoutError as e:
+            print(f"⏱️ Perception LLM call timed out after {self.timeout}s")
+            return self._unavailable(f"timed out after {self.timeout}s", e)
+
+        return self.parse_response(response)
+
+    def parse_response(self, response) -> dict:
+        raw_text = (response.text or "").strip()
 
         try:
             json_block = raw_text.split("```json")[1].split("```")[0].strip()
@@ -93,10 +141,8 @@ class Perception:
             return output
 
         except Exception as e:
-            # Optional: log to disk for inspection
-            import pdb; pdb.set_trace()
-
-            print("❌ EXCEPTION IN PERCEPTION:", e)
+            # Never stop here: sessions share one event loop, so a breakpoint would freeze them all
+            print(f"❌ EXCEPTION IN PERCEPTION: {e}\n   Raw model output (first 500 chars): {raw_text[:500]!r}")
             return {
                 "entities": [],
                 "result_requirement": "N/A",
@@ -104,6 +150,7 @@ class Perception:
                 "reasoning": "Perception failed to parse model output as JSON.",
                 "local_goal_achieved": False,
                 "local_reasoning": "Could not extract structured information.",
+                "last_tooluse_summary": "None",
                 "solution_summary": "Not ready yet",
                 "confidence": "0.0"
             }
@@ -6,21 +6,26 @@ import re
 import os
 import sys
 from pathlib import Path
-from agent.agent_loop2 import AgentLoop  # Adjust import as needed
+from agent.agent_service import AgentService
+from agent import rate_limit
 from mcp_servers.multiMCP import MultiMCP
+from mcp_servers import tracing
 from agent.agentSession import AgentSession
 from agent.hitl_request import HITLRequest
 
 # Import the global tool_stats from your tool execution module
 from action.executor import tool_stats, extract_data_from_chunk
+from action.histogram import LatencyHistogram
 
 # CONFIG
 QUERY_FILE = "queries.csv"
 TOOL_LOG_FILE = "tool_performance_log.csv"
 QUERY_RESULT_FILE = "query_results.csv"
 SUMMARY_FILE = "simulation_summary.csv"
-SLEEP_SECONDS = 30  # Safe for Google APIs; adjust as needed
-AUTO_HITL = True  # Set to True to handle common failures automatically
+SLEEP_SECONDS = 30  # Safe for Google APIs; adjust as needed (serial mode only)
+PARALLEL_WORKERS = 4  # Queries in flight at once; 1 = original serial run with SLEEP_SECONDS between queries
+LLM_RATE_LIMITS = {"gemini": (15, 3), "ollama": (600, 8)}  # provider -> (requests per minute, burst); paces parallel runs
+AUTO_HITL = True  # Set to True to handle common failures automatically (always on in parallel mode)
 MAX_AUTO_HITL_ATTEMPTS = 2  # Maximum number of auto HITL attempts before asking user
 MAX_QUERIES = None  # How many queries to run (set to None for all)
 START_INDEX = 0  # Where to start in the query list
@@ -92,12 +97,23 @@ def load_queries(filename):
         reader = csv.DictReader(f)
         return list(reader)
 
-def save_tool_stats(filename, stats):
+def save_tool_stats(filename, stats, cache_stats=None):
+    cache_stats = cache_stats or {}
     with open(filename, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        writer.writerow(["Tool Name", "Calls", "Success", "Failure"])
+        writer.writerow(["Tool Name", "Calls", "Success", "Failure", "Cache Hits", "Cache Misses",
+                         "p50 ms", "p95 ms", "p99 ms", "Mean ms", "Max ms",
+                         "Queue Wait Mean ms", "Queue Wait p95 ms", "Server Mean ms", "Server p95 ms",
+                         "Parse Mean ms", "Bytes Returned", "Mean Bytes"])
         for tool, data in stats.items():
-            writer.writerow([tool, data["calls"], data["success"], data["fail"]])
+            cached = cache_stats.get(tool, {})
+            latency = data["latency"].summary_ms()
+            queue, server, parse = (data[stage].summary_ms() for stage in ("queue_wait", "server", "parse"))
+            writer.writerow([tool, data["calls"], data["success"], data["fail"],
+                             cached.get("hits", 0), cached.get("misses", 0),
+                             *(f"{latency[key]:.2f}" for key in ("p50", "p95", "p99", "mean", "max")),
+                             f"{queue['mean']:.2f}", f"{queue['p95']:.2f}", f"{server['mean']:.2f}", f"{server['p95']:.2f}",
+                             f"{parse['mean']:.3f}", data["bytes"], data["bytes"] // max(1, data["calls"])])
 
 def save_query_result(filename, query, plan, result):
     # Check if file exists to write header
@@ -118,7 +134,13 @@ def save_simulation_summary(filename, summary_data):
     Save summary statistics about the simulation run
     """
     headers = ["Total Queries", "Successful", "Failed", "HITL Required", 
-              "Auto-HITL Used", "User-HITL Used", "Most Common Error", "Avg Time Per Query"]
+              "Auto-HITL Used", "User-HITL Used", "Most Common Error", "Avg Time Per Query",
+              "Tool Calls", "Tool p50 ms", "Tool p95 ms", "Tool p99 ms", "Tool Mean ms", "Tool Max ms",
+              "Queue Wait Mean ms", "Server Mean ms", "Parse Mean ms", "Tool Bytes Returned"]
+    latency = LatencyHistogram.merged(data["latency"] for data in tool_stats.values())
+    stage_means = {stage: LatencyHistogram.merged(data[stage] for data in tool_stats.values()).summary_ms()["mean"]
+                   for stage in ("queue_wait", "server", "parse")}
+    latency_ms = latency.summary_ms()
     
     with open(filename, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
@@ -131,9 +153,25 @@ def save_simulation_summary(filename, summary_data):
             summary_data.get("auto_hitl_used", 0),
             summary_data.get("user_hitl_used", 0),
             summary_data.get("most_common_error", "N/A"),
-            summary_data.get("avg_time", "N/A")
+            summary_data.get("avg_time", "N/A"),
+            latency.count,
+            *(f"{latency_ms[key]:.2f}" for key in ("p50", "p95", "p99", "mean", "max")),
+            *(f"{stage_means[stage]:.2f}" for stage in ("queue_wait", "server", "parse")),
+            sum(data["bytes"] for data in tool_stats.values())
         ])
 
+def print_prompt_timings(agent):
+    """Per-stage prompt assembly cost and prompt-token caching, to confirm the caches pay off."""
+    print("\nPrompt assembly timings:")
+    for owner, timer in (("Perception", agent.perception.prompt_timer), ("Decision", agent.decision.prompt_timer)):
+        for stage, stats in timer.summary().items():
+            print(f"  {owner:<10} {stage:<13} {stats['count']:>5} calls  mean {stats['mean_ms']:.3f} ms  total {stats['total_ms']:.1f} ms")
+    print("LLM prompt tokens (sent vs served from the context cache):")
+    for owner, component in (("Perception", agent.perception), ("Decision", agent.decision)):
+        usage = component.prefix_cache.usage.summary()
+        print(f"  {owner:<10} {usage['calls']:>5} calls  {usage['prompt_tokens']:>8} prompt tokens  "
+              f"{usage['cached_tokens']:>8} cached ({usage['cached_ratio']:.0%})")
+
 def auto_hitl_response(hitl_request, query):
     """
     Automatically generate HITL responses for common issues
@@ -283,6 +321,154 @@ def clear_previous_results():
             except Exception as e:
                 print(f"Error clearing {file}: {e}")
 
+class SimulationExit(Exception):
+    """The user typed exit/quit at a HITL prompt."""
+
+
+class OrderedResultWriter:
+    """
+    Appends query results to the CSV in query order while queries finish out of order.
+
+    Finished rows wait in a reorder buffer until every earlier query has been written,
+    so the file is always a complete, ordered prefix of the run; the lock keeps
+    concurrent completions from interleaving rows.
+    """
+
+    def __init__(self, filename, indices):
+        self.filename = filename
+        self.order = list(indices)
+        self.position = 0
+        self.pending = {}
+        self.lock = asyncio.Lock()
+
+    async def add(self, index, query, plan, result):
+        async with self.lock:
+            self.pending[index] = (query, plan, result)
+            while self.position < len(self.order) and self.order[self.position] in self.pending:
+                save_query_result(self.filename, *self.pending.pop(self.order[self.position]))
+                self.position += 1
+
+    async def flush(self):
+        """Write whatever is buffered (e.g. when the run is interrupted)."""
+        async with self.lock:
+            for index in sorted(self.pending, key=self.order.index):
+                save_query_result(self.filename, *self.pending[index])
+            self.pending.clear()
+
+
+def record_error(summary_data, error_msg):
+    summary_data["failed"] += 1
+    if error_msg in summary_data["errors"]:
+        summary_data["errors"][error_msg] += 1
+    else:
+        summary_data["errors"][error_msg] = 1
+
+
+async def run_query(i, total, query, service, summary_data, interactive_hitl):
+    """Run one query to completion (including HITL rounds); returns (plan text, result) for the CSV."""
+    query_start_time = time.time()
+    print(f"\n--- Running Query {i+1}/{total}: {query} ---")
+    summary_data["total_queries"] += 1
+
+    hitl_interaction_summary = []
+    auto_hitl_attempts = 0  # Track number of auto HITL attempts for current query
+
+    try:
+        # Run the agent for the query
+        response = await service.submit(query)
+
+        while isinstance(response, HITLRequest):
+            # Agent requires Human-In-The-Loop input
+            summary_data["hitl_required"] += 1
+            print(f"Query {i+1} triggered HITL: {response.prompt_to_user}")
+
+            # Log the agent's request
+            hitl_interaction_summary.append(f"Agent Prompt ({response.type}): {response.prompt_to_user}")
+
+            # Check if we should use AUTO_HITL or ask user
+            if (AUTO_HITL or not interactive_hitl) and auto_hitl_attempts < MAX_AUTO_HITL_ATTEMPTS:
+                # Generate automatic response
+                user_hitl_response = auto_hitl_response(response, query)
+                summary_data["auto_hitl_used"] += 1
+                auto_hitl_attempts += 1
+                print(f"🤖 Auto HITL Attempt {auto_hitl_attempts}/{MAX_AUTO_HITL_ATTEMPTS}: {user_hitl_response}")
+            elif not interactive_hitl:
+                # Parallel runs never block on input(): give up on this query instead
+                service.abandon(response.session_id)
+                print(f"⚠️ Query {i+1}: auto HITL max attempts reached ({auto_hitl_attempts}); marking as failed.")
+                record_error(summary_data, "HITL unresolved after auto attempts")
+                plan = "\n".join(hitl_interaction_summary) + "\n-- Unresolved: auto HITL attempts exhausted --"
+                return plan, "HITL unresolved after auto attempts"
+            else:
+                # Ask the user for input
+                if AUTO_HITL:
+                    print(f"⚠️ Auto HITL max attempts reached ({auto_hitl_attempts}). Asking for user input.")
+                user_hitl_response = (await asyncio.to_thread(input, "🔵 Your Input for HITL: ")).strip()
+                summary_data["user_hitl_used"] += 1
+                auto_hitl_attempts = 0  # Reset auto attempts after user input
+
+                if user_hitl_response.lower() in {"exit", "quit"}:
+                    service.abandon(response.session_id)
+                    partial_plan = "\n".join(hitl_interaction_summary) + "\n-- Simulation interrupted --"
+                    raise SimulationExit(query, partial_plan)
+
+            # Log the user's response
+            hitl_interaction_summary.append(f"User Input: {user_hitl_response}")
+            previous = (response.type, response.prompt_to_user)
+            response = await service.resume(response.session_id, user_hitl_response)
+            if not isinstance(response, HITLRequest) or (response.type, response.prompt_to_user) != previous:
+                # Reset counter on successful step; asking the same thing again is not progress,
+                # so unattended runs still give up after MAX_AUTO_HITL_ATTEMPTS identical requests
+                auto_hitl_attempts = 0
+
+        # Check the response type
+        if isinstance(response, AgentSession):
+            # Agent completed the task (either directly or after HITL)
+            final_answer = response.state.get("final_answer", "N/A")
+
+            # --- Construct the detailed plan text for CSV ---
+            plan_details = []
+            if hitl_interaction_summary:
+                 plan_details.append("--- Human-In-The-Loop Interaction(s) ---")
+                 plan_details.extend(hitl_interaction_summary)
+                 plan_details.append("-------------------------------------")
+                 plan_details.append("Final Agent Outcome:")
+
+            if response.plan_versions:
+                 # If there's a final plan after all interactions, include it
+                 plan_details.append("Final Plan:")
+                 plan_details.extend(response.plan_versions[-1]["plan_text"])
+            elif response.state.get("original_goal_achieved") and response.perception:
+                 # If the goal was achieved by initial perception and no plan was needed/generated
+                 if not hitl_interaction_summary: # Only add if no HITL occurred first
+                      plan_details.append("Answered by initial perception/memory")
+                 else: # If HITL occurred, but perception somehow finalized it after that
+                      plan_details.append("Answer finalized by perception after HITL")
+                      plan_details.append(f"Perception Reasoning: {response.perception.reasoning}")
+            elif not hitl_interaction_summary:
+                 # Fallback for scenarios with no HITL, no plan, and no perception answer
+                 plan_details.append("N/A (No explicit plan or initial perception answer)")
+
+            # --- End of plan text construction ---
+            print(f"Query {i+1} completed in {time.time() - query_start_time:.2f} seconds.")
+            summary_data["successful"] += 1
+            return "\n".join(plan_details), final_answer
+
+        print(f"Query {i+1} returned unexpected response type: {type(response)}")
+        record_error(summary_data, f"Unexpected response type: {type(response)}")
+        return "Unexpected Response Type", str(response)
+
+    except SimulationExit:
+        raise
+    except Exception as e:
+        print(f"🚨 Error running query {i+1}: {e}")
+        error_msg = str(e)
+        record_error(summary_data, error_msg)
+        # Log the error and any preceding HITL summary
+        error_plan = "\n".join(hitl_interaction_summary) + f"\n-- Error during execution --\nError: {error_msg}"
+        return error_plan, error_msg
+
+
 async def run_simulator():
     # Initialize tracking metrics
     summary_data = {
@@ -319,6 +505,8 @@ async def run_simulator():
             profile = yaml.safe_load(f)
             mcp_servers_list = profile.get("mcp_servers", [])
             configs = list(mcp_servers_list)
+            tool_cache_config = profile.get("tool_cache")
+            tracing_config = profile.get("tracing") or {}
     except FileNotFoundError:
         print("🚨 Error: mcp_server_config.yaml not found.")
         return
@@ -326,7 +514,11 @@ async def run_simulator():
         print(f"🚨 Error parsing mcp_server_config.yaml: {e}")
         return
 
-    multi_mcp = MultiMCP(server_configs=configs)
+    if tracing_config.get("enabled"):
+        trace_path = tracing.configure(tracing_config.get("file", tracing.DEFAULT_TRACE_FILE))
+        print(f"🧵 Tracing spans to {trace_path}")
+
+    multi_mcp = MultiMCP(server_configs=configs, cache_config=tool_cache_config)
     try:
         await multi_mcp.initialize()
         print("✅ MCP servers initialized successfully")
@@ -363,16 +555,24 @@ async def run_simulator():
             
             print("Created modified prompts to force tool usage")
         
-        loop = AgentLoop(
+        parallel = PARALLEL_WORKERS > 1
+        service = AgentService(
             perception_prompt_path=perception_path,
             decision_prompt_path=decision_path,
             multi_mcp=multi_mcp,
-            strategy="exploratory"
+            strategy="exploratory",
+            max_concurrent=PARALLEL_WORKERS if parallel else 1
         )
     except Exception as e:
-        print(f"🚨 An unexpected error occurred during AgentLoop initialization: {e}")
+        print(f"🚨 An unexpected error occurred during AgentService initialization: {e}")
+        await multi_mcp.shutdown()
         return
 
+    if parallel:
+        # Only the parallel service is paced; serial runs keep their SLEEP_SECONDS gaps unthrottled
+        for provider, (rate_per_minute, burst) in LLM_RATE_LIMITS.items():
+            rate_limit.configure(provider, rate_per_minute, burst)
+
     print("Starting simulation...")
 
     # Configure which queries to run
@@ -386,156 +586,61 @@ async def run_simulator():
         already_processed = get_already_processed_queries()
         print(f"Will skip {len(already_processed.intersection([q['Query'] for q in queries_to_run]))} already processed queries")
 
+    jobs = [
+        (i, query_data["Query"]) for i, query_data in enumerate(queries_to_run)
+        if not (SKIP_COMPLETED and query_data["Query"] in already_processed)
+    ]
     for i, query_data in enumerate(queries_to_run):
-        query = query_data["Query"]
-        
-        # Skip if already processed and SKIP_COMPLETED is True
-        if SKIP_COMPLETED and query in already_processed:
-            print(f"\n--- Skipping Query {i+1}/{len(queries_to_run)}: {query} (already processed) ---")
-            continue
-            
-        query_start_time = time.time()
-        print(f"\n--- Running Query {i+1}/{len(queries_to_run)}: {query} ---")
-        summary_data["total_queries"] += 1
+        if SKIP_COMPLETED and query_data["Query"] in already_processed:
+            print(f"\n--- Skipping Query {i+1}/{len(queries_to_run)}: {query_data['Query']} (already processed) ---")
 
-        current_query_finished = False
-        hitl_input_data = None
-        hitl_input_type = None
-        hitl_interaction_summary = []
-        auto_hitl_attempts = 0  # Track number of auto HITL attempts for current query
-
-        while not current_query_finished:
-            try:
-                # Run the agent loop for the query
-                response = await loop.run(
-                    query=query,
-                    hitl_input_data=hitl_input_data,
-                    hitl_input_type=hitl_input_type
-                )
-
-                # Reset HITL inputs after potentially using them
-                hitl_input_data = None
-                hitl_input_type = None
-                auto_hitl_attempts = 0  # Reset counter on successful step
-
-                # Check the response type
-                if isinstance(response, AgentSession):
-                    # Agent completed the task (either directly or after HITL)
-                    final_answer = response.state.get("final_answer", "N/A")
-
-                    # --- Construct the detailed plan text for CSV ---
-                    plan_details = []
-                    if hitl_interaction_summary:
-                         plan_details.append("--- Human-In-The-Loop Interaction(s) ---")
-                         plan_details.extend(hitl_interaction_summary)
-                         plan_details.append("-------------------------------------")
-                         plan_details.append("Final Agent Outcome:")
-
-                    if response.plan_versions:
-                         # If there's a final plan after all interactions, include it
-                         plan_details.append("Final Plan:")
-                         plan_details.extend(response.plan_versions[-1]["plan_text"])
-                    elif response.state.get("original_goal_achieved") and response.perception:
-                         # If the goal was achieved by initial perception and no plan was needed/generated
-                         if not hitl_interaction_summary: # Only add if no HITL occurred first
-                              plan_details.append("Answered by initial perception/memory")
-                         else: # If HITL occurred, but perception somehow finalized it after that
-                              plan_details.append("Answer finalized by perception after HITL")
-                              plan_details.append(f"Perception Reasoning: {response.perception.reasoning}")
-                    elif not hitl_interaction_summary:
-                         # Fallback for scenarios with no HITL, no plan, and no perception answer
-                         plan_details.append("N/A (No explicit plan or initial perception answer)")
-
-                    final_plan_text = "\n".join(plan_details)
-                    # --- End of plan text construction ---
-
-                    save_query_result(QUERY_RESULT_FILE, query, final_plan_text, final_answer)
-                    print(f"Query {i+1} completed in {time.time() - query_start_time:.2f} seconds. Result logged.")
-                    current_query_finished = True # This query is done
-                    summary_data["successful"] += 1
-
-                elif isinstance(response, HITLRequest):
-                    # Agent requires Human-In-The-Loop input
-                    summary_data["hitl_required"] += 1
-                    print(f"Query {i+1} triggered HITL: {response.prompt_to_user}")
-
-                    # Log the agent's request
-                    hitl_interaction_summary.append(f"Agent Prompt ({response.type}): {response.prompt_to_user}")
-
-                    # Check if we should use AUTO_HITL or ask user
-                    if AUTO_HITL and auto_hitl_attempts < MAX_AUTO_HITL_ATTEMPTS:
-                        # Generate automatic response
-                        user_hitl_response = auto_hitl_response(response, query)
-                        summary_data["auto_hitl_used"] += 1
-                        auto_hitl_attempts += 1
-                        print(f"🤖 Auto HITL Attempt {auto_hitl_attempts}/{MAX_AUTO_HITL_ATTEMPTS}: {user_hitl_response}")
-                    else:
-                        # Ask the user for input
-                        if AUTO_HITL and auto_hitl_attempts >= MAX_AUTO_HITL_ATTEMPTS:
-                            print(f"⚠️ Auto HITL max attempts reached ({auto_hitl_attempts}). Asking for user input.")
-                        user_hitl_response = input("🔵 Your Input for HITL: ").strip()
-                        summary_data["user_hitl_used"] += 1
-                        auto_hitl_attempts = 0  # Reset auto attempts after user input
-
-                    if user_hitl_response.lower() in {"exit", "quit"}:
-                        print("👋 Exiting simulation due to user input.")
-                        # Log the partial state and exit
-                        partial_plan = "\n".join(hitl_interaction_summary) + "\n-- Simulation interrupted --"
-                        save_query_result(QUERY_RESULT_FILE, query, partial_plan, "Simulation exited by user during HITL")
-                        # Save tool stats before exiting
-                        save_tool_stats(TOOL_LOG_FILE, tool_stats)
-                        
-                        # Calculate final summary stats
-                        summary_data["avg_time"] = f"{(time.time() - summary_data['start_time']) / summary_data['total_queries']:.2f} seconds"
-                        if summary_data["errors"]:
-                            summary_data["most_common_error"] = max(summary_data["errors"].items(), key=lambda x: x[1])[0]
-                        save_simulation_summary(SUMMARY_FILE, summary_data)
-                        return # Exit the entire simulation
-
-                    # Log the user's response
-                    hitl_interaction_summary.append(f"User Input: {user_hitl_response}")
-
-                    # Set the HITL input data and type for the next loop iteration
-                    hitl_input_data = user_hitl_response
-                    hitl_input_type = response.type
-
-                else:
-                    print(f"Query {i+1} returned unexpected response type: {type(response)}")
-                    error_msg = f"Unexpected response type: {type(response)}"
-                    save_query_result(QUERY_RESULT_FILE, query, "Unexpected Response Type", str(response))
-                    current_query_finished = True  # Treat unexpected response as end of query processing
-                    summary_data["failed"] += 1
-                    if error_msg in summary_data["errors"]:
-                        summary_data["errors"][error_msg] += 1
-                    else:
-                        summary_data["errors"][error_msg] = 1
-
-            except Exception as e:
-                print(f"🚨 Error running query {i+1}: {e}")
-                error_msg = str(e)
-                # Log the error and any preceding HITL summary
-                error_plan = "\n".join(hitl_interaction_summary) + f"\n-- Error during execution --\nError: {error_msg}"
-                save_query_result(QUERY_RESULT_FILE, query, error_plan, error_msg)
-                current_query_finished = True  # Treat error as end of query processing
-                summary_data["failed"] += 1
-                if error_msg in summary_data["errors"]:
-                    summary_data["errors"][error_msg] += 1
-                else:
-                    summary_data["errors"][error_msg] = 1
+    writer = OrderedResultWriter(QUERY_RESULT_FILE, [i for i, _ in jobs])
+    await service.start()
 
+    async def run_and_record(i, query):
+        plan, result = await run_query(i, len(queries_to_run), query, service, summary_data, interactive_hitl=not parallel)
+        await writer.add(i, query, plan, result)
         # Save tool stats after each query is fully processed
-        save_tool_stats(TOOL_LOG_FILE, tool_stats)
+        save_tool_stats(TOOL_LOG_FILE, tool_stats, multi_mcp.cache_stats)
 
-        if i < len(queries_to_run) - 1:
-            print(f"Sleeping for {SLEEP_SECONDS} seconds...")
-            time.sleep(SLEEP_SECONDS)
+    try:
+        if parallel:
+            # Every query is queued at once; AgentService runs PARALLEL_WORKERS of them and the
+            # per-provider token buckets pace the LLM calls instead of fixed sleeps.
+            print(f"Running in parallel mode with {PARALLEL_WORKERS} workers")
+            await asyncio.gather(*(run_and_record(i, query) for i, query in jobs))
+        else:
+            for n, (i, query) in enumerate(jobs):
+                await run_and_record(i, query)
+                if n < len(jobs) - 1:
+                    print(f"Sleeping for {SLEEP_SECONDS} seconds...")
+                    await asyncio.sleep(SLEEP_SECONDS)
+    except SimulationExit as e:
+        print("👋 Exiting simulation due to user input.")
+        # Log the partial state and exit
+        await writer.flush()
+        exit_query, partial_plan = e.args
+        save_query_result(QUERY_RESULT_FILE, exit_query, partial_plan, "Simulation exited by user during HITL")
+        # Save tool stats before exiting
+        save_tool_stats(TOOL_LOG_FILE, tool_stats, multi_mcp.cache_stats)
+
+        # Calculate final summary stats
+        summary_data["avg_time"] = f"{(time.time() - summary_data['start_time']) / summary_data['total_queries']:.2f} seconds"
+        if summary_data["errors"]:
+            summary_data["most_common_error"] = max(summary_data["errors"].items(), key=lambda x: x[1])[0]
+        save_simulation_summary(SUMMARY_FILE, summary_data)
+        await service.stop()
+        await multi_mcp.shutdown()
+        return # Exit the entire simulation
 
     # Calculate final summary stats
     total_time = time.time() - summary_data["start_time"]
-    summary_data["avg_time"] = f"{total_time / summary_data['total_queries']:.2f} seconds"
+    summary_data["avg_time"] = f"{total_time / max(1, summary_data['total_queries']):.2f} seconds"
     if summary_data["errors"]:
         summary_data["most_common_error"] = max(summary_data["errors"].items(), key=lambda x: x[1])[0]
     save_simulation_summary(SUMMARY_FILE, summary_data)
+    await service.stop()
+    await multi_mcp.shutdown()
     
     # Clean up temporary prompt files if needed
     if FORCE_TOOL_USE:
@@ -551,6 +656,7 @@ async def run_simulator():
     print(f"Simulation summary logged to {SUMMARY_FILE}")
     print(f"\nSummary: {summary_data['successful']}/{summary_data['total_queries']} queries successful, {summary_data['hitl_required']} required HITL assistance")
     print(f"Auto-HITL used {summary_data['auto_hitl_used']} times, User-HITL used {summary_data['user_hitl_used']} times")
+    print_prompt_timings(service)
 
 
 if __name__ == "__main__":
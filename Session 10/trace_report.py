@@ -0,0 +1,118 @@
+import json
+import argparse
+from collections import defaultdict
+from pathlib import Path
+
+from mcp_servers.tracing import DEFAULT_TRACE_FILE
+
+BAR_WIDTH = 40
+
+
+def load_spans(path):
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash
+    for s in spans:
+        s["end"] = s["start"] + s.get("duration_ms", 0) / 1000
+        s["children"] = []
+    return spans
+
+
+def build_trees(spans):
+    """Link spans to their parents; server-side tool spans are attached to the call_tool span that covers them."""
+    by_id = {s["span_id"]: s for s in spans}
+    roots = []
+    for s in spans:
+        parent = by_id.get(s.get("parent_id"))
+        if parent is not None:
+            parent["children"].append(s)
+        else:
+            roots.append(s)
+
+    agent_roots = [s for s in roots if s.get("service", "agent") == "agent"]
+    calls = [s for s in spans if s["name"] == "mcp.call_tool"]
+    for server_root in (s for s in roots if s.get("service", "agent") != "agent"):
+        tool = server_root["name"].split(":", 1)[-1]
+        covering = [
+            c for c in calls
+            if c["attrs"].get("tool") == tool and c["start"] <= server_root["start"] and server_root["end"] <= c["end"]
+        ]
+        if covering:
+            # The tightest covering call is the one that issued this request
+            min(covering, key=lambda c: c["end"] - c["start"])["children"].append(server_root)
+
+    for s in spans:
+        s["children"].sort(key=lambda c: c["start"])
+    return agent_roots
+
+
+def self_times(span, totals):
+    child_ms = sum(c.get("duration_ms", 0) for c in span["children"])
+    totals[span["name"]] += max(0.0, span.get("duration_ms", 0) - child_ms)
+    for child in span["children"]:
+        self_times(child, totals)
+
+
+def print_tree(span, scale_ms, depth=0, min_ms=0.0):
+    duration = span.get("duration_ms", 0)
+    if depth and duration < min_ms:
+        return
+    bar = "█" * max(1, round(BAR_WIDTH * duration / scale_ms)) if scale_ms else ""
+    label = span["name"]
+    if span.get("service", "agent") != "agent":
+        label += f"  [{span['service']}]"
+    if span.get("error"):
+        label += "  ❌"
+    print(f"  {'  ' * depth}{label:<{48 - 2 * depth}} {duration / 1000:>8.3f}s {bar}")
+    for child in span["children"]:
+        print_tree(child, scale_ms, depth + 1, min_ms)
+
+
+def report(path, session_prefix=None, min_ms=1.0, top=10):
+    roots = build_trees(load_spans(path))
+    sessions = defaultdict(list)
+    for root in roots:
+        sessions[root["attrs"].get("session_id", root["trace_id"])].append(root)
+
+    for session_id, turns in sessions.items():
+        if session_prefix and not session_id.startswith(session_prefix):
+            continue
+        turns.sort(key=lambda t: t["start"])
+        total_ms = sum(t.get("duration_ms", 0) for t in turns)
+        query = next((t["attrs"]["query"] for t in turns if t["attrs"].get("query")), "")
+        print(f"\n── Session {session_id} ── {len(turns)} turn(s), {total_ms / 1000:.2f}s")
+        if query:
+            print(f"  Query: {query}")
+
+        scale_ms = max(t.get("duration_ms", 0) for t in turns)
+        for turn in turns:
+            print_tree(turn, scale_ms, min_ms=min_ms)
+
+        totals = defaultdict(float)
+        for turn in turns:
+            self_times(turn, totals)
+        print("  Self time by span:")
+        for name, ms in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+            share = ms / total_ms if total_ms else 0
+            print(f"    {name:<40} {ms / 1000:>8.3f}s  {share:>5.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flame-style summary of agent traces per session")
+    parser.add_argument("file", nargs="?", default=DEFAULT_TRACE_FILE, help="spans JSONL file")
+    parser.add_argument("--session", help="only sessions whose id starts with this")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="hide nested spans shorter than this")
+    parser.add_argument("--top", type=int, default=10, help="rows in the self-time table")
+    args = parser.parse_args()
+
+    if not Path(args.file).exists():
+        print(f"🚨 No trace file at {args.file}. Enable tracing in config/mcp_server_config.yaml (tracing.enabled).")
+    else:
+        report(args.file, args.session, args.min_ms, args.top)